@@ -0,0 +1,467 @@
+# Project files
+from GlobalAudioVariables import *
+
+# General Python imports
+import os
+import time
+import threading
+import numpy as np
+import soundfile
+
+# Global variables
+# Status flags given to stream callbacks. Values are the same as PortAudio's paInputUnderflow, paInputOverflow, paOutputUnderflow, paOutputOverflow and paPrimingOutput.
+input_underflow = 1
+input_overflow = 2
+output_underflow = 4
+output_overflow = 8
+priming_output = 16
+
+# Hardware backends in the order they are preferred when their latencies are equal
+hardware_backend_names = ['pyaudio', 'sounddevice']
+
+# Environment variable which overrides 'audio_backend' from GlobalAudioVariables.py, for example DAW_AUDIO_BACKEND=null on machines without sound hardware
+backend_environment_variable = 'DAW_AUDIO_BACKEND'
+
+# Environment variables which override 'audio_output_file' and 'audio_input_file' of the file backend, for example
+# DAW_AUDIO_BACKEND=file DAW_AUDIO_OUTPUT_FILE=output.wav
+output_file_environment_variable = 'DAW_AUDIO_OUTPUT_FILE'
+input_file_environment_variable = 'DAW_AUDIO_INPUT_FILE'
+
+
+############################### Stream callbacks ###############################
+# All backends call output stream callbacks the same way:
+#   callback(frame_count, time_info, status) -> float32 array of shape (frame_count, channels)
+# time_info is a dictionary with 'current_time' and 'output_buffer_dac_time' in seconds, like PyAudio's time_info, and status is a combination
+# of the flags above. Streams always continue, a stopped Transport outputs silence instead of ending the stream.
+
+
+class AudioBackend:
+
+    ########################################### Brief description ###########################################
+    # AudioBackend is the base class for the audio devices the program can use. A backend opens output
+    # streams which call the engine's callback and input streams from which Tracks read recorded buffers.
+    # Backends are created with create_audio_backend. There are backends for PyAudio and sounddevice, a
+    # null device which pulls blocks as fast as possible and a file device which writes the output to a
+    # file and reads the input from a file, so the program and benchmarks can run without sound hardware.
+    #########################################################################################################
+
+    name = ''
+
+    def __init__(self, *args, **kwargs):
+        super(AudioBackend, self).__init__(*args, **kwargs)
+
+    def open_output_stream(self, callback, channels, fs, frames_per_buffer, *args, **kwargs):
+        # Return a stream with start_stream(), stop_stream() and close()
+        raise NotImplementedError
+
+    def open_input_stream(self, channels, fs, frames_per_buffer, *args, **kwargs):
+        # Return a stream with read(frame_count) returning a float32 array of shape (frame_count, channels), stop_stream() and close()
+        raise NotImplementedError
+
+    def output_latency(self, *args, **kwargs):
+        # Lowest output latency of the default device in seconds
+        return 0.0
+
+    def terminate(self, *args, **kwargs):
+        pass
+
+
+############################### PyAudio ###############################
+
+class PyAudioOutputStream:
+
+    ########################################### Brief description ###########################################
+    # PyAudioOutputStream wraps a PyAudio callback stream so the callback can return a NumPy array.
+    #########################################################################################################
+
+    def __init__(self, PyAudio, callback, channels, fs, frames_per_buffer, *args, **kwargs):
+        super(PyAudioOutputStream, self).__init__(*args, **kwargs)
+
+        import pyaudio
+        self.paContinue = pyaudio.paContinue
+        self.callback = callback
+
+        # Open a .Stream object to write the WAV file to 'output = True' indicates that the sound will be played rather than recorded
+        self.stream = PyAudio.open(format=pyaudio.paFloat32,
+                                   channels=channels,
+                                   rate=fs,
+                                   output=True,
+                                   stream_callback=self.pyaudio_callback,
+                                   frames_per_buffer=frames_per_buffer)
+
+    def pyaudio_callback(self, in_data, frame_count, time_info, status):
+        # PyAudio's time_info and status are already in the common format
+        output_buffer = self.callback(frame_count, time_info, status)
+        return (output_buffer.tobytes(), self.paContinue)
+
+    def start_stream(self, *args, **kwargs):
+        self.stream.start_stream()
+
+    def stop_stream(self, *args, **kwargs):
+        self.stream.stop_stream()
+
+    def close(self, *args, **kwargs):
+        self.stream.close()
+
+
+class PyAudioInputStream:
+
+    ########################################### Brief description ###########################################
+    # PyAudioInputStream wraps a blocking PyAudio input stream so read returns a NumPy array.
+    #########################################################################################################
+
+    def __init__(self, PyAudio, channels, fs, frames_per_buffer, *args, **kwargs):
+        super(PyAudioInputStream, self).__init__(*args, **kwargs)
+
+        import pyaudio
+        self.channels = channels
+        self.stream = PyAudio.open(format=pyaudio.paFloat32, channels=channels, rate=fs, input=True, frames_per_buffer=frames_per_buffer)
+
+    def read(self, frame_count, *args, **kwargs):
+        return np.frombuffer(self.stream.read(frame_count), dtype=np.float32).reshape(frame_count, self.channels)
+
+    def stop_stream(self, *args, **kwargs):
+        self.stream.stop_stream()
+
+    def close(self, *args, **kwargs):
+        self.stream.close()
+
+
+class PyAudioBackend(AudioBackend):
+
+    ########################################### Brief description ###########################################
+    # PyAudioBackend uses PortAudio through PyAudio, which was the only way of playing and recording audio
+    # before backends were added.
+    #########################################################################################################
+
+    name = 'pyaudio'
+
+    def __init__(self, *args, **kwargs):
+        super(PyAudioBackend, self).__init__(*args, **kwargs)
+
+        # Imported here so the other backends work without PyAudio installed
+        import pyaudio
+        self.PyAudio = pyaudio.PyAudio()
+
+    def open_output_stream(self, callback, channels, fs, frames_per_buffer, *args, **kwargs):
+        return PyAudioOutputStream(self.PyAudio, callback, channels, fs, frames_per_buffer)
+
+    def open_input_stream(self, channels, fs, frames_per_buffer, *args, **kwargs):
+        return PyAudioInputStream(self.PyAudio, channels, fs, frames_per_buffer)
+
+    def output_latency(self, *args, **kwargs):
+        return float(self.PyAudio.get_default_output_device_info()['defaultLowOutputLatency'])
+
+    def terminate(self, *args, **kwargs):
+        self.PyAudio.terminate()
+
+
+############################### sounddevice ###############################
+
+class SoundDeviceOutputStream:
+
+    ########################################### Brief description ###########################################
+    # SoundDeviceOutputStream wraps a sounddevice.OutputStream and converts its time and status objects to
+    # the common format.
+    #########################################################################################################
+
+    def __init__(self, callback, channels, fs, frames_per_buffer, *args, **kwargs):
+        super(SoundDeviceOutputStream, self).__init__(*args, **kwargs)
+
+        import sounddevice
+        self.callback = callback
+        self.stream = sounddevice.OutputStream(samplerate=fs, blocksize=frames_per_buffer, channels=channels, dtype='float32', callback=self.sounddevice_callback)
+
+    def sounddevice_callback(self, outdata, frames, stream_time, status):
+        time_info = {'current_time': stream_time.currentTime, 'output_buffer_dac_time': stream_time.outputBufferDacTime}
+        flags = (input_underflow*status.input_underflow | input_overflow*status.input_overflow |
+                 output_underflow*status.output_underflow | output_overflow*status.output_overflow | priming_output*status.priming_output)
+        outdata[:] = self.callback(frames, time_info, flags)
+
+    def start_stream(self, *args, **kwargs):
+        self.stream.start()
+
+    def stop_stream(self, *args, **kwargs):
+        self.stream.stop()
+
+    def close(self, *args, **kwargs):
+        self.stream.close()
+
+
+class SoundDeviceInputStream:
+
+    ########################################### Brief description ###########################################
+    # SoundDeviceInputStream is a blocking sounddevice.InputStream.
+    #########################################################################################################
+
+    def __init__(self, channels, fs, frames_per_buffer, *args, **kwargs):
+        super(SoundDeviceInputStream, self).__init__(*args, **kwargs)
+
+        import sounddevice
+        self.stream = sounddevice.InputStream(samplerate=fs, blocksize=frames_per_buffer, channels=channels, dtype='float32')
+        self.stream.start()
+
+    def read(self, frame_count, *args, **kwargs):
+        data, _ = self.stream.read(frame_count)
+        return data
+
+    def stop_stream(self, *args, **kwargs):
+        self.stream.stop()
+
+    def close(self, *args, **kwargs):
+        self.stream.close()
+
+
+class SoundDeviceBackend(AudioBackend):
+
+    ########################################### Brief description ###########################################
+    # SoundDeviceBackend uses PortAudio through the sounddevice module.
+    #########################################################################################################
+
+    name = 'sounddevice'
+
+    def __init__(self, *args, **kwargs):
+        super(SoundDeviceBackend, self).__init__(*args, **kwargs)
+
+        # Imported here so the other backends work without sounddevice installed
+        import sounddevice
+        self.sounddevice = sounddevice
+
+    def open_output_stream(self, callback, channels, fs, frames_per_buffer, *args, **kwargs):
+        return SoundDeviceOutputStream(callback, channels, fs, frames_per_buffer)
+
+    def open_input_stream(self, channels, fs, frames_per_buffer, *args, **kwargs):
+        return SoundDeviceInputStream(channels, fs, frames_per_buffer)
+
+    def output_latency(self, *args, **kwargs):
+        return float(self.sounddevice.query_devices(kind='output')['default_low_output_latency'])
+
+
+############################### Null and file devices ###############################
+
+class PullingOutputStream:
+
+    ########################################### Brief description ###########################################
+    # PullingOutputStream calls the callback in its own thread and hands every output buffer to a sink
+    # function. By default buffers are pulled as fast as possible, which is what benchmarks and CI want. With
+    # realtime=True the thread waits so that buffers are pulled at the pace a sound card would pull them.
+    #########################################################################################################
+
+    def __init__(self, callback, channels, fs, frames_per_buffer, sink=None, realtime=False, *args, **kwargs):
+        super(PullingOutputStream, self).__init__(*args, **kwargs)
+
+        self.callback = callback
+        self.channels = channels
+        self.fs = fs
+        self.frames_per_buffer = frames_per_buffer
+        self.sink = sink
+        self.realtime = realtime
+
+        # How many buffers have been pulled
+        self.buffers_pulled = 0
+
+        self.pulling = False
+        self.thread = None
+
+    def start_stream(self, *args, **kwargs):
+        if not self.pulling:
+            self.pulling = True
+            self.thread = threading.Thread(target=self.pulling_process, daemon=True)
+            self.thread.start()
+
+    def stop_stream(self, *args, **kwargs):
+        # Wait for the buffer being pulled so nothing is written after the stream has been stopped
+        self.pulling = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def close(self, *args, **kwargs):
+        self.stop_stream()
+
+    def pulling_process(self, *args, **kwargs):
+        buffer_time = self.frames_per_buffer/self.fs
+        start_time = time.perf_counter()
+
+        while self.pulling:
+            current_time = time.perf_counter()
+
+            # Without hardware the buffer is "heard" right away, unless pacing to realtime
+            output_buffer = self.callback(self.frames_per_buffer, {'current_time': current_time, 'output_buffer_dac_time': current_time}, 0)
+            if self.sink:
+                self.sink(output_buffer)
+            self.buffers_pulled += 1
+
+            if self.realtime:
+                time_to_wait = start_time + self.buffers_pulled*buffer_time - time.perf_counter()
+                if time_to_wait > 0:
+                    time.sleep(time_to_wait)
+
+
+class SilentInputStream:
+
+    ########################################### Brief description ###########################################
+    # SilentInputStream records silence. Reads return immediately unless realtime=True.
+    #########################################################################################################
+
+    def __init__(self, channels, fs, realtime=False, *args, **kwargs):
+        super(SilentInputStream, self).__init__(*args, **kwargs)
+
+        self.channels = channels
+        self.fs = fs
+        self.realtime = realtime
+
+    def read(self, frame_count, *args, **kwargs):
+        if self.realtime:
+            time.sleep(frame_count/self.fs)
+        return np.zeros((frame_count, self.channels), dtype=np.float32)
+
+    def stop_stream(self, *args, **kwargs):
+        pass
+
+    def close(self, *args, **kwargs):
+        pass
+
+
+class FileInputStream:
+
+    ########################################### Brief description ###########################################
+    # FileInputStream "records" an audio file. The file is read block by block and silence is returned
+    # after its end. Extra channels of the file are dropped and missing channels are copies of the first.
+    #########################################################################################################
+
+    def __init__(self, path, channels, fs, realtime=False, *args, **kwargs):
+        super(FileInputStream, self).__init__(*args, **kwargs)
+
+        self.audio_file = soundfile.SoundFile(path)
+        if self.audio_file.samplerate != fs:
+            print("Warning! "+str(path)+" has sampling rate "+str(self.audio_file.samplerate)+" instead of "+str(fs)+" and is read without resampling.")
+        self.channels = channels
+        self.fs = fs
+        self.realtime = realtime
+
+    def read(self, frame_count, *args, **kwargs):
+        if self.realtime:
+            time.sleep(frame_count/self.fs)
+
+        data = self.audio_file.read(frame_count, dtype='float32', always_2d=True, fill_value=0)
+
+        # Match the amount of channels
+        if data.shape[1] >= self.channels:
+            return np.ascontiguousarray(data[:,0:self.channels])
+        return np.repeat(data[:,0:1], self.channels, axis=1)
+
+    def stop_stream(self, *args, **kwargs):
+        pass
+
+    def close(self, *args, **kwargs):
+        self.audio_file.close()
+
+
+class NullBackend(AudioBackend):
+
+    ########################################### Brief description ###########################################
+    # NullBackend is a device without hardware. Output is thrown away and input is silence.
+    #########################################################################################################
+
+    name = 'null'
+
+    def __init__(self, realtime=False, *args, **kwargs):
+        super(NullBackend, self).__init__(*args, **kwargs)
+
+        self.realtime = realtime
+
+    def open_output_stream(self, callback, channels, fs, frames_per_buffer, *args, **kwargs):
+        return PullingOutputStream(callback, channels, fs, frames_per_buffer, realtime=self.realtime)
+
+    def open_input_stream(self, channels, fs, frames_per_buffer, *args, **kwargs):
+        return SilentInputStream(channels, fs, realtime=self.realtime)
+
+
+class FileBackend(AudioBackend):
+
+    ########################################### Brief description ###########################################
+    # FileBackend writes the output to a float32 WAV file and records from an existing audio file. Either
+    # path can be left out, in which case output is thrown away or input is silence like with NullBackend.
+    #########################################################################################################
+
+    name = 'file'
+
+    def __init__(self, output_path=None, input_path=None, realtime=False, *args, **kwargs):
+        super(FileBackend, self).__init__(*args, **kwargs)
+
+        self.output_path = output_path
+        self.input_path = input_path
+        self.realtime = realtime
+
+    def open_output_stream(self, callback, channels, fs, frames_per_buffer, *args, **kwargs):
+        if not self.output_path:
+            return PullingOutputStream(callback, channels, fs, frames_per_buffer, realtime=self.realtime)
+
+        output_file = soundfile.SoundFile(self.output_path, mode='w', samplerate=fs, channels=channels, subtype='FLOAT')
+        stream = PullingOutputStream(callback, channels, fs, frames_per_buffer, sink=output_file.write, realtime=self.realtime)
+
+        # Close the file when the stream is closed
+        stream_close = stream.close
+        def close(*args, **kwargs):
+            stream_close()
+            output_file.close()
+        stream.close = close
+
+        return stream
+
+    def open_input_stream(self, channels, fs, frames_per_buffer, *args, **kwargs):
+        if not self.input_path:
+            return SilentInputStream(channels, fs, realtime=self.realtime)
+        return FileInputStream(self.input_path, channels, fs, realtime=self.realtime)
+
+
+############################### Creating backends ###############################
+
+backend_classes = {'pyaudio': PyAudioBackend, 'sounddevice': SoundDeviceBackend, 'null': NullBackend, 'file': FileBackend}
+
+
+def create_audio_backend(name=None, realtime=False, *args, **kwargs):
+    # Create a backend by name. Without a name the environment variable or 'audio_backend' from GlobalAudioVariables.py is used. 'auto' picks
+    # the hardware backend with the lowest output latency and falls back to the null device if no hardware backend can be opened.
+    # realtime=True paces the backends without hardware like a sound card, so the app doesn't spin a core pulling buffers. Headless use and
+    # exports keep them as fast as possible.
+    if name is None:
+        name = os.environ.get(backend_environment_variable, audio_backend)
+
+    if name == 'auto':
+        return select_lowest_latency_backend()
+
+    if name not in hardware_backend_names:
+        kwargs['realtime'] = realtime
+
+    # The file backend is given its files unless the caller gives them
+    if name == 'file':
+        kwargs.setdefault('output_path', os.environ.get(output_file_environment_variable, audio_output_file))
+        kwargs.setdefault('input_path', os.environ.get(input_file_environment_variable, audio_input_file))
+    return backend_classes[name](*args, **kwargs)
+
+
+def select_lowest_latency_backend(*args, **kwargs):
+    # Open all hardware backends which are installed and have a default output device, keep the one with the lowest latency
+    best_backend = None
+    for name in hardware_backend_names:
+        try:
+            backend = backend_classes[name]()
+            latency = backend.output_latency()
+        except Exception as error:
+            print("Audio backend '"+name+"' is not available: "+str(error))
+            continue
+
+        if best_backend is None or latency < best_latency:
+            if best_backend is not None:
+                best_backend.terminate()
+            best_backend, best_latency = backend, latency
+        else:
+            backend.terminate()
+
+    if best_backend is None:
+        print("No audio hardware available, using the null audio backend.")
+        return NullBackend(realtime=True)
+
+    return best_backend
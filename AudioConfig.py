@@ -0,0 +1,154 @@
+# Project files
+from AudioBackend import output_underflow
+from GlobalAudioVariables import *
+
+# Global variables
+# Settings which can be changed at runtime and the values they accept
+supported_sampling_rates = (44100, 48000, 88200, 96000)
+minimum_buffer_size = 256
+maximum_buffer_size = 8192
+
+# Adaptive playback buffer size. A buffer is an overrun if the device reports an output underflow or if rendering it took longer than
+# 'overrun_load' of the buffer's duration.
+overrun_load = 0.9
+# Buffer size is doubled after this many overruns within 'overrun_window' seconds
+overruns_to_grow = 3
+overrun_window = 5
+# Buffer size is halved after 'headroom_time' seconds without overruns if no buffer took more than 'shrink_load' of its duration. Rendering
+# takes roughly the same share of a buffer's duration at half the size, so the limit leaves room for the fixed cost of each callback.
+headroom_time = 30
+shrink_load = 0.3
+
+
+class AudioConfig:
+
+    ########################################### Brief description ###########################################
+    # AudioConfig holds the audio settings which can be changed while the program is running: sampling rate
+    # and recording and playback buffer sizes. The values in GlobalAudioVariables.py are only the defaults.
+    #
+    # Objects which have buffers sized by these settings bind a listener with bind. set changes the settings
+    # and calls every listener with the names of the settings which changed, so all dependent buffers are
+    # rebuilt at once. MainView closes the output stream before the buffers are rebuilt and opens it again
+    # after, so the audio thread never sees buffers of different sizes.
+    #########################################################################################################
+
+    def __init__(self, *args, **kwargs):
+        super(AudioConfig, self).__init__(*args, **kwargs)
+
+        self.sampling_rate = sampling_rate
+        self.samples_per_recording_buffer = samples_per_recording_buffer
+        self.samples_per_playback_buffer = samples_per_playback_buffer
+        self.number_of_input_channels = number_of_input_channels
+        self.number_of_output_channels = number_of_output_channels
+
+        # Whether AdaptiveBufferSize may change samples_per_playback_buffer
+        self.adaptive_buffer_size = adaptive_playback_buffer
+
+        # Functions called as listener(AudioConfig, changed_settings) after settings have changed
+        self.listeners = []
+
+    def bind(self, listener, *args, **kwargs):
+        self.listeners.append(listener)
+
+    def unbind(self, listener, *args, **kwargs):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def set(self, **settings):
+        # Check all values before changing anything, so a bad value doesn't leave the settings half changed
+        for name, value in settings.items():
+            if name == 'sampling_rate':
+                if value not in supported_sampling_rates:
+                    raise ValueError("Sampling rate "+str(value)+" is not supported. Supported rates are "+str(supported_sampling_rates)+".")
+            elif name in ('samples_per_recording_buffer', 'samples_per_playback_buffer'):
+                # Powers of two, since the overlap-add filter in PEQLayout splits playback buffers in halves
+                if value < minimum_buffer_size or value > maximum_buffer_size or value & (value-1) != 0:
+                    raise ValueError(name+" has to be a power of two from "+str(minimum_buffer_size)+" to "+str(maximum_buffer_size)+", not "+str(value)+".")
+            elif name != 'adaptive_buffer_size':
+                raise ValueError("'"+name+"' is not an audio setting which can be changed at runtime.")
+
+        # Change only the settings which have a new value
+        changed_settings = [name for name, value in settings.items() if getattr(self, name) != value]
+        for name in changed_settings:
+            setattr(self, name, settings[name])
+
+        if changed_settings:
+            for listener in list(self.listeners):
+                listener(self, changed_settings)
+
+        return changed_settings
+
+
+class AdaptiveBufferSize:
+
+    ########################################### Brief description ###########################################
+    # AdaptiveBufferSize looks for the smallest playback buffer which plays without overruns. The audio
+    # thread reports every buffer with report_buffer. The GUI thread calls check about once per second,
+    # which returns a new buffer size when the buffer should grow after repeated overruns or shrink after a
+    # long time with headroom. Sizes which have overrun are remembered and never shrunk back to, so the size
+    # settles instead of swinging between two values.
+    #########################################################################################################
+
+    def __init__(self, AudioConfig, *args, **kwargs):
+        super(AdaptiveBufferSize, self).__init__(*args, **kwargs)
+
+        self.AudioConfig = AudioConfig
+
+        # Buffer sizes which have had repeated overruns
+        self.unstable_sizes = set()
+
+        self.reset()
+
+    def reset(self, *args, **kwargs):
+        # Start counting again, called whenever the buffer size has changed
+        self.overruns = 0
+        self.highest_load = 0.0
+        self.time_in_window = 0.0
+        self.time_without_overruns = 0.0
+
+    def report_buffer(self, frame_count, processing_time, status, *args, **kwargs):
+        # Called from the audio thread after each buffer. Load is the share of the buffer's duration which was spent rendering it.
+        load = processing_time*self.AudioConfig.sampling_rate/frame_count
+        if load > self.highest_load:
+            self.highest_load = load
+
+        if status & output_underflow or load > overrun_load:
+            self.overruns += 1
+
+    def check(self, time_since_last_check, *args, **kwargs):
+        # Called from the GUI thread. Returns the new playback buffer size or None if it should stay.
+        buffer_size = self.AudioConfig.samples_per_playback_buffer
+        self.time_in_window += time_since_last_check
+
+        # Repeated overruns, grow the buffer
+        if self.overruns >= overruns_to_grow:
+            self.unstable_sizes.add(buffer_size)
+            if buffer_size < maximum_buffer_size:
+                self.reset()
+                return buffer_size*2
+
+        # Count time without overruns over the windows
+        if self.time_in_window >= overrun_window:
+            if self.overruns == 0:
+                self.time_without_overruns += self.time_in_window
+            else:
+                self.time_without_overruns = 0.0
+            self.overruns = 0
+            self.time_in_window = 0.0
+
+        # Enough headroom for long enough, shrink the buffer unless the smaller size has overrun before
+        if self.time_without_overruns >= headroom_time:
+            smaller_size = buffer_size//2
+            if self.highest_load < shrink_load and smaller_size >= minimum_buffer_size and smaller_size not in self.unstable_sizes:
+                self.reset()
+                return smaller_size
+
+            # Look at the load again over the next period
+            self.highest_load = 0.0
+            self.time_without_overruns = 0.0
+
+        return None
+
+
+# The audio settings used by the whole program
+audio_config = AudioConfig()
@@ -0,0 +1,335 @@
+# Project files
+from CompressedSamples import CompressedSamples
+
+# General Python imports
+import math
+import time
+import threading
+import queue
+import numpy as np
+
+# Global variables
+# How often the loader thread prefetches and evicts when nothing has been asked from it, in seconds
+loader_interval = 0.1
+
+# A compressed clip replaces its ClipSamples only if it takes at most this share of their memory. Noisy 24-bit takes barely compress, and
+# a compressed clip which is read also keeps decoded chunks, so a smaller gain isn't worth the decoding.
+maximum_compressed_ratio = 0.8
+
+
+class CachedSamples:
+
+    ########################################### Brief description ###########################################
+    # CachedSamples stands in for the samples of one clip in Session, so Session and its snapshots don't keep
+    # the audio in memory. It has the length of the clip and slices like ClipSamples. Slicing looks the clip
+    # up from ClipCache without waiting, which is what the audio thread needs: if the clip has been evicted,
+    # the slice is silent and the clip is queued to be loaded again. load waits for the clip and is used by
+    # everything else which needs the audio, like splitting and rendering.
+    #########################################################################################################
+
+    __slots__ = ('ClipCache', 'path', 'length')
+
+    def __init__(self, ClipCache, path, length):
+        self.ClipCache = ClipCache
+        self.path = path
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        samples = self.ClipCache.lookup(self.path)
+        if samples is not None:
+            return samples[key]
+
+        # Evicted, play silence until the clip has been loaded
+        start, end, _ = key.indices(self.length)
+        return np.zeros(max(end-start, 0), dtype=np.float32)
+
+    def __array__(self, dtype=None):
+        samples = np.asarray(self.load())
+        return samples if dtype is None else samples.astype(dtype)
+
+    def load(self, *args, **kwargs):
+        return self.ClipCache.get(self.path)
+
+
+class ClipCache:
+
+    ########################################### Brief description ###########################################
+    # ClipCache holds the ClipSamples of SoundClips by path within a memory budget. Clips are added with put,
+    # which returns the CachedSamples that Session keeps. When the resident clips take more than
+    # budget_in_bytes, the clips with the highest eviction score are compressed to CompressedSamples, if
+    # compress is on and they compress to maximum_compressed_ratio, and if that isn't enough, dropped. The score is the time since the clip was last read
+    # plus its distance from the playhead, both in seconds, so clips which haven't been heard for a while and
+    # are far from the playhead go first. Compressed clips are still played, decoding only the chunks which
+    # are read. A dropped clip is loaded again from its file by loader when it is needed. get decompresses
+    # a compressed clip, since whoever asks for the whole clip is about to use it.
+    #
+    # The audio thread tells the playhead and the current SessionSnapshot with set_playhead. The loader
+    # thread prefetches the clips which start within prefetch_seconds of the playhead and never evicts
+    # them, so clips are normally resident before they are heard. Compressing and evicting is also done by
+    # the loader thread, so the budget may be exceeded for up to loader_interval. The audio thread only reads
+    # the dictionary of resident clips, which is changed by the other threads under a lock.
+    #
+    # hits and misses are counted per slice of a clip. Mixer threads may count at the same time, so the
+    # counts are approximate.
+    #########################################################################################################
+
+    def __init__(self, loader, budget_in_bytes, fs, prefetch_seconds, compress=True, *args, **kwargs):
+        super(ClipCache, self).__init__(*args, **kwargs)
+
+        # Function which reads a clip's ClipSamples from its path
+        self.loader = loader
+
+        self.budget_in_bytes = budget_in_bytes
+        self.fs = fs
+        self.prefetch_seconds = prefetch_seconds
+        self.compress = compress
+
+        # Resident ClipSamples by path, and the time each one was last read
+        self.clips = {}
+        self.last_used = {}
+
+        # Lengths of all clips which have been put, resident or not
+        self.lengths = {}
+
+        # Paths whose files the loader thread couldn't read. They aren't tried again until they are put or registered again.
+        self.unreadable_paths = set()
+
+        # Paths of clips which didn't compress below maximum_compressed_ratio. They aren't compressed again until new samples are put.
+        self.incompressible_paths = set()
+
+        # Playhead and snapshot from the audio thread
+        self.playhead_sample = 0
+        self.snapshot = None
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.compressions = 0
+        self.decompressions = 0
+        self.evictions = 0
+
+        # Changes of clips, last_used and lengths by the GUI and loader threads
+        self.lock = threading.RLock()
+
+        # Paths of evicted clips which the audio thread has missed
+        self.load_queue = queue.Queue()
+
+        # Bool for the loader loop
+        self.loading = True
+        self.thread = threading.Thread(target=self.loader_process, daemon=True)
+        self.thread.start()
+
+    def stop(self, *args, **kwargs):
+        self.loading = False
+        self.thread.join()
+        with self.lock:
+            self.clips = {}
+
+    def put(self, path, samples, *args, **kwargs):
+        # Add the samples of a new clip, for example a recording or a dropped file which was just written to path
+        with self.lock:
+            self.clips[path] = samples
+            self.last_used[path] = time.monotonic()
+            self.lengths[path] = len(samples)
+            self.unreadable_paths.discard(path)
+            self.incompressible_paths.discard(path)
+        return CachedSamples(self, path, len(samples))
+
+    def register(self, path, length, *args, **kwargs):
+        # Add a clip whose file hasn't been read yet, for example of a loaded session. It is read when it is first needed or prefetched.
+        with self.lock:
+            self.lengths[path] = length
+            self.unreadable_paths.discard(path)
+        return CachedSamples(self, path, length)
+
+    def get(self, path, *args, **kwargs):
+        # Samples of a clip as ClipSamples, loaded from its file if it has been evicted or decompressed if it has been compressed
+        samples = self.clips.get(path)
+        if samples is None or isinstance(samples, CompressedSamples):
+
+            # Reading and decompressing take a while, so they are done outside the lock
+            loaded_samples = self.loader(path) if samples is None else samples.decompress()
+            with self.lock:
+                if samples is None:
+                    self.loads += 1
+                else:
+                    self.decompressions += 1
+
+                # A clip removed in the meantime isn't cached again, since it has no length and would never be evicted
+                if path not in self.lengths:
+                    return loaded_samples
+
+                # Another thread may have loaded the clip in the meantime, in which case its samples are used
+                resident_samples = self.clips.get(path)
+                if resident_samples is None or isinstance(resident_samples, CompressedSamples):
+                    self.clips[path] = loaded_samples
+                    resident_samples = loaded_samples
+                samples = resident_samples
+
+        self.last_used[path] = time.monotonic()
+        return samples
+
+    def lookup(self, path, *args, **kwargs):
+        # Called from the audio thread. Samples of a resident clip or None, in which case the clip is queued to be loaded.
+        samples = self.clips.get(path)
+        if samples is None:
+            self.misses += 1
+            self.load_queue.put(path)
+            return None
+
+        self.hits += 1
+        self.last_used[path] = time.monotonic()
+        return samples
+
+    def remove(self, path, *args, **kwargs):
+        # Forget a clip which has been deleted
+        with self.lock:
+            self.clips.pop(path, None)
+            self.last_used.pop(path, None)
+            self.lengths.pop(path, None)
+            self.incompressible_paths.discard(path)
+
+    def set_playhead(self, playhead_sample, snapshot, *args, **kwargs):
+        # Called from the audio thread once per buffer and from the GUI thread when Transport is located
+        self.playhead_sample = playhead_sample
+        self.snapshot = snapshot
+
+    def get_resident_bytes(self, *args, **kwargs):
+        with self.lock:
+            return sum(samples.nbytes for samples in self.clips.values())
+
+    def get_statistics(self, *args, **kwargs):
+        lookups = self.hits+self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits/lookups if lookups else 1.0,
+                'loads': self.loads,
+                'compressions': self.compressions,
+                'decompressions': self.decompressions,
+                'evictions': self.evictions,
+                'resident_clips': len(self.clips),
+                'compressed_clips': sum(isinstance(samples, CompressedSamples) for samples in list(self.clips.values())),
+                'resident_bytes': self.get_resident_bytes(),
+                'budget_bytes': self.budget_in_bytes}
+
+    def clip_distances(self, *args, **kwargs):
+        # Distance of each played clip from the playhead in samples, before or after it. Clips under the playhead have a distance of 0.
+        distances = {}
+        snapshot = self.snapshot
+        if snapshot is None:
+            return distances
+
+        playhead_sample = self.playhead_sample
+        for clips in snapshot.track_clips:
+            for start_sample, samples, regions in clips:
+                if isinstance(samples, CachedSamples):
+                    distance = max(start_sample-playhead_sample, playhead_sample-(start_sample+len(samples)), 0)
+                    distances[samples.path] = min(distance, distances.get(samples.path, distance))
+        return distances
+
+    def prefetch(self, distances, *args, **kwargs):
+        # Load the clips which the playhead will reach within prefetch_seconds, and decompress the compressed ones, so the audio thread
+        # doesn't have to decode them during playback
+        # The nearest clips are read first, so after a session is loaded or Transport is located the audio at the playhead is in soonest.
+        prefetch_samples = self.prefetch_seconds*self.fs
+        for path in sorted(distances, key=distances.get):
+            if distances[path] <= prefetch_samples and path in self.lengths and (path not in self.clips or isinstance(self.clips.get(path), CompressedSamples)):
+                self.load(path)
+
+    def release_decoded_chunks(self, distances, *args, **kwargs):
+        # Compressed clips outside the prefetch range aren't being played, so their decoded chunks are dropped and they take only their
+        # compressed size of the budget
+        prefetch_samples = self.prefetch_seconds*self.fs
+        for path, samples in list(self.clips.items()):
+            if isinstance(samples, CompressedSamples) and distances.get(path, math.inf) > prefetch_samples:
+                samples.clear_decoded()
+
+    def eviction_order(self, distances, *args, **kwargs):
+        # Paths of the resident clips outside the prefetch range, highest eviction score first
+        prefetch_samples = self.prefetch_seconds*self.fs
+
+        # Clips which aren't played at all, like clips of muted Tracks, are farther than any played clip and outside the prefetch range
+        now = time.monotonic()
+        farthest_distance = max(max(distances.values(), default=0), prefetch_samples)+1
+        with self.lock:
+            scores = {path: (now-self.last_used.get(path, now)) + distances.get(path, farthest_distance)/self.fs
+                      for path in self.clips if distances.get(path, farthest_distance) > prefetch_samples}
+
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def evict(self, distances=None, *args, **kwargs):
+        # Compress and then drop clips until the resident ones fit the budget. Clips within prefetch_seconds of the playhead are kept as they
+        # are even over the budget.
+        if distances is None:
+            distances = self.clip_distances()
+
+        resident_bytes = self.get_resident_bytes()
+        if resident_bytes <= self.budget_in_bytes:
+            return
+        order = self.eviction_order(distances)
+
+        # Compressing takes a while, so it is done outside the lock. The compressed clip replaces the old one only if it is clearly smaller
+        # and the clip hasn't changed in between.
+        if self.compress:
+            for path in order:
+                if resident_bytes <= self.budget_in_bytes:
+                    return
+                samples = self.clips.get(path)
+                if samples is None or isinstance(samples, CompressedSamples) or path in self.incompressible_paths:
+                    continue
+                compressed_samples = CompressedSamples.from_clip_samples(samples)
+                if compressed_samples.nbytes > maximum_compressed_ratio*samples.nbytes:
+                    self.incompressible_paths.add(path)
+                    continue
+                with self.lock:
+                    if self.clips.get(path) is samples:
+                        self.clips[path] = compressed_samples
+                        resident_bytes += compressed_samples.nbytes-samples.nbytes
+                        self.compressions += 1
+
+        with self.lock:
+            for path in order:
+                if resident_bytes <= self.budget_in_bytes:
+                    break
+                if path in self.clips:
+                    resident_bytes -= self.clips.pop(path).nbytes
+                    self.evictions += 1
+
+    def load(self, path, *args, **kwargs):
+        # Called from the loader thread. A clip whose file can't be read, for example because it has been deleted, is reported and left out,
+        # so it doesn't stop the loading of the others.
+        if path in self.unreadable_paths:
+            return
+        try:
+            self.get(path)
+        except Exception as error:
+            self.unreadable_paths.add(path)
+            print("Clip cache failed to load "+str(path)+": "+str(error))
+
+    def loader_process(self, *args, **kwargs):
+        while self.loading:
+            try:
+                paths = {self.load_queue.get(timeout=loader_interval)}
+            except queue.Empty:
+                paths = set()
+
+            # The audio thread misses a clip on every buffer until it is in, so everything queued is taken at once
+            while not self.load_queue.empty():
+                paths.add(self.load_queue.get())
+
+            try:
+                # Load the missed clips which still exist, nearest to the playhead first
+                distances = self.clip_distances()
+                for path in sorted(paths, key=lambda path: distances.get(path, math.inf)):
+                    if path in self.lengths:
+                        self.load(path)
+
+                self.prefetch(distances)
+                self.release_decoded_chunks(distances)
+                self.evict(distances)
+            except Exception as error:
+                print("Clip cache failed to prefetch or evict: "+str(error))
@@ -0,0 +1,54 @@
+# Project files
+from ClipSamples import ClipSamples, pack_int24, unpack_int24
+from GlobalAudioVariables import *
+
+# General Python imports
+import numpy as np
+import soundfile
+import librosa
+
+# Global variables
+# Mono files at the session's sampling rate in these subtypes are kept in their own width. soundfile reads PCM_24 to the top bytes of int32.
+native_subtypes = {'PCM_16': ('int16', 'int16'), 'PCM_24': ('int24', 'int32')}
+
+
+############################### Clip files ###############################
+# Reading, writing and splitting the audio of SoundClips without Kivy. Samples are mono ClipSamples.
+
+
+def load_clip(path, fs, float_encoding=imported_clip_encoding):
+    # Read an audio file as ClipSamples at fs. Mono 16-bit and 24-bit files at fs are read as they are. Other files are resampled and mixed
+    # to mono by librosa, which gives float32, and stored in float_encoding. librosa doesn't have a close.
+    info = soundfile.info(path)
+    if info.samplerate == fs and info.channels == 1 and info.subtype in native_subtypes:
+        encoding, read_dtype = native_subtypes[info.subtype]
+        data, _ = soundfile.read(path, dtype=read_dtype)
+        return ClipSamples(pack_int24(data) if encoding == 'int24' else data, encoding)
+
+    # Clips written by the program, which ClipCache reads again after evicting them, don't need librosa either
+    if info.samplerate == fs and info.channels == 1 and info.subtype == 'FLOAT':
+        samples, _ = soundfile.read(path, dtype='float32')
+        return ClipSamples.from_float(samples, float_encoding)
+
+    samples, _ = librosa.load(path, sr=fs, dtype=np.float32)
+    return ClipSamples.from_float(samples, float_encoding)
+
+
+def write_clip(path, samples, fs):
+    # Write samples as a WAV file. ClipSamples are written in their own width, so 16-bit and 24-bit clips stay as small on disk as in memory.
+    if not isinstance(samples, ClipSamples):
+        soundfile.write(path, np.asarray(samples, dtype=np.float32), fs)
+    elif samples.encoding == 'int16':
+        soundfile.write(path, samples.data, fs, subtype=samples.subtype)
+    elif samples.encoding == 'int24':
+        soundfile.write(path, unpack_int24(samples.data), fs, subtype=samples.subtype)
+    else:
+        soundfile.write(path, np.asarray(samples, dtype=np.float32), fs, subtype=samples.subtype)
+
+
+def split_clip(samples, split_sample):
+    # Samples of the two halves when a clip is split at split_sample. The split sample and the last sample belong to neither half.
+    # ClipSamples are split to sections which share the data.
+    if isinstance(samples, ClipSamples):
+        return samples.section(0, split_sample), samples.section(split_sample+1, len(samples)-1)
+    return samples[0:split_sample], samples[split_sample+1:-1]
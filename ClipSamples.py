@@ -0,0 +1,104 @@
+# General Python imports
+import numpy as np
+
+# Global variables
+# Encodings of stored samples and the WAV subtype each one is written as
+encoding_subtypes = {'int16': 'PCM_16', 'int24': 'PCM_24', 'float16': 'FLOAT', 'float32': 'FLOAT'}
+
+# Bytes per sample of each encoding
+encoding_widths = {'int16': 2, 'int24': 3, 'float16': 2, 'float32': 4}
+
+# Integer samples are scaled to float32 so that full scale is 1. Both scales are powers of two, so the conversion is exact.
+int16_scale = np.float32(2**-15)
+int24_scale = np.float32(2**-31) # int24 samples are decoded to the top three bytes of an int32
+
+
+def pack_int24(shifted_samples):
+    # Pack int32 samples whose 24 bits are in the top three bytes, like soundfile reads PCM_24, to an (N,3) uint8 array of little endian int24
+    return np.ascontiguousarray(np.asarray(shifted_samples, dtype='<i4').view(np.uint8).reshape(-1,4)[:,1:4])
+
+
+def unpack_int24(packed_samples):
+    # Inverse of pack_int24. The lowest byte of each int32 is zero.
+    shifted_samples = np.zeros((len(packed_samples),4), dtype=np.uint8)
+    shifted_samples[:,1:4] = packed_samples
+    return shifted_samples.view('<i4').reshape(-1)
+
+
+class ClipSamples:
+
+    ########################################### Brief description ###########################################
+    # ClipSamples holds the mono samples of a clip in the encoding it was read or recorded in: 16-bit or
+    # 24-bit integers, or float16 or float32. 16-bit audio takes half the memory of float32 and 24-bit audio
+    # three quarters. Slicing returns float32, converting only the sliced samples, so the mixer and
+    # TrackRender convert one buffer at a time while they sum the clip. Integer samples convert exactly, so
+    # a 16-bit file mixes bit for bit like it did when it was loaded as float32.
+    #
+    # section returns a ClipSamples of part of the clip without converting or copying, which is used to cut
+    # and split clips. np.asarray converts the whole clip.
+    #########################################################################################################
+
+    def __init__(self, data, encoding='float32', *args, **kwargs):
+        super(ClipSamples, self).__init__(*args, **kwargs)
+
+        if encoding not in encoding_subtypes:
+            raise ValueError("Unknown clip encoding '{}'".format(encoding))
+
+        # int24 data is an (N,3) uint8 array from pack_int24, the rest are 1D arrays of their own dtype
+        self.data = data
+        self.encoding = encoding
+
+    @classmethod
+    def from_float(cls, samples, encoding='float32', *args, **kwargs):
+        # Store float samples in the given encoding. Integer encodings round to the nearest step and clip to full scale.
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+
+        if encoding == 'int16':
+            data = np.clip(np.round(samples.astype(np.float64)*2**15), -2**15, 2**15-1).astype(np.int16)
+        elif encoding == 'int24':
+            data = pack_int24(np.clip(np.round(samples.astype(np.float64)*2**23), -2**23, 2**23-1).astype(np.int32)*2**8)
+        elif encoding == 'float16':
+            data = samples.astype(np.float16)
+        else:
+            data = samples
+
+        return cls(data, encoding)
+
+    @property
+    def subtype(self):
+        # soundfile subtype which writes the samples without loss
+        return encoding_subtypes[self.encoding]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __len__(self):
+        return len(self.data)
+
+    def decode(self, start, end, *args, **kwargs):
+        # Samples from start to end as a float32 array. float32 samples are returned as a view, so the result must not be written to.
+        data = self.data[start:end]
+
+        if self.encoding == 'int16':
+            return np.multiply(data, int16_scale, dtype=np.float32)
+        elif self.encoding == 'int24':
+            return np.multiply(unpack_int24(data), int24_scale, dtype=np.float32)
+        elif self.encoding == 'float16':
+            return data.astype(np.float32)
+        return data
+
+    def __getitem__(self, key):
+        # Slices without a step are converted directly, anything else is taken from the whole clip converted
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, end, _ = key.indices(len(self.data))
+            return self.decode(start, max(start, end))
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None):
+        samples = self.decode(0, len(self.data))
+        return samples if dtype is None else samples.astype(dtype)
+
+    def section(self, start, end, *args, **kwargs):
+        # Part of the clip in the same encoding. The data is shared, like with NumPy slices.
+        return ClipSamples(self.data[start:end], self.encoding)
@@ -0,0 +1,146 @@
+# Project files
+from ClipSamples import ClipSamples, pack_int24, unpack_int24
+
+# General Python imports
+import zlib
+import threading
+import collections
+import numpy as np
+
+# Global variables
+# Samples per compressed chunk. Reading a buffer decodes at most this many samples more than it needs, which bounds the cost per buffer.
+chunk_size = 16384
+
+# Decoded chunks kept per clip. A playback buffer touches at most two chunks, the rest are for the render thread and parallel mixing.
+decoded_chunks_per_clip = 4
+
+# zlib level. Chunks are compressed in the background but decoded in the audio thread, and decoding is about as fast at every level.
+compression_level = 6
+
+
+def shuffle_bytes(values):
+    # Put the first bytes of all values first, then the second bytes and so on. The high bytes of small deltas are mostly the same, which zlib
+    # compresses much better when they are next to each other.
+    return np.ascontiguousarray(values.view(np.uint8).reshape(-1, values.itemsize).T).tobytes()
+
+
+def unshuffle_bytes(data, dtype):
+    # Inverse of shuffle_bytes
+    itemsize = np.dtype(dtype).itemsize
+    return np.ascontiguousarray(np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1).T).view(dtype).reshape(-1)
+
+
+def compress_chunk(data, encoding):
+    # Compress one chunk of ClipSamples.data without loss. Integers are stored as differences between neighbouring samples, which are small
+    # for audio. The differences of int16 wrap around, which cumsum undoes exactly.
+    if encoding == 'int16':
+        values = np.diff(data, prepend=np.int16(0))
+    elif encoding == 'int24':
+        values = np.diff(unpack_int24(data) >> 8, prepend=np.int32(0)).astype('<i4')
+    else:
+        values = data
+    return zlib.compress(shuffle_bytes(values), compression_level)
+
+
+def decompress_chunk(compressed_chunk, encoding):
+    # Inverse of compress_chunk. Returns the chunk as ClipSamples.data.
+    if encoding == 'int16':
+        return np.cumsum(unshuffle_bytes(zlib.decompress(compressed_chunk), np.int16), dtype=np.int16)
+    elif encoding == 'int24':
+        return pack_int24(np.cumsum(unshuffle_bytes(zlib.decompress(compressed_chunk), '<i4'), dtype=np.int32) << 8)
+    return unshuffle_bytes(zlib.decompress(compressed_chunk), np.float16 if encoding == 'float16' else np.float32)
+
+
+class CompressedSamples:
+
+    ########################################### Brief description ###########################################
+    # CompressedSamples holds the samples of a clip which hasn't been heard for a while as zlib compressed
+    # chunks of chunk_size samples. It slices like ClipSamples, returning float32, but decodes only the
+    # chunks which the slice touches. The latest decoded chunks are kept, so a playback buffer decodes a
+    # chunk only when it crosses to a new one. Compression is lossless, decompress gives back the
+    # ClipSamples the clip was compressed from.
+    #
+    # Slices may be taken by the mixer threads and the render thread at the same time, so the decoded
+    # chunks are changed under a lock.
+    #########################################################################################################
+
+    def __init__(self, compressed_chunks, length, encoding, *args, **kwargs):
+        super(CompressedSamples, self).__init__(*args, **kwargs)
+
+        self.compressed_chunks = compressed_chunks
+        self.length = length
+        self.encoding = encoding
+
+        # The chunks never change, so their size is counted once
+        self.compressed_nbytes = sum(len(compressed_chunk) for compressed_chunk in compressed_chunks)
+
+        # Decoded float32 chunks by chunk index, least recently used first
+        self.decoded_chunks = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_clip_samples(cls, samples, *args, **kwargs):
+        compressed_chunks = [compress_chunk(samples.data[start:start+chunk_size], samples.encoding) for start in range(0, len(samples), chunk_size)]
+        return cls(compressed_chunks, len(samples), samples.encoding)
+
+    def decompress(self, *args, **kwargs):
+        # The whole clip as ClipSamples
+        chunks = [decompress_chunk(compressed_chunk, self.encoding) for compressed_chunk in self.compressed_chunks]
+        if not chunks:
+            return ClipSamples.from_float(np.zeros(0, dtype=np.float32), self.encoding)
+        return ClipSamples(np.concatenate(chunks), self.encoding)
+
+    @property
+    def decoded_nbytes(self):
+        return sum(chunk.nbytes for chunk in list(self.decoded_chunks.values()))
+
+    @property
+    def nbytes(self):
+        return self.compressed_nbytes + self.decoded_nbytes
+
+    def clear_decoded(self, *args, **kwargs):
+        # Drop the decoded chunks, for example of a clip which the playhead has left
+        with self.lock:
+            self.decoded_chunks.clear()
+
+    def __len__(self):
+        return self.length
+
+    def decoded_chunk(self, chunk_ind, *args, **kwargs):
+        # Chunk as float32, decoded if it isn't one of the latest ones
+        with self.lock:
+            chunk = self.decoded_chunks.get(chunk_ind)
+            if chunk is not None:
+                self.decoded_chunks.move_to_end(chunk_ind)
+                return chunk
+
+        chunk = np.asarray(ClipSamples(decompress_chunk(self.compressed_chunks[chunk_ind], self.encoding), self.encoding))
+
+        with self.lock:
+            self.decoded_chunks[chunk_ind] = chunk
+            while len(self.decoded_chunks) > decoded_chunks_per_clip:
+                self.decoded_chunks.popitem(last=False)
+        return chunk
+
+    def decode(self, start, end, *args, **kwargs):
+        # Samples from start to end as float32, copied from the chunks they are in
+        samples = np.empty(max(end-start, 0), dtype=np.float32)
+        position = start
+        while position < end:
+            chunk_ind = position//chunk_size
+            chunk_start = chunk_ind*chunk_size
+            chunk = self.decoded_chunk(chunk_ind)
+            copy_end = min(end, chunk_start+len(chunk))
+            samples[position-start : copy_end-start] = chunk[position-chunk_start : copy_end-chunk_start]
+            position = copy_end
+        return samples
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, end, _ = key.indices(self.length)
+            return self.decode(start, max(start, end))
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None):
+        samples = self.decode(0, self.length)
+        return samples if dtype is None else samples.astype(dtype)
@@ -0,0 +1,141 @@
+# Project files
+from AudioBackend import input_underflow, input_overflow, output_underflow, output_overflow, priming_output
+
+# General Python imports
+import time
+import json
+import numpy as np
+
+# Global variables
+# Stages of playback_audio_callback, used as column indexes of DSPLoadMonitor.stage_times. Clips of buffers which ParallelMixer mixes serially
+# are timed as CLIP_GATHER. Threads gather clips while mixing, so in buffers mixed in parallel both are timed as MIXING.
+CLIP_GATHER = 0
+MIXING = 1
+PEQ_FILTERING = 2
+ANALYZER = 3
+METERING = 4
+stage_names = ['clip_gather', 'mixing', 'peq_filtering', 'analyzer', 'metering']
+
+# Status flags which are counted, in the order of DSPLoadMonitor.status_counts
+status_flags = [input_underflow, input_overflow, output_underflow, output_overflow, priming_output]
+status_flag_names = ['input_underflow', 'input_overflow', 'output_underflow', 'output_overflow', 'priming_output']
+
+# How many of the latest callbacks are kept
+callbacks_in_ring = 1024
+
+# Load histogram in percent of the deadline. Loads of 'histogram_maximum_load' percent or more go to the last bin.
+histogram_bin_width = 5
+histogram_maximum_load = 200
+
+
+class DSPLoadMonitor:
+
+    ########################################### Brief description ###########################################
+    # DSPLoadMonitor measures how much of its deadline playback_audio_callback uses. The deadline is the
+    # duration of the buffer being rendered. The callback calls begin_callback, mark_stage after each stage
+    # and end_callback, which store the wall time of each stage and the load of the whole callback to a ring
+    # of the latest callbacks, add the load to a histogram and count the status flags given by the device.
+    #
+    # All arrays are allocated on init, the audio thread only writes to them. The GUI thread reads a summary
+    # with get_summary for DSPLoadReadout and write_json dumps everything to a file. The callback count is
+    # increased only after a row has been written, so readers never see a half written row as the latest.
+    #########################################################################################################
+
+    def __init__(self, *args, **kwargs):
+        super(DSPLoadMonitor, self).__init__(*args, **kwargs)
+
+        # Ring of the latest callbacks. Stage times and total time are in seconds, load is the share of the deadline.
+        self.stage_times = np.zeros((callbacks_in_ring, len(stage_names)), dtype=np.float64)
+        self.total_times = np.zeros(callbacks_in_ring, dtype=np.float64)
+        self.loads = np.zeros(callbacks_in_ring, dtype=np.float64)
+
+        # Histogram of all loads since the last reset
+        self.load_histogram = np.zeros(histogram_maximum_load//histogram_bin_width + 1, dtype=np.int64)
+
+        # How many times each status flag has been set
+        self.status_counts = np.zeros(len(status_flags), dtype=np.int64)
+
+        # How many callbacks have rendered audio since the last reset. Callbacks outputting silence are only checked for status flags.
+        self.callback_count = 0
+
+        # Times of the callback being measured
+        self.row = 0
+        self.callback_start_time = 0.0
+        self.stage_start_time = 0.0
+
+    def reset(self, *args, **kwargs):
+        # Called from the GUI thread. Counts start from zero, the ring is simply overwritten.
+        self.load_histogram[:] = 0
+        self.status_counts[:] = 0
+        self.callback_count = 0
+
+    def count_status(self, status, *args, **kwargs):
+        # Called from the audio thread for every callback
+        if status:
+            for ind in range(0,len(status_flags)):
+                if status & status_flags[ind]:
+                    self.status_counts[ind] += 1
+
+    def begin_callback(self, *args, **kwargs):
+        # Called from the audio thread before the first stage
+        self.row = self.callback_count % callbacks_in_ring
+        self.stage_times[self.row] = 0
+        self.callback_start_time = time.perf_counter()
+        self.stage_start_time = self.callback_start_time
+
+    def mark_stage(self, stage, *args, **kwargs):
+        # Called from the audio thread when a stage ends. Time since the previous mark is added to the stage, so a stage can be marked more than once.
+        current_time = time.perf_counter()
+        self.stage_times[self.row, stage] += current_time - self.stage_start_time
+        self.stage_start_time = current_time
+
+    def end_callback(self, frame_count, fs, *args, **kwargs):
+        # Called from the audio thread after the last stage
+        total_time = time.perf_counter() - self.callback_start_time
+        load = total_time*fs/frame_count
+
+        self.total_times[self.row] = total_time
+        self.loads[self.row] = load
+        self.load_histogram[min(int(load*100)//histogram_bin_width, len(self.load_histogram)-1)] += 1
+
+        # Row is complete
+        self.callback_count += 1
+
+    def get_latest_rows(self, *args, **kwargs):
+        # Indexes of the rows in the ring from the oldest to the latest callback
+        callback_count = self.callback_count
+        row_count = min(callback_count, callbacks_in_ring)
+        return (np.arange(callback_count-row_count, callback_count) % callbacks_in_ring)
+
+    def get_summary(self, *args, **kwargs):
+        # Called from the GUI thread. Loads are in percent of the deadline and stage times in milliseconds, over the callbacks in the ring.
+        rows = self.get_latest_rows()
+        if len(rows) == 0:
+            return {'callbacks': 0, 'latest_load': 0.0, 'mean_load': 0.0, 'maximum_load': 0.0,
+                    'mean_stage_times_ms': dict.fromkeys(stage_names, 0.0),
+                    'status_counts': dict(zip(status_flag_names, self.status_counts.tolist()))}
+
+        loads = self.loads[rows]
+        mean_stage_times = np.mean(self.stage_times[rows], axis=0)*1000
+        return {'callbacks': self.callback_count,
+                'latest_load': float(loads[-1])*100,
+                'mean_load': float(np.mean(loads))*100,
+                'maximum_load': float(np.amax(loads))*100,
+                'mean_stage_times_ms': dict(zip(stage_names, mean_stage_times.tolist())),
+                'status_counts': dict(zip(status_flag_names, self.status_counts.tolist()))}
+
+    def write_json(self, path, extra_sections=None, *args, **kwargs):
+        # Dump the summary, the histogram and the callbacks in the ring to a JSON file. extra_sections are added as they are.
+        rows = self.get_latest_rows()
+        data = self.get_summary()
+        data.update(extra_sections or {})
+        data['load_histogram'] = {'bin_width_percent': histogram_bin_width,
+                                  'bin_starts_percent': list(range(0, histogram_maximum_load+1, histogram_bin_width)),
+                                  'counts': self.load_histogram.tolist()}
+        data['latest_callbacks'] = {'total_time_ms': (self.total_times[rows]*1000).tolist(),
+                                    'load_percent': (self.loads[rows]*100).tolist()}
+        for ind, name in enumerate(stage_names):
+            data['latest_callbacks'][name+'_ms'] = (self.stage_times[rows,ind]*1000).tolist()
+
+        with open(path, 'w') as json_file:
+            json.dump(data, json_file, indent=4)
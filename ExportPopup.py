@@ -0,0 +1,37 @@
+# Kivy imports
+from kivy.uix.popup import Popup
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.progressbar import ProgressBar
+from kivy.uix.button import Button
+
+
+class ExportPopup(Popup):
+
+    ########################################### Brief description ###########################################
+    # ExportPopup shows the progress of an export and has a button for cancelling it. MainView polls the
+    # export and sets the progress with set_progress. The popup can't be closed by pressing outside of it,
+    # it is dismissed by MainView when the export has ended.
+    #########################################################################################################
+
+    def __init__(self, title, cancel_callback, *args, **kwargs):
+        super(ExportPopup, self).__init__(**kwargs)
+
+        # Define size and title
+        self.size_hint = (0.4,0.2)
+        self.title = title
+        self.auto_dismiss = False
+
+        # Progress bar above the cancel button
+        layout = BoxLayout(orientation='vertical', spacing=10)
+        self.ProgressBar = ProgressBar(max=1, value=0)
+        layout.add_widget(self.ProgressBar)
+
+        self.CancelButton = Button(text="Cancel", size_hint=(1,0.5))
+        self.CancelButton.bind(on_release=lambda CancelButton : cancel_callback())
+        layout.add_widget(self.CancelButton)
+
+        self.add_widget(layout)
+
+    def set_progress(self, progress, *args, **kwargs):
+        # progress is from 0 to 1
+        self.ProgressBar.value = progress
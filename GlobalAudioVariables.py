@@ -1,4 +1,5 @@
 # Global variables for audio recording and playback
+# Sampling rate, buffer sizes and adaptive_playback_buffer are the defaults of AudioConfig (AudioConfig.py). Code which needs their current value reads 'audio_config'.
 
 sampling_rate = 44100
 samples_per_recording_buffer = 1024
@@ -6,4 +7,19 @@ samples_per_playback_buffer = 2048 # There were audible clicks at 1024, which is
 number_of_input_channels = 1 	   # No stereo recording available yet
 number_of_output_channels = 2 	   # Stereo output
 playback_buffer_time = samples_per_playback_buffer/sampling_rate # How much time does one samples_per_playback_buffer take (in seconds)
+samples_per_transport_fade = 256  # Length of the fade in and fade out when playback starts and stops, prevents clicks
 number_of_audio_filters = 10       # How many audio filters are available from PEQPopup, this can be as many as you like since filtering is done in the frequency domain and so the amount of computations is only dependent on the fft length
+audio_backend = 'auto'            # Audio device: 'pyaudio', 'sounddevice', 'null' (no hardware, buffers pulled at the pace of a sound card in the program), 'file' (like 'null' but writes audio_output_file and records audio_input_file) or 'auto' which picks the hardware backend with the lowest latency
+audio_output_file = None          # File the 'file' audio backend writes the output to, None throws it away
+audio_input_file = None           # File the 'file' audio backend records from, None records silence
+adaptive_playback_buffer = False  # Whether the playback buffer is grown after repeated overruns and shrunk when there is headroom
+mixer_threads = 0                 # Threads which mix Tracks in parallel in large sessions, 0 uses all cores but one
+recorded_clip_encoding = 'int24'  # How recordings are kept in memory and written: 'int16', 'int24', 'float16' or 'float32'
+imported_clip_encoding = 'float32' # How imported files which have to be resampled or mixed to mono are kept, 'float16' takes half the memory
+clip_cache_budget_in_MB = 4096    # Memory for the samples of SoundClips. Clips far from the playhead are evicted and read again from their files when needed.
+clip_prefetch_seconds = 10        # Clips which start within this many seconds of the playhead are loaded ahead and never evicted
+level_meter_mode = 'peak'         # What the LevelIndicators of Tracks and the output show: 'peak' or 'rms'
+playback_silence_threshold_in_dB = -80 # Blocks of SoundClips whose peaks are below this are skipped in playback. -80 dB is below the meter floor and inaudible, None skips only digital silence
+clip_compression = True           # Whether clips over the budget are first compressed without loss before they are evicted
+stem_export_processes = 0         # Worker processes which render stems in parallel, 0 uses all cores
+mixdown_formats = [('WAV', 'PCM_24', None), ('WAV', 'PCM_16', None), ('FLAC', 'PCM_24', None)] # (format, subtype, sampling rate or None for the session's) of each mixdown file, all written in one render
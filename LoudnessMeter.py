@@ -0,0 +1,249 @@
+# Project files
+from GlobalAudioVariables import *
+
+# General Python imports
+import math
+import queue
+import _thread
+import numpy as np
+import soundfile
+from scipy import signal
+
+# Global variables
+# Loudness is measured from 100 ms sub-blocks. Momentary loudness is the mean of the last 4 (400 ms) and short-term of the last 30 (3 s). Ref: ITU-R BS.1770-4 and EBU R 128.
+sub_block_time = 0.1
+sub_blocks_in_momentary = 4
+sub_blocks_in_short_term = 30
+
+# Gates used for integrated loudness, in LUFS and LU
+absolute_gate = -70
+relative_gate = -10
+
+# Oversampling factor and filter length for true peak detection. BS.1770-4 Annex 2 suggests 4x oversampling with a 48 tap filter for 44.1 and 48 kHz.
+true_peak_oversampling = 4
+true_peak_filter_taps = 48
+
+# How many output buffers can wait for LoudnessMeterTap before new ones are dropped
+tap_queue_size = 64
+
+# Value returned when there isn't enough audio for a measurement
+silence_in_dB = -math.inf
+
+
+def k_weighting_sos(fs):
+    # K-weighting filter as second order sections for sampling rate fs. The filter is a high shelf followed by a high pass. The analog prototype
+    # parameters are from the pyloudnorm implementation of BS.1770, which reproduce the 48 kHz coefficients of the standard at any sampling rate.
+
+    # Stage 1, high shelf modeling the acoustic effect of the head
+    f0 = 1681.974450955533
+    G = 3.999843853973347
+    Q = 0.7071752369554196
+    K = math.tan(math.pi*f0/fs)
+    Vh = 10**(G/20)
+    Vb = Vh**0.4996667741545416
+    a0 = 1 + K/Q + K**2
+    shelf = [(Vh + Vb*K/Q + K**2)/a0, 2*(K**2 - Vh)/a0, (Vh - Vb*K/Q + K**2)/a0,
+             1, 2*(K**2 - 1)/a0, (1 - K/Q + K**2)/a0]
+
+    # Stage 2, RLB high pass
+    f0 = 38.13547087602444
+    Q = 0.5003270373238773
+    K = math.tan(math.pi*f0/fs)
+    a0 = 1 + K/Q + K**2
+    high_pass = [1, -2, 1,
+                 1, 2*(K**2 - 1)/a0, (1 - K/Q + K**2)/a0]
+
+    return np.array([shelf, high_pass], dtype=np.float64)
+
+
+def power_to_loudness(power):
+    # Convert mean square power to LUFS. Works for single values and arrays.
+    with np.errstate(divide='ignore'):
+        return -0.691 + 10*np.log10(power)
+
+
+class LoudnessMeter:
+
+    ########################################### Brief description ###########################################
+    # LoudnessMeter measures momentary, short-term and integrated loudness (LUFS) and true peak (dBTP) of
+    # multichannel audio which is given block by block. Blocks can be any length, since the K-weighting and
+    # oversampling filters keep their state between blocks. The same object is used for the realtime output
+    # through LoudnessMeterTap and for measuring files with measure_file, which runs faster than realtime.
+    #########################################################################################################
+
+    def __init__(self, fs=sampling_rate, channels=number_of_output_channels, *args, **kwargs):
+        super(LoudnessMeter, self).__init__(*args, **kwargs)
+
+        self.fs = fs
+        self.channels = channels
+
+        # K-weighting filter
+        self.sos = k_weighting_sos(fs)
+
+        # Interpolation filter for true peak. Gain is multiplied by the oversampling factor since zeros are inserted between samples.
+        self.true_peak_filter = signal.firwin(true_peak_filter_taps, 1/true_peak_oversampling) * true_peak_oversampling
+
+        # Samples in a 100 ms sub-block
+        self.sub_block_length = int(round(sub_block_time*fs))
+
+        self.reset()
+
+    def reset(self, *args, **kwargs):
+        # Filter states, shape (sections, 2, channels) since filtering is done along axis 0 of (samples, channels) blocks
+        self.zi = np.zeros((len(self.sos), 2, self.channels), dtype=np.float64)
+
+        # Previous input samples needed by the interpolation filter of the next block
+        self.true_peak_history = np.zeros((true_peak_filter_taps//true_peak_oversampling, self.channels), dtype=np.float64)
+
+        # Sum of squared K-weighted samples in the sub-block being filled
+        self.sub_block_sum = 0.0
+        self.sub_block_fill = 0
+
+        # Mean square powers of the latest sub-blocks as a circular buffer
+        self.sub_block_powers = np.zeros(sub_blocks_in_short_term, dtype=np.float64)
+        self.sub_block_count = 0
+
+        # Powers of all 400 ms gating blocks, used for integrated loudness
+        self.gating_block_powers = []
+
+        # Latest results
+        self.momentary_loudness = silence_in_dB
+        self.short_term_loudness = silence_in_dB
+        self.true_peak = silence_in_dB
+
+    def process(self, block, *args, **kwargs):
+        # block has shape (samples, channels) or (samples,) for mono
+        block = np.asarray(block, dtype=np.float64).reshape(len(block), -1)
+
+        # True peak of the 4x oversampled block. The history in front of the block makes the interpolation continue over block edges.
+        history_length = len(self.true_peak_history)
+        extended_block = np.concatenate((self.true_peak_history, block), axis=0)
+        oversampled = signal.upfirdn(self.true_peak_filter, extended_block, up=true_peak_oversampling, axis=0)
+        oversampled = oversampled[history_length*true_peak_oversampling : (history_length+len(block))*true_peak_oversampling]
+        self.true_peak_history = extended_block[-history_length:]
+
+        # The sample peak is included as well, true peak is never lower than it
+        block_peak = max(np.amax(np.absolute(oversampled), initial=0), np.amax(np.absolute(block), initial=0))
+        if block_peak > 0:
+            self.true_peak = max(self.true_peak, 20*math.log10(block_peak))
+
+        # K-weighting and summing squared channels. All channels have weight 1, which is the case for left and right.
+        weighted, self.zi = signal.sosfilt(self.sos, block, axis=0, zi=self.zi)
+        squares = np.sum(np.square(weighted), axis=1)
+
+        # Fill sub-blocks. There is a loop only for the sub-block edges, the samples are summed with NumPy.
+        position = 0
+        while position < len(squares):
+            samples_to_take = min(self.sub_block_length-self.sub_block_fill, len(squares)-position)
+            self.sub_block_sum += float(np.sum(squares[position:position+samples_to_take]))
+            self.sub_block_fill += samples_to_take
+            position += samples_to_take
+
+            if self.sub_block_fill == self.sub_block_length:
+                self.finish_sub_block()
+
+    def finish_sub_block(self, *args, **kwargs):
+        # Store the sub-block's mean square power and start a new sub-block
+        self.sub_block_powers[self.sub_block_count % sub_blocks_in_short_term] = self.sub_block_sum/self.sub_block_length
+        self.sub_block_count += 1
+        self.sub_block_sum = 0.0
+        self.sub_block_fill = 0
+
+        # Momentary loudness. Every 400 ms window, overlapping by 75%, is also a gating block for integrated loudness.
+        if self.sub_block_count >= sub_blocks_in_momentary:
+            latest = [(self.sub_block_count-1-ind) % sub_blocks_in_short_term for ind in range(0,sub_blocks_in_momentary)]
+            momentary_power = float(np.mean(self.sub_block_powers[latest]))
+            self.gating_block_powers.append(momentary_power)
+            self.momentary_loudness = float(power_to_loudness(momentary_power))
+
+        # Short-term loudness
+        if self.sub_block_count >= sub_blocks_in_short_term:
+            self.short_term_loudness = float(power_to_loudness(np.mean(self.sub_block_powers)))
+
+    def integrated_loudness(self, *args, **kwargs):
+        # Gated mean of all gating blocks so far
+        powers = np.array(self.gating_block_powers, dtype=np.float64)
+
+        # Absolute gate
+        powers = powers[power_to_loudness(powers) > absolute_gate]
+        if len(powers) == 0:
+            return silence_in_dB
+
+        # Relative gate, 10 LU below the loudness of the blocks above the absolute gate
+        relative_threshold = power_to_loudness(np.mean(powers)) + relative_gate
+        powers = powers[power_to_loudness(powers) > relative_threshold]
+        if len(powers) == 0:
+            return silence_in_dB
+
+        return float(power_to_loudness(np.mean(powers)))
+
+    def get_results(self, *args, **kwargs):
+        # All measurements in one dictionary
+        return {'momentary_LUFS': self.momentary_loudness,
+                'short_term_LUFS': self.short_term_loudness,
+                'integrated_LUFS': self.integrated_loudness(),
+                'true_peak_dBTP': self.true_peak}
+
+
+class LoudnessMeterTap:
+
+    ########################################### Brief description ###########################################
+    # LoudnessMeterTap runs a LoudnessMeter in its own thread. The audio thread only puts its output buffers
+    # to a queue with push, which never blocks. If the meter thread falls behind, buffers are dropped rather
+    # than delaying the audio, and the amount of dropped buffers is counted.
+    #########################################################################################################
+
+    def __init__(self, LoudnessMeter, *args, **kwargs):
+        super(LoudnessMeterTap, self).__init__(*args, **kwargs)
+
+        self.LoudnessMeter = LoudnessMeter
+        self.buffer_queue = queue.Queue(maxsize=tap_queue_size)
+        self.dropped_buffers = 0
+
+        # Bool for the measuring loop, like Track.receiving_audio
+        self.measuring = False
+
+        # Set when the meter should be reset. The reset is done by the meter thread so it never happens in the middle of a block.
+        self.reset_requested = False
+
+    def start(self, *args, **kwargs):
+        if not self.measuring:
+            self.measuring = True
+            _thread.start_new_thread(self.measuring_process, ())
+
+    def stop(self, *args, **kwargs):
+        self.measuring = False
+
+    def reset(self, *args, **kwargs):
+        self.reset_requested = True
+
+    def push(self, output_buffer, *args, **kwargs):
+        # Called from the audio thread. The buffer isn't copied, so it must not be modified after pushing.
+        try:
+            self.buffer_queue.put_nowait(output_buffer)
+        except queue.Full:
+            self.dropped_buffers += 1
+
+    def measuring_process(self, *args, **kwargs):
+        while self.measuring:
+            try:
+                output_buffer = self.buffer_queue.get(timeout=0.1)
+            except queue.Empty:
+                output_buffer = None
+
+            if self.reset_requested:
+                self.LoudnessMeter.reset()
+                self.reset_requested = False
+
+            if output_buffer is not None:
+                self.LoudnessMeter.process(output_buffer)
+
+
+def measure_file(path, block_size=65536, *args, **kwargs):
+    # Measure an audio file offline. Blocks are read and measured one at a time, so memory use doesn't depend on the length of the file.
+    with soundfile.SoundFile(path) as audio_file:
+        meter = LoudnessMeter(audio_file.samplerate, audio_file.channels)
+        for block in audio_file.blocks(blocksize=block_size, dtype='float64', always_2d=True):
+            meter.process(block)
+
+    return meter.get_results()
@@ -0,0 +1,95 @@
+# General Python imports
+import numpy as np
+
+# Global variables
+# Column indexes of MeterEngine.levels
+PEAK = 0
+RMS = 1
+
+# Levels at or below this are not shown. Matches LevelIndicator's minimum.
+level_floor_in_dB = -80
+
+# Peak meter fall back. Levels rise instantly and fall 20 dB in 1.7 seconds, which is the fall back time of a digital peak programme meter.
+release_in_dB_per_second = 20/1.7
+
+
+class MeterEngine:
+
+    ########################################### Brief description ###########################################
+    # MeterEngine holds the levels of the master output and all Tracks in one NumPy array. The audio thread
+    # writes peak and RMS values of each played buffer with write_levels, which is a single vectorized
+    # reduction over all Track buffers and never touches Kivy objects. The GUI thread reads the levels with
+    # read_levels_in_dB at display rate, which applies the meter ballistics to all meters at once. The
+    # LevelIndicators show the peaks or the RMS values by meter_mode, 'level_meter_mode' in
+    # GlobalAudioVariables.py by default, and both are always written so the mode can be changed any time.
+    #
+    # Row 0 is the master output and row N+1 is TrackContainer.Tracks[N]. Values written between two reads
+    # are combined by keeping the larger value, so short peaks are not lost when buffers are shorter than a
+    # display frame. A read zeroes only the values it read, so values written during the read aren't lost.
+    #########################################################################################################
+
+    def __init__(self, meter_mode='peak', *args, **kwargs):
+        super(MeterEngine, self).__init__(*args, **kwargs)
+
+        # Column of levels which read_levels_in_dB returns, 'peak' or 'rms'
+        self.meter_mode = meter_mode
+
+        # Linear (peak, RMS) values written by the audio thread. Only the master meter exists on init.
+        self.levels = np.zeros((1,2), dtype=np.float32)
+
+        # Levels of meter_mode in dB after ballistics, one per meter
+        self.displayed_levels_in_dB = np.full(1, level_floor_in_dB-1, dtype=np.float32)
+
+    def set_meter_count(self, meter_count, *args, **kwargs):
+        # Called from the GUI thread. The arrays are replaced rather than resized, so the audio thread keeps writing to a complete array.
+        if meter_count == len(self.levels):
+            return
+
+        levels = np.zeros((meter_count,2), dtype=np.float32)
+        displayed_levels_in_dB = np.full(meter_count, level_floor_in_dB-1, dtype=np.float32)
+
+        # Keep the existing values of meters which remain
+        kept_meters = min(meter_count, len(self.levels))
+        levels[0:kept_meters] = self.levels[0:kept_meters]
+        displayed_levels_in_dB[0:kept_meters] = self.displayed_levels_in_dB[0:kept_meters]
+
+        self.levels = levels
+        self.displayed_levels_in_dB = displayed_levels_in_dB
+
+    def write_levels(self, track_buffers, output_buffer, *args, **kwargs):
+        # Called from the audio thread. track_buffers has shape (Tracks, samples) and output_buffer (samples, channels).
+        levels = self.levels # Local reference in case the GUI thread replaces the array
+
+        # Tracks which were added after the last set_meter_count are not written yet
+        track_count = min(len(track_buffers), len(levels)-1)
+        track_buffers = track_buffers[0:track_count]
+
+        # Peak and RMS of every Track in one reduction
+        np.maximum(levels[1:track_count+1,PEAK], np.amax(np.absolute(track_buffers), axis=1, initial=0), out=levels[1:track_count+1,PEAK])
+        np.maximum(levels[1:track_count+1,RMS], np.sqrt(np.mean(np.square(track_buffers), axis=1)), out=levels[1:track_count+1,RMS])
+
+        # Master output over all channels
+        levels[0,PEAK] = max(levels[0,PEAK], np.amax(np.absolute(output_buffer), initial=0))
+        levels[0,RMS] = max(levels[0,RMS], np.sqrt(np.mean(np.square(output_buffer))))
+
+    def read_levels_in_dB(self, time_since_last_read, *args, **kwargs):
+        # Called from the GUI thread. Take the values written since the last read and start collecting new ones.
+        # The audio thread may raise a value between the copy and the reset, so only the values which are still the ones read are zeroed
+        levels = self.levels
+        read_levels = levels.copy()
+        np.copyto(levels, 0, where=levels <= read_levels)
+        new_levels = read_levels[:,RMS if self.meter_mode == 'rms' else PEAK]
+
+        # Convert to dB. Values below the floor are forced below the floor so the meters are hidden.
+        new_levels_in_dB = np.full(new_levels.shape, level_floor_in_dB-1, dtype=np.float32)
+        audible = new_levels > 10**(level_floor_in_dB/20)
+        new_levels_in_dB[audible] = 20*np.log10(new_levels[audible])
+
+        # Ballistics: new levels are shown instantly, lower levels fall back at a constant rate
+        fallen_levels_in_dB = self.displayed_levels_in_dB - release_in_dB_per_second*time_since_last_read
+        self.displayed_levels_in_dB = np.maximum(new_levels_in_dB, fallen_levels_in_dB)
+
+        # Keep fallen meters right below the floor instead of falling forever
+        np.maximum(self.displayed_levels_in_dB, level_floor_in_dB-1, out=self.displayed_levels_in_dB)
+
+        return self.displayed_levels_in_dB
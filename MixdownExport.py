@@ -0,0 +1,270 @@
+# Project files
+from Mixer import gather_clips, apply_track_eqs, mix_to_stereo
+from OverlapAddFilter import OverlapAddFilter, BatchedOverlapAddFilter
+from LoudnessMeter import LoudnessMeter
+from ClipCache import CachedSamples
+
+# General Python imports
+import os
+import threading
+import fractions
+import numpy as np
+import soundfile
+from scipy import signal
+
+# Global variables
+# Resampling filter like scipy.signal.resample_poly's: half length in taps per rate step and the Kaiser window's beta
+resampling_half_length = 10
+resampling_kaiser_beta = 5.0
+
+# Full scale of each integer subtype in steps. PCM_24 is written as int32 with the samples in the top three bytes, like soundfile reads it.
+subtype_full_scales = {'PCM_16': 2**15, 'PCM_24': 2**23, 'PCM_32': 2**31}
+
+# Subtypes each container can hold
+format_subtypes = {'WAV': ('PCM_16', 'PCM_24', 'PCM_32', 'FLOAT'), 'FLAC': ('PCM_16', 'PCM_24')}
+
+
+class StreamingResampler:
+
+    ########################################### Brief description ###########################################
+    # StreamingResampler changes the sampling rate of a stream of (samples, channels) blocks by a rational
+    # factor with the same polyphase filter as scipy.signal.resample_poly, and gives the same result as
+    # resample_poly of the whole signal. Only the inputs which later outputs still need are kept between
+    # blocks, so memory doesn't depend on the length of the stream. The filter's delay is removed and
+    # finish returns the last outputs.
+    #
+    # The kept inputs always start at a multiple of down, so the outputs of upfirdn over them line up with
+    # the outputs of the whole stream.
+    #########################################################################################################
+
+    def __init__(self, fs_in, fs_out, channels, *args, **kwargs):
+        super(StreamingResampler, self).__init__(*args, **kwargs)
+
+        ratio = fractions.Fraction(int(fs_out), int(fs_in))
+        self.up = ratio.numerator
+        self.down = ratio.denominator
+
+        # Filter padded in front so its delay is a whole number of outputs, which are skipped
+        max_rate = max(self.up, self.down)
+        half_length = resampling_half_length*max_rate
+        pre_pad = self.down - half_length % self.down
+        self.filter = np.concatenate((np.zeros(pre_pad), signal.firwin(2*half_length+1, 1/max_rate, window=('kaiser', resampling_kaiser_beta))*self.up))
+        self.skipped_outputs = (half_length+pre_pad)//self.down
+
+        # Inputs which are still needed and the index of the first of them in the stream
+        self.history = np.zeros((0,channels))
+        self.history_start = 0
+
+        # Inputs given and outputs of the padded filter which have been calculated, including the skipped ones
+        self.input_count = 0
+        self.raw_output_count = 0
+
+    def resample(self, block, *args, **kwargs):
+        # Outputs which the inputs so far fully determine. An output depends only on inputs at or before its own time.
+        inputs = np.concatenate((self.history, block), axis=0)
+        input_end = self.history_start+len(inputs)
+        raw_output_end = ((input_end-1)*self.up)//self.down+1 if input_end else 0
+
+        output_offset = self.history_start*self.up//self.down
+        raw_outputs = signal.upfirdn(self.filter, inputs, self.up, self.down, axis=0)[self.raw_output_count-output_offset : raw_output_end-output_offset]
+
+        # Drop the outputs before the filter's delay
+        skip = max(self.skipped_outputs-self.raw_output_count, 0)
+        self.raw_output_count = max(raw_output_end, self.raw_output_count)
+
+        # Keep the inputs which the next output needs, from a multiple of down
+        needed_start = max((self.raw_output_count*self.down-len(self.filter)+1)//self.up, 0)
+        needed_start = min(needed_start//self.down*self.down, input_end)
+        self.history = inputs[needed_start-self.history_start:]
+        self.history_start = needed_start
+
+        return raw_outputs[skip:]
+
+    def process(self, block, *args, **kwargs):
+        block = np.asarray(block, dtype=np.float64)
+        self.input_count += len(block)
+        return self.resample(block)
+
+    def finish(self, *args, **kwargs):
+        # The rest of the outputs, which are calculated with silence after the stream. The stream has ceil(inputs*up/down) outputs like with resample_poly.
+        output_count = -(-self.input_count*self.up//self.down)
+        raw_output_target = output_count+self.skipped_outputs
+        needed_inputs = -(-(raw_output_target-1)*self.down//self.up)+1
+        padding = max(needed_inputs-(self.history_start+len(self.history)), 0)
+        outputs = self.resample(np.zeros((padding,self.history.shape[1])))
+        return outputs[0:max(len(outputs)-(self.raw_output_count-raw_output_target), 0)]
+
+
+class MixdownTarget:
+
+    ########################################### Brief description ###########################################
+    # MixdownTarget is one file of a mixdown: container, subtype and sampling rate. Blocks of the mix are
+    # resampled if the sampling rate differs from the mix, and converted to integers here instead of by
+    # libsndfile, so they are rounded and clipped, and dithered with TPDF noise of one step if dither is
+    # on. Dither is left out of float and 32-bit files, where it would be far below the noise of the mix.
+    #########################################################################################################
+
+    def __init__(self, path, file_format='WAV', subtype='PCM_24', sampling_rate=None, dither=True, *args, **kwargs):
+        super(MixdownTarget, self).__init__(*args, **kwargs)
+
+        if subtype not in format_subtypes.get(file_format, ()):
+            raise ValueError("{} files can't be written as {}".format(file_format, subtype))
+
+        self.path = path
+        self.file_format = file_format
+        self.subtype = subtype
+        self.sampling_rate = sampling_rate
+        self.dither = dither and subtype in ('PCM_16', 'PCM_24')
+
+        # Opened by open, when the sampling rate of the mix is known
+        self.audio_file = None
+        self.StreamingResampler = None
+        self.random_generator = np.random.default_rng()
+
+    def open(self, fs, channels, *args, **kwargs):
+        if self.sampling_rate is None:
+            self.sampling_rate = fs
+        if self.sampling_rate != fs:
+            self.StreamingResampler = StreamingResampler(fs, self.sampling_rate, channels)
+        self.audio_file = soundfile.SoundFile(self.path, 'w', self.sampling_rate, channels, self.subtype, format=self.file_format)
+
+    def quantize(self, block, *args, **kwargs):
+        # Float block in the form the file is written from
+        if self.subtype == 'FLOAT':
+            return block.astype(np.float32)
+
+        full_scale = subtype_full_scales[self.subtype]
+        steps = block*full_scale
+        if self.dither:
+            steps += self.random_generator.random(steps.shape)-self.random_generator.random(steps.shape)
+        samples = np.clip(np.round(steps), -full_scale, full_scale-1)
+
+        if self.subtype == 'PCM_16':
+            return samples.astype(np.int16)
+        elif self.subtype == 'PCM_24':
+            return samples.astype(np.int32)*2**8
+        return samples.astype(np.int32)
+
+    def write(self, block, *args, **kwargs):
+        if self.StreamingResampler:
+            block = self.StreamingResampler.process(block)
+        if len(block):
+            self.audio_file.write(self.quantize(block))
+
+    def close(self, *args, **kwargs):
+        # Write the end of the resampled stream and close the file
+        if self.StreamingResampler:
+            block = self.StreamingResampler.finish()
+            if len(block):
+                self.audio_file.write(self.quantize(block))
+        self.audio_file.close()
+
+    def remove(self, *args, **kwargs):
+        # Close and delete an unfinished file
+        self.audio_file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def render_mix(snapshot, buffer_start_sample, TrackEQFilter, output_filter, output_buffer):
+    # Mix one buffer of a SessionSnapshot to output_buffer like the playback callback: clips, Track EQs, gains and pans, the master gain and
+    # the output EQ. Clips which ClipCache has evicted are loaded, so nothing is rendered as silence. Only the clips overlapping the buffer
+    # are loaded, so ClipCache keeps its budget however long the session is.
+    frame_count = len(output_buffer)
+    track_clips = tuple(tuple((start_sample, samples.load() if isinstance(samples, CachedSamples) else samples, regions)
+                              for start_sample, samples, regions in clips
+                              if start_sample < buffer_start_sample+frame_count and start_sample+len(samples) > buffer_start_sample)
+                        for clips in snapshot.track_clips)
+
+    track_buffers = np.zeros((len(track_clips),frame_count), dtype=np.float32)
+    gather_clips(track_buffers, track_clips, buffer_start_sample)
+    apply_track_eqs(TrackEQFilter, track_buffers, snapshot.track_eqs)
+    mix_to_stereo(track_buffers, snapshot.track_gains, snapshot.track_pans, output_buffer)
+    output_buffer *= snapshot.master_gain
+
+    if output_filter:
+        output_buffer[:,0] = output_filter.filter_audio(output_buffer[:,0], 0)
+        output_buffer[:,1] = output_filter.filter_audio(output_buffer[:,1], 1)
+
+
+class MixdownExport:
+
+    ########################################### Brief description ###########################################
+    # MixdownExport renders the mix of a SessionSnapshot once, one buffer at a time, and streams each
+    # buffer to all of its MixdownTargets, so a delivery set of several formats and sampling rates costs one
+    # render. Nothing longer than a buffer is kept, so memory doesn't depend on the length of the session.
+    # The mix is measured with LoudnessMeter on the way, and the results are in loudness when it's done.
+    #
+    # Rendering runs in MixdownExport's own thread with its own filters, so playback isn't disturbed. The
+    # GUI polls get_progress and may cancel, which removes the unfinished files. status is 'running',
+    # 'done', 'cancelled' or 'failed', in which case error has the exception.
+    #########################################################################################################
+
+    def __init__(self, snapshot, targets, length_in_samples, buffer_size, fs, master_response=None, *args, **kwargs):
+        super(MixdownExport, self).__init__(*args, **kwargs)
+
+        self.snapshot = snapshot
+        self.targets = targets
+        self.length_in_samples = length_in_samples
+        self.buffer_size = buffer_size
+        self.fs = fs
+        self.master_response = master_response
+
+        self.rendered_samples = 0
+        self.loudness = None
+        self.status = 'running'
+        self.error = None
+
+        self.cancelled = False
+        self.thread = threading.Thread(target=self.export_process, daemon=True)
+        self.thread.start()
+
+    def cancel(self, *args, **kwargs):
+        self.cancelled = True
+
+    def get_progress(self, *args, **kwargs):
+        return min(self.rendered_samples/self.length_in_samples, 1.0) if self.length_in_samples else 1.0
+
+    def export_process(self, *args, **kwargs):
+        opened_targets = []
+        try:
+            for target in self.targets:
+                target.open(self.fs, 2)
+                opened_targets.append(target)
+
+            TrackEQFilter = BatchedOverlapAddFilter()
+            output_filter = None
+            if self.master_response is not None:
+                output_filter = OverlapAddFilter(self.buffer_size, 2)
+                output_filter.complete_complex_response = self.master_response
+            meter = LoudnessMeter(self.fs, 2)
+
+            output_buffer = np.zeros((self.buffer_size,2), dtype=np.float32)
+            for buffer_start_sample in range(0, self.length_in_samples, self.buffer_size):
+                if self.cancelled:
+                    break
+
+                render_mix(self.snapshot, buffer_start_sample, TrackEQFilter, output_filter, output_buffer)
+                block = output_buffer[0:min(self.buffer_size, self.length_in_samples-buffer_start_sample)].astype(np.float64)
+                meter.process(block)
+                for target in self.targets:
+                    target.write(block)
+                self.rendered_samples = buffer_start_sample+len(block)
+
+        except Exception as error:
+            for target in opened_targets:
+                target.remove()
+            self.error = error
+            self.status = 'failed'
+            return
+
+        if self.cancelled:
+            for target in opened_targets:
+                target.remove()
+            self.status = 'cancelled'
+            return
+
+        for target in self.targets:
+            target.close()
+        self.loudness = meter.get_results()
+        self.status = 'done'
@@ -0,0 +1,277 @@
+# Project files
+from OverlapAddFilter import BatchedOverlapAddFilter
+
+# General Python imports
+import os
+import bisect
+import threading
+import queue
+import numpy as np
+
+# Global variables
+# Parallel mixing is used only when the estimated cost of a buffer from clip_cost is at least this much per thread. Below it handing the work to
+# a thread costs more than it saves. Measured with the crossover case of benchmarks/run_benchmarks.py, see benchmarks/README.md.
+minimum_cost_per_mixer_thread = 32768
+
+# Estimated cost of filtering a Track's EQ compared to gathering one buffer of clip samples
+eq_cost_in_buffers = 8
+
+
+############################### Mixer ###############################
+# The mixer works on plain NumPy arrays, so it can be run without Kivy. MainView collects the clips and settings of the Tracks and
+# calls these once per playback buffer.
+
+
+def region_edges(regions):
+    # Silence map in the form gather_clips takes it: the (start, end) rows of WaveformPeaks.sounding_regions flattened to one tuple of
+    # Python ints, start0, end0, start1, end1, ... It is searched with bisect, which costs much less per buffer than a NumPy search.
+    if regions is None:
+        return None
+    return tuple(np.asarray(regions, dtype=np.int64).reshape(-1).tolist())
+
+
+def gather_clips(track_buffers, track_clips, buffer_start_sample):
+    # Sum the audio of each Track's clips which overlaps this buffer to the Track's row of track_buffers, which has shape (Tracks, samples).
+    # track_clips[N] is a list of (start_sample, samples, regions) of Track N. A Track which isn't played has an empty list, so its row stays silent.
+    # regions is the silence map of the clip from region_edges: the edges of the sample ranges in the clip which are played. Silent blocks in
+    # between are skipped. With regions None the whole clip is played.
+    frame_count = track_buffers.shape[1]
+
+    for ind, clips in enumerate(track_clips):
+        for start_sample, samples, regions in clips:
+
+            # Overlapping area of this buffer and the clip in samples. This covers clips starting, ending or continuing in this buffer.
+            overlap_start = max(buffer_start_sample, start_sample)
+            overlap_end = min(buffer_start_sample+frame_count, start_sample+len(samples))
+            if overlap_start >= overlap_end:
+                continue
+
+            # Sum the overlapping audio to the Track's row
+            if regions is None:
+                track_buffers[ind, overlap_start-buffer_start_sample : overlap_end-buffer_start_sample] += samples[overlap_start-start_sample : overlap_end-start_sample]
+                continue
+
+            # Only the regions which overlap the buffer. Edges are in order, so the first region ending after the overlap starts and the
+            # regions starting before it ends are found by binary search. Buffers in silence have none.
+            first_region = bisect.bisect_right(regions, overlap_start-start_sample)//2
+            last_region = (bisect.bisect_left(regions, overlap_end-start_sample)+1)//2
+            for region_ind in range(first_region, last_region):
+                region_start = max(regions[2*region_ind]+start_sample, overlap_start)
+                region_end = min(regions[2*region_ind+1]+start_sample, overlap_end)
+                track_buffers[ind, region_start-buffer_start_sample : region_end-buffer_start_sample] += samples[region_start-start_sample : region_end-start_sample]
+
+
+def mix_to_stereo(track_buffers, track_gains, track_pans, output_buffer):
+    # Apply all Tracks' volumes at once. Level indicators have to use the Track rows to get the individual Track levels, so the gains are applied in place.
+    track_buffers *= track_gains.reshape(len(track_gains),1)
+
+    # Pan and sum all Tracks to the left and right channels of output_buffer, shape (samples, 2), with one matrix product each. Pan 0 is left and 1 is right.
+    output_buffer[:,0] = np.dot(1-track_pans, track_buffers)
+    output_buffer[:,1] = np.dot(track_pans, track_buffers)
+
+
+def gather_tracks(track_buffers, track_clips, track_renders, buffer_start_sample):
+    # Like gather_clips, but Tracks which have a ready TrackRender are copied from it, so a Track costs the same however many clips it has.
+    # track_renders has a (TrackRender, version) pair or None per Track. The clips of the rest of the Tracks are gathered.
+    clips_to_gather = list(track_clips)
+    for ind, track_render in enumerate(track_renders):
+        if track_render is not None and track_render[0].read(track_buffers[ind], buffer_start_sample, track_render[1]):
+            clips_to_gather[ind] = ()
+
+    gather_clips(track_buffers, clips_to_gather, buffer_start_sample)
+
+
+def apply_track_eqs(BatchedOverlapAddFilter, track_buffers, track_eqs):
+    # Filter the rows of Tracks which have an EQ, all in one batch. track_eqs has a (track_id, eq_response) pair or None per row. Rows
+    # without an EQ aren't touched. Responses which don't match the buffer size, which happens for a moment when it changes, are skipped.
+    bin_count = track_buffers.shape[1]//2+1
+    eq_inds = [ind for ind, track_eq in enumerate(track_eqs) if track_eq is not None and len(track_eq[1]) == bin_count]
+    if not eq_inds:
+        return
+
+    track_buffers[eq_inds] = BatchedOverlapAddFilter.filter_rows(track_buffers[eq_inds],
+                                                                 [track_eqs[ind][0] for ind in eq_inds],
+                                                                 np.array([track_eqs[ind][1] for ind in eq_inds]))
+
+
+def clip_cost(track_clips, track_eqs, track_renders, buffer_start_sample, frame_count):
+    # Estimated cost of each Track for this buffer: the amount of clip samples which overlap the buffer plus a buffer's worth of gain and pan work.
+    # An EQ filters three windowed sections of the buffer, which is counted as eq_cost_in_buffers buffers. A Track with a ready render costs one copy.
+    costs = np.full(len(track_clips), frame_count, dtype=np.int64)
+    for ind, track_eq in enumerate(track_eqs):
+        if track_eq is not None:
+            costs[ind] += eq_cost_in_buffers*frame_count
+
+    buffer_end_sample = buffer_start_sample+frame_count
+
+    for ind, clips in enumerate(track_clips):
+        if track_renders[ind] is not None and track_renders[ind][0].rendered_version == track_renders[ind][1]:
+            costs[ind] += frame_count
+            continue
+
+        for start_sample, samples, regions in clips:
+            costs[ind] += max(0, min(buffer_end_sample, start_sample+len(samples)) - max(buffer_start_sample, start_sample))
+
+    return costs
+
+
+def partition_tracks(costs, partition_count):
+    # Split the Tracks into partition_count contiguous (start, end) ranges of Track indexes with about equal total cost. Ranges of rows are views
+    # of track_buffers, so the threads work on the rows in place without copying them. Each range ends where the running cost passes its share.
+    cumulative_costs = np.cumsum(costs)
+    shares = cumulative_costs[-1]*np.arange(1,partition_count)/partition_count
+    ends = np.searchsorted(cumulative_costs, shares, side='right').tolist()+[len(costs)]
+
+    # Every partition has at least one Track, so a single very costly Track doesn't leave a partition empty
+    partitions = []
+    start = 0
+    for partition_ind, end in enumerate(ends):
+        end = min(max(end, start+1), len(costs)-(partition_count-1-partition_ind))
+        partitions.append((start, end))
+        start = end
+
+    return partitions
+
+
+class ParallelMixer:
+
+    ########################################### Brief description ###########################################
+    # ParallelMixer splits the per-Track work of a buffer, gathering clips or reading renders, EQ and gain and pan, between
+    # the calling audio thread and a pool of worker threads which are started once and wait between buffers.
+    # Tracks are split to contiguous ranges of about equal estimated cost in this buffer, so a few long
+    # overlapping clips or EQs don't all end up in the same thread and each thread works on a view of its
+    # rows without copying them. The EQs of a thread's Tracks are filtered as one batch. Each thread sums its Tracks to its own stereo bus and the calling thread
+    # adds the buses together. Threads only write to their own Track rows and bus, so no locks are needed.
+    #
+    # The heavy work is NumPy additions, multiplications and matrix products, which release the GIL, so the
+    # threads run on separate cores, but the slicing of each clip in gather_clips holds it and every thread
+    # costs a hand-off per buffer. Buffers whose cost is below minimum_cost_per_mixer_thread per thread are
+    # mixed serially in the calling thread.
+    #########################################################################################################
+
+    def __init__(self, thread_count=0, minimum_cost_per_thread=minimum_cost_per_mixer_thread, *args, **kwargs):
+        super(ParallelMixer, self).__init__(*args, **kwargs)
+
+        # 0 uses all cores but one, which is left for the GUI. The calling thread is one of the mixing threads.
+        if thread_count <= 0:
+            thread_count = max((os.cpu_count() or 1)-1, 1)
+        self.thread_count = thread_count
+
+        # Buffers which cost less than this per thread are mixed serially. Benchmarks set 0 to measure the threads at any cost.
+        self.minimum_cost_per_thread = minimum_cost_per_thread
+
+        # Filter state of Track EQs. Threads filter different Tracks, so they never touch the same key.
+        self.BatchedOverlapAddFilter = BatchedOverlapAddFilter()
+
+        # Work of the current buffer, set by mix before the workers are started
+        self.track_buffers = None
+        self.track_clips = None
+        self.track_gains = None
+        self.track_pans = None
+        self.track_eqs = None
+        self.track_renders = None
+        self.buffer_start_sample = 0
+        self.partitions = []
+
+        # Stereo bus of each thread, reallocated when the buffer size changes
+        self.buses = np.zeros((thread_count,0,2), dtype=np.float32)
+
+        # Each worker waits for its own event. Finished workers put their index, or the exception they raised, to done_queue.
+        self.start_events = [threading.Event() for ind in range(1,thread_count)]
+        self.done_queue = queue.Queue()
+
+        # Bool for the worker loops
+        self.running = True
+        for worker_ind in range(1,thread_count):
+            threading.Thread(target=self.worker_process, args=(worker_ind,), daemon=True).start()
+
+    def stop(self, *args, **kwargs):
+        # Let the workers exit their loops
+        self.running = False
+        for start_event in self.start_events:
+            start_event.set()
+
+    def reset_filter_state(self, *args, **kwargs):
+        # Forget the previous buffers of Track EQs, called when playback starts and when the buffer size changes
+        self.BatchedOverlapAddFilter.reset()
+
+    def mix(self, track_buffers, track_clips, track_gains, track_pans, buffer_start_sample, output_buffer, track_eqs=None, track_renders=None, gathered_callback=None, *args, **kwargs):
+        # Same result as gather_tracks, apply_track_eqs and mix_to_stereo. track_buffers has the Tracks' rows with EQs and gains applied afterwards.
+        # gathered_callback is called when the clips have been gathered in a serially mixed buffer, so gathering can be timed as its own stage.
+        # Threads gather and mix their Tracks together, so it isn't called for buffers mixed in parallel.
+        track_count, frame_count = track_buffers.shape
+        if track_eqs is None:
+            track_eqs = (None,)*track_count
+        if track_renders is None:
+            track_renders = (None,)*track_count
+
+        # Threads are used only if the buffer has enough work for them, which depends on the clips, renders and EQs in it and not only on
+        # the number of Tracks
+        partition_count = 1
+        if self.thread_count > 1 and track_count > 1:
+            costs = clip_cost(track_clips, track_eqs, track_renders, buffer_start_sample, frame_count)
+            partition_count = min(self.thread_count, track_count, int(costs.sum()//max(self.minimum_cost_per_thread,1)))
+
+        # Not enough work to be worth splitting
+        if partition_count <= 1:
+            gather_tracks(track_buffers, track_clips, track_renders, buffer_start_sample)
+            if gathered_callback:
+                gathered_callback()
+            apply_track_eqs(self.BatchedOverlapAddFilter, track_buffers, track_eqs)
+            mix_to_stereo(track_buffers, track_gains, track_pans, output_buffer)
+            return
+
+        if self.buses.shape[1] != frame_count:
+            self.buses = np.zeros((self.thread_count,frame_count,2), dtype=np.float32)
+
+        # Hand the buffer to the workers. Partition 0 is mixed by this thread.
+        self.track_buffers = track_buffers
+        self.track_clips = track_clips
+        self.track_gains = track_gains
+        self.track_pans = track_pans
+        self.track_eqs = track_eqs
+        self.track_renders = track_renders
+        self.buffer_start_sample = buffer_start_sample
+        self.partitions = partition_tracks(costs, partition_count)
+
+        for worker_ind in range(1,partition_count):
+            self.start_events[worker_ind-1].set()
+
+        # Wait for the workers. An exception of a worker is raised here, in the audio thread, after all of them have finished. They are waited
+        # for even if partition 0 fails, so no done message is left for the next buffer while a worker is still writing to this one.
+        worker_error = None
+        try:
+            self.mix_partition(0)
+        finally:
+            for ind in range(1,partition_count):
+                result = self.done_queue.get()
+                if isinstance(result, Exception):
+                    worker_error = result
+        if worker_error:
+            raise worker_error
+
+        # Sum the buses
+        np.sum(self.buses[0:partition_count], axis=0, out=output_buffer)
+
+    def mix_partition(self, partition_ind, *args, **kwargs):
+        # Gather, filter, apply gains and pan the Tracks of one partition to the partition's bus. The partition's rows are a view of
+        # track_buffers, so the level meters see the results without copying them back.
+        start, end = self.partitions[partition_ind]
+        rows = self.track_buffers[start:end]
+        gather_tracks(rows, self.track_clips[start:end], self.track_renders[start:end], self.buffer_start_sample)
+        apply_track_eqs(self.BatchedOverlapAddFilter, rows, self.track_eqs[start:end])
+        mix_to_stereo(rows, self.track_gains[start:end], self.track_pans[start:end], self.buses[partition_ind])
+
+    def worker_process(self, worker_ind, *args, **kwargs):
+        start_event = self.start_events[worker_ind-1]
+        while True:
+            start_event.wait()
+            start_event.clear()
+            if not self.running:
+                break
+
+            try:
+                self.mix_partition(worker_ind)
+                self.done_queue.put(worker_ind)
+            except Exception as error:
+                self.done_queue.put(error)
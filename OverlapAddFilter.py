@@ -0,0 +1,129 @@
+# General Python imports
+import numpy as np
+
+
+class OverlapAddFilter:
+
+    ########################################### Brief description ###########################################
+    # OverlapAddFilter filters buffers of audio in the frequency domain with 50% overlap-add. The filter is
+    # given as a complex frequency response which has the length of the buffer and includes the fft mirror
+    # image. PEQLayout multiplies the responses of all of its AudioFilters to complete_complex_response, so
+    # any amount of filters costs the same. Previous buffers are stored per channel, so one object filters
+    # all output channels.
+    #########################################################################################################
+
+    def __init__(self, buffer_size, channels=2, *args, **kwargs):
+        super(OverlapAddFilter, self).__init__(*args, **kwargs)
+
+        # Response of all filters combined. Starts flat.
+        self.complete_complex_response = np.ones((1,buffer_size), dtype='complex_').real
+
+        # Previous buffer of each channel
+        self.prev_buffers = np.zeros((channels,buffer_size), dtype=np.float32)
+
+        # Window used for each section
+        self.window = np.hanning(buffer_size) # Have seen both hanning and hamming used
+
+    def reset(self, *args, **kwargs):
+        # Forget the previous buffers so a new playback doesn't start with the overlapping end of the old one
+        self.prev_buffers[:,:] = 0
+
+    def filter_audio(self, audio_buffer, channel, *args, **kwargs):
+        # Using 50% overlap-add to implement filtering because it was unsure how signal.filtfilt and such functions handle previous input and output samples.
+        # Tried writing own time domain filtering function but it was too slow. Down falls of overlap-add is that frequency resolution is dependent on fft
+        # length and sampling frequency ratio, 44100/2048≈21.5 Hz per fft bin for example. Increasing fft length increases calculations, delay and frequency
+        # accuracy.
+
+        # Calculate half buffer index
+        buffer_size = len(audio_buffer)
+        half_buf_ind = int(buffer_size/2)
+
+        # Calculate different sections of overlap and add. Sections are first windowed, then transformed to the frequency domain where they are
+        # filtered (multiplied with the complex response). Finally ifft is taken, dimension on (N,1) is squeezed to (N,) and imaginary part is omitted
+        # ('.real') eventhough the imaginary part would be 0.
+
+        # Previous buffer's end half. Only end half is used
+        buf0 = np.squeeze(np.fft.ifft(np.multiply(self.complete_complex_response,np.fft.fft(np.multiply(self.window,self.prev_buffers[channel]))))).real
+
+        # Intersection between previous and current buffer. Used fully
+        buf1 = np.squeeze(np.fft.ifft(np.multiply(self.complete_complex_response,np.fft.fft(np.multiply(self.window,np.concatenate((self.prev_buffers[channel][half_buf_ind:buffer_size],audio_buffer[0:half_buf_ind]))))))).real
+
+        # End half of current buffer. Only first half is used
+        buf2 = np.squeeze(np.fft.ifft(np.multiply(self.complete_complex_response,np.fft.fft(np.multiply(self.window,audio_buffer))))).real
+
+
+        # Store current buffer for next iteration
+        self.prev_buffers[channel] = audio_buffer
+
+        # Initialize output buffer
+        output_buffer = np.zeros(audio_buffer.shape, dtype=np.float32)
+
+        # Stack calculated buffers to output
+        output_buffer[0:half_buf_ind] = buf0[half_buf_ind:buffer_size] # End half of buf0 stacked to first half of output buffer
+        output_buffer[half_buf_ind:buffer_size] = buf2[0:half_buf_ind] # First half of buf2 stacked to the end half of output buffer
+        output_buffer = np.add(output_buffer,buf1)                     # buf1 summed in complete to output buffer
+
+        return output_buffer
+
+
+class BatchedOverlapAddFilter:
+
+    ########################################### Brief description ###########################################
+    # BatchedOverlapAddFilter filters many mono signals at once with the same 50% overlap-add as
+    # OverlapAddFilter. Each signal has its own key, which keeps its previous buffer between calls, and its
+    # own response. The windowed sections of all signals are stacked to one 2-D array, so a whole batch takes
+    # one rfft, one complex multiply and one irfft. The filters have real coefficients, so their responses
+    # are conjugate symmetric and only the first buffer_size/2+1 bins of the response are needed.
+    #
+    # Used for the EQs of Tracks, where the key is the Track's id in Session. Keys which haven't been seen
+    # start from silence.
+    #########################################################################################################
+
+    def __init__(self, *args, **kwargs):
+        super(BatchedOverlapAddFilter, self).__init__(*args, **kwargs)
+
+        # Previous buffer of each key
+        self.prev_buffers = {}
+
+        # Window of the current buffer size
+        self.window = np.hanning(0)
+
+    def reset(self, *args, **kwargs):
+        # Forget all previous buffers. Also needed when the buffer size changes.
+        self.prev_buffers = {}
+
+    def filter_rows(self, audio_rows, keys, responses, *args, **kwargs):
+        # audio_rows has shape (signals, samples) and responses (signals, samples/2+1). Returns the filtered rows.
+        row_count, buffer_size = audio_rows.shape
+        half_buf_ind = int(buffer_size/2)
+
+        if len(self.window) != buffer_size:
+            self.window = np.hanning(buffer_size)
+
+        # Previous buffers in the order of the rows
+        prev_rows = np.empty(audio_rows.shape, dtype=np.float32)
+        for ind, key in enumerate(keys):
+            prev_buffer = self.prev_buffers.get(key)
+            prev_rows[ind] = 0 if prev_buffer is None else prev_buffer
+
+        # The three sections of OverlapAddFilter.filter_audio for every row: previous buffer, intersection of the previous and current buffer, and current buffer
+        sections = np.empty((3, row_count, buffer_size), dtype=np.float32)
+        sections[0] = prev_rows
+        sections[1,:,0:half_buf_ind] = prev_rows[:,half_buf_ind:buffer_size]
+        sections[1,:,half_buf_ind:buffer_size] = audio_rows[:,0:half_buf_ind]
+        sections[2] = audio_rows
+        sections *= self.window
+
+        # Filter all sections of all rows at once
+        filtered_sections = np.fft.irfft(np.fft.rfft(sections, axis=-1)*responses, n=buffer_size, axis=-1)
+
+        # Store current buffers for the next call
+        for ind, key in enumerate(keys):
+            self.prev_buffers[key] = audio_rows[ind].copy()
+
+        # Stack like OverlapAddFilter: end half of the previous buffer's section, the whole intersection and the first half of the current buffer's section
+        output_rows = filtered_sections[1].astype(np.float32)
+        output_rows[:,0:half_buf_ind] += filtered_sections[0,:,half_buf_ind:buffer_size]
+        output_rows[:,half_buf_ind:buffer_size] += filtered_sections[2,:,0:half_buf_ind]
+
+        return output_rows
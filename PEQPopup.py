@@ -8,6 +8,9 @@ from kivy.uix.button import Button
 from kivy.graphics import Color, RoundedRectangle, InstructionGroup
 
 # Project files
+from AudioConfig import audio_config
+from OverlapAddFilter import OverlapAddFilter
+from SpectrumAnalyzer import SpectrumAnalyzer, decimate_response, points_in_full_frequency_response, amount_of_points
 from GlobalAudioVariables import *
 
 # General Python imports
@@ -19,25 +22,12 @@ import numpy as np
 # Define some pixel which is most likely never reaced. Used used when moving GainAndFreqButton
 impossible_pixel = (-999,-999)
 
-# How many factors less points are in the plots
-denominator = 10 # There are 1/decimation_factor amount of points in the end
-# Hox many points are in the original frequency response
-points_in_full_frequency_response = int(sampling_rate/2)
-# Calculate how many points are in the final responses
-amount_of_points = math.floor(points_in_full_frequency_response/denominator)
-# TODO 'amount_of_points-1' seems to be more common than, 'amount_of_points' it self due mostly to logarithmic
-# jumps in loops. Should this be changed so that 'amount_of_points' would be more common and the few exceptions
-# would have +/- 1 when/if needed?
-
 # Graph limits
 graph_xmin = 10
 graph_xmax = 22000
 graph_ymin = -50
 graph_ymax = 50
 
-# Input fft decay factor
-decay_factor = 0.96
-
 
 class CurveAreaPlot(MeshStemPlot):
 
@@ -201,7 +191,7 @@ class AudioFilter:
         self.magnitudes_in_dB = np.zeros((amount_of_points-1, 1), dtype=np.float32)
 
         # Filter response used for overlap add filtering
-        self.ola_filtering_complex_response = np.ones((1, samples_per_playback_buffer), dtype='complex_').real
+        self.ola_filtering_complex_response = np.ones((1, audio_config.samples_per_playback_buffer), dtype='complex_').real
 
     def change_gain_and_freq(self, GainAndFreqButton, pos, **kwargs):
         # Align coordinates to match the popup's position. Better explanation from ref: https://kivy-garden.github.io/graph/flower.html#kivy_garden.graph.Graph.collide_plot
@@ -233,7 +223,7 @@ class AudioFilter:
         # Calculate intermediate step local parameters to clean up the final calculations
         G = 10.0**(self.Gain/20)                          # Gain as a linear coefficient
         sqrt_G = math.sqrt(G)                             # Squareroot of gain
-        w_c = 2*math.pi*self.center_freq/sampling_rate    # Normalized center frequency
+        w_c = 2*math.pi*self.center_freq/audio_config.sampling_rate    # Normalized center frequency
         cos_wc = math.cos(w_c)
         tan_B2 = math.tan(w_c/(2*self.q))
 
@@ -253,51 +243,10 @@ class AudioFilter:
 
     def calculate_frequency_response(self):
         # Calculate complex frequency response of self's filter.
-        frequencies, complex_response = signal.freqz(self.b, self.a, worN=points_in_full_frequency_response, fs=sampling_rate) 
-
-        # Logaritmic x axis stacks more points to right side. This gliches the graph figure if points aren't decreased.
-        # Since there are more points in the right side (at higher frequencies) more points can be skipped there.
-        # The only issue with this is that high q value filters look weird at some low frequencies because their center
-        # frequencies (i.e. where their peaks values are) may not exist in the plot.
-        #    This is the original idea of how to decimate points. A newer decimation algorithm was implemented in
-        # 'PEQLayout.realtime_input_fft()' when I was trying to have more points at lower frequencies.
-
-        # TODO have decimated frequency response curve as a global function not under any class
-
-        # List for frequencies
-        decimated_frequencies = np.zeros((amount_of_points-1, 1), dtype=np.float32) # -1 was added to prevent 0 Hz which would lead to log10(0) because of logarithmic x axis
-
-        # List for magnitudes
-        decimated_complex_response = np.empty((amount_of_points-1, 1), dtype='complex_') # Data type has to be specified as complex, so that imaginary values wouldn't be omitted
-
-
-        # Do not decimate points under this frequency
-        start_freq = 1000 
-
-        # Divide points at equal distances on a logarithmic scale, starting from start_freq
-        jump_of_factor = ((points_in_full_frequency_response)/start_freq)**(1/(amount_of_points-start_freq))
-        current_factor = jump_of_factor 
-
-        # Add undecimated points to output arrays. Omit 0 Hz by starting reading from index 1
-        decimated_frequencies[0:start_freq] = frequencies[1:start_freq+1].reshape(start_freq,1)
-        decimated_complex_response[0:start_freq] = complex_response[1:start_freq+1].reshape(start_freq,1)
-
-        # Starting jumping frequencies after last undecimated frequency
-        selected_frequency = start_freq
-
-        # Pick frequencies at logaritmically equal increments. Loop can start minimum from 1 index because floor(0) would lead to 0 Hz and so log10(0) error when logx=True
-        for ind in np.arange(start_freq,amount_of_points,1):
-
-            # Calculate next frequency
-            selected_frequency *= jump_of_factor
-            freq_ind = math.floor(selected_frequency)
-
-            # Store the frequency for plots to know the correct x coordinate for plots
-            decimated_frequencies[ind-1] = frequencies[freq_ind]
-
-            # Store the complex amplitude at selected frequency
-            decimated_complex_response[ind-1] = complex_response[freq_ind]
+        frequencies, complex_response = signal.freqz(self.b, self.a, worN=points_in_full_frequency_response, fs=audio_config.sampling_rate) 
 
+        # Decimate points for the logarithmic plot
+        decimated_frequencies, decimated_complex_response = decimate_response(frequencies, complex_response)
 
         # Naming parent for clarity
         PEQLayout = self.GainAndFreqButton.parent
@@ -319,15 +268,11 @@ class AudioFilter:
         # PEQLayout.system_response_plot.points = np.concatenate((decimated_frequencies.reshape(amount_of_points-1,1), PEQLayout.system_response_magnitudes_in_dB.reshape(amount_of_points-1,1)),axis=1) # numpy version is most likely more efficient but I couldn't solve the 'kivy force_dispatch' related warning it was giving
 
         # Calculate overlap add variables. The fft mirror image is included in these complex responses and these
-        # responses are equal length to 'samples_per_playback_buffer', which is why they require second fft.
-        # Remove effects of old filter from complete response
-        PEQLayout.ola_complete_complex_response = np.divide(PEQLayout.ola_complete_complex_response,self.ola_filtering_complex_response)
-
-        # Calculate new response
-        _, self.ola_filtering_complex_response = signal.freqz(self.b, self.a, worN=samples_per_playback_buffer, whole=True, fs=sampling_rate) # 'whole=True' includes fft mirror
+        # responses are equal length to the playback buffer, which is why they require second fft.
+        _, self.ola_filtering_complex_response = signal.freqz(self.b, self.a, worN=audio_config.samples_per_playback_buffer, whole=True, fs=audio_config.sampling_rate) # 'whole=True' includes fft mirror
 
-        # Add new response to complete response
-        PEQLayout.ola_complete_complex_response = np.multiply(PEQLayout.ola_complete_complex_response,self.ola_filtering_complex_response)
+        # Multiply the complete response again from all filters, which also lets the owner of a Track's PEQ know it has changed
+        PEQLayout.update_complete_response()
 
 
 class PEQLayout(FloatLayout):
@@ -335,11 +280,18 @@ class PEQLayout(FloatLayout):
     ########################################### Brief description ###########################################
     # PEQLayout is the main layout inside of PEQPopup. It is also responsible for realtime audio filtering
     # and FFT plotting. 
+    #
+    # The output's PEQLayout filters the output with its OverlapAddFilter. Tracks only use PEQLayout as an
+    # editor: they set response_callback, which is called with the complete response after every change,
+    # and the audio engine filters all Tracks' EQs together.
     #########################################################################################################
 
     def __init__(self, *args, **kwargs):
         super(PEQLayout, self).__init__(**kwargs)
 
+        # Called with OverlapAddFilter.complete_complex_response when it changes, set by Tracks
+        self.response_callback = None
+
         # Add the frequency response
         self.FrequencyResponseGraph = FrequencyResponseGraph()
         self.add_widget(self.FrequencyResponseGraph)
@@ -373,154 +325,71 @@ class PEQLayout(FloatLayout):
         self.input_fft_curve_plot = SmoothLinePlot(color=[0.8,0.8,0.95, 0.6]) # For highlighting the curve
         self.FrequencyResponseGraph.add_plot(self.input_fft_curve_plot)
 
-        # Buffer for storing input signal data for fft
-        self.fft_buffer_size = math.floor( (((sampling_rate)/2)/samples_per_playback_buffer) ) * samples_per_playback_buffer # This is how many full buffers of samples can fit to 0.5 seconds.
-        self.circular_fft_buffer = np.zeros((self.fft_buffer_size), dtype=np.float32)
-        self.circular_buffer_ind = 0
-        self.hann = np.hanning(self.fft_buffer_size) # Hanning window used for windowing fft
-
-        # Array for storing input fft's magnitudes
-        self.input_fft_magnitude_in_dB = np.ones((amount_of_points-1, 1), dtype=np.float32) * -80
-        self.decimated_frequencies = np.ones((amount_of_points-1, 1), dtype=np.float32)
-        self.input_fft_decay_level = np.ones(self.input_fft_magnitude_in_dB.shape,dtype=np.float32) * (graph_ymin-1) * (1-decay_factor) # Array of some dB values
-        self.epsilon_noise = np.ones((amount_of_points-1, 1), dtype='complex_')*10**((graph_ymin-1)/20) # Add noise to prevent log10(0) when plotting graph
-
-        # Overlap add (OLA) variables
-        self.ola_complete_complex_response = np.ones((1,samples_per_playback_buffer), dtype='complex_').real
-        self.ola_prev_buffers = np.zeros((2,samples_per_playback_buffer), dtype=np.float32)
-        self.ola_window = np.hanning(samples_per_playback_buffer) # Have seen both hanning and hamming used
+        # Filtering and the analyzer are done by objects which don't depend on Kivy, so they can also be used without a window
+        self.init_audio_buffers()
+
+    def init_audio_buffers(self, *args, **kwargs):
+        # Objects with buffers sized by the sampling rate and playback buffer size
+        self.OverlapAddFilter = OverlapAddFilter(audio_config.samples_per_playback_buffer, audio_config.number_of_output_channels)
+        self.SpectrumAnalyzer = SpectrumAnalyzer(audio_config.sampling_rate, audio_config.samples_per_playback_buffer, graph_ymin, graph_ymax)
+
+    def rebuild_audio_buffers(self, *args, **kwargs):
+        # Called when the sampling rate or playback buffer size has changed, while the output stream is closed
+        self.init_audio_buffers()
+
+        # Filters' OLA responses have the length of the buffer and their coefficients depend on the sampling rate. All filters are reset to
+        # a flat response of the new length first, so the complete response is always a product of responses of the same length, and then
+        # each is calculated again.
+        for AudioFilter in self.AudioFilters:
+            AudioFilter.ola_filtering_complex_response = np.ones((1, audio_config.samples_per_playback_buffer), dtype='complex_').real
+        for AudioFilter in self.AudioFilters:
+            AudioFilter.calculate_coefficients()
+
+    def get_filter_settings(self, *args, **kwargs):
+        # Parameters of all filters, for saving a session
+        return [{'filter_type': AudioFilter.filter_type, 'center_freq': float(AudioFilter.center_freq), 'Gain': float(AudioFilter.Gain), 'q': float(AudioFilter.q)}
+                for AudioFilter in self.AudioFilters]
+
+    def set_filter_settings(self, filter_settings, *args, **kwargs):
+        # Inverse of get_filter_settings. Every filter is calculated again, which also updates the complete response.
+        for AudioFilter, settings in zip(self.AudioFilters, filter_settings):
+            AudioFilter.filter_type = settings['filter_type']
+            AudioFilter.center_freq = settings['center_freq']
+            AudioFilter.Gain = settings['Gain']
+            AudioFilter.q = settings['q']
+            AudioFilter.calculate_coefficients()
+
+    def update_complete_response(self, *args, **kwargs):
+        # The complete response is the product of all filters' current responses. It is multiplied again from them after every change
+        # instead of dividing out a filter's old response, so rounding errors don't build up and an EQ set back to flat is exactly flat.
+        complete_complex_response = np.ones((1, audio_config.samples_per_playback_buffer), dtype='complex_').real
+        for AudioFilter in self.AudioFilters:
+            complete_complex_response = np.multiply(complete_complex_response, AudioFilter.ola_filtering_complex_response)
+        self.OverlapAddFilter.complete_complex_response = complete_complex_response
+        self.response_changed()
+
+    def response_changed(self, *args, **kwargs):
+        if self.response_callback:
+            self.response_callback(self.OverlapAddFilter.complete_complex_response)
 
     def filter_audio(self, audio_buffer, channel, *args, **kwargs):
         # channel==0 -> left channel, channel==1 -> right channel
+        return self.OverlapAddFilter.filter_audio(audio_buffer, channel)
 
-        # Using 50% overlap-add to implement filtering because it was unsure how signal.filtfilt and such functions handle previous input and output samples.
-        # Tried writing own time domain filtering function but it was too slow. Down falls of overlap-add is that frequency resolution is dependent on fft
-        # length and sampling frequency ratio, 44100/2048≈21.5 Hz per fft bin for example. Increasing fft length increases calculations, delay and frequency
-        # accuracy.
-
-        # Calculate half buffer index
-        half_buf_ind = int(samples_per_playback_buffer/2)
-
-        # Calculate different sections of overlap and add. Sections are first windowed, then transformed to the frequency domain where they are
-        # filtered (multiplied with the complex response). Finally ifft is taken, dimension on (N,1) is squeezed to (N,) and imaginary part is omitted
-        # ('.real') eventhough the imaginary part would be 0.
-
-        # Previous buffer's end half. Only end half is used
-        buf0 = np.squeeze(np.fft.ifft(np.multiply(self.ola_complete_complex_response,np.fft.fft(np.multiply(self.ola_window,self.ola_prev_buffers[channel]))))).real
-        
-        # Intersection between previous and current buffer. Used fully
-        buf1 = np.squeeze(np.fft.ifft(np.multiply(self.ola_complete_complex_response,np.fft.fft(np.multiply(self.ola_window,np.concatenate((self.ola_prev_buffers[channel][half_buf_ind:samples_per_playback_buffer],audio_buffer[0:half_buf_ind]))))))).real
-        
-        # End half of current buffer. Only first half is used
-        buf2 = np.squeeze(np.fft.ifft(np.multiply(self.ola_complete_complex_response,np.fft.fft(np.multiply(self.ola_window,audio_buffer))))).real
-
-
-        # Store current buffer for next iteration
-        self.ola_prev_buffers[channel] = audio_buffer
-
-        # Initialize output buffer
-        output_buffer = np.zeros(audio_buffer.shape, dtype=np.float32)
-
-        # Stack calculated buffers to output
-        output_buffer[0:half_buf_ind] = buf0[half_buf_ind:samples_per_playback_buffer] # End half of buf0 stacked to first half of output buffer
-        output_buffer[half_buf_ind:samples_per_playback_buffer] = buf2[0:half_buf_ind] # First half of buf2 stacked to the end half of output buffer
-        output_buffer = np.add(output_buffer,buf1)                                     # buf1 summed in complete to output buffer
-
-        return output_buffer
+    def reset_filter_state(self, *args, **kwargs):
+        # Forget the previous buffers so a new playback doesn't start with the overlapping end of the old one
+        self.OverlapAddFilter.reset()
 
     def realtime_input_fft(self, audio_buffer, *args, **kwargs):
-        # Put new audio_buffer to circular_fft_buffer
-        self.circular_fft_buffer[self.circular_buffer_ind : self.circular_buffer_ind+samples_per_playback_buffer] = audio_buffer
-
         # Name parent for clarity
         PEQPopup = self.parent.parent.parent # First parent is some boxlayout, second a gridlayout. Popup's source would probably explain this
 
-        # Calculate new fft only some times and when PEQPopup is open
-        if (self.circular_buffer_ind == 0 or self.circular_buffer_ind == int(self.fft_buffer_size/2)) and PEQPopup.is_open:
-
-            # Put circular buffer in order
-            buffer_in_order = np.concatenate((self.circular_fft_buffer[0:self.circular_buffer_ind], self.circular_fft_buffer[self.circular_buffer_ind:self.fft_buffer_size])) #, axis=1) # buffer may have to be '.reshape()'d.
-            buffer_in_order = np.multiply(buffer_in_order,self.hann) # Apply hanning window to buffer
-
-            # Calculate fft
-            frequencies, complex_response = signal.freqz(buffer_in_order, 1, worN=points_in_full_frequency_response, fs=sampling_rate) # When denominator 'a' is 1, freqz works as a fft function
-
-            # List for frequencies
-            self.decimated_frequencies = np.zeros((amount_of_points-1, 1), dtype=np.float32) # -1 was added to prevent 0 Hz which would lead to log10(0) because of logarithmic x axis
-
-            # List for magnitudes
-            decimated_complex_response = np.empty((amount_of_points-1, 1), dtype='complex_') # Data type has to be specified as complex, so that imaginary values wouldn't be omitted
-
-
-            # Do not decimate points under this frequency
-            start_freq = 1000 
-
-            # Divide points at equal distances on a logarithmic scale, starting from start_freq
-            jump_of_factor = ((points_in_full_frequency_response)/start_freq)**(1/(amount_of_points-start_freq))
-            current_factor = jump_of_factor 
-
-            # Add undecimated points to output arrays. Omit 0 Hz by starting reading from index 1
-            self.decimated_frequencies[0:start_freq] = frequencies[1:start_freq+1].reshape(start_freq,1)
-            decimated_complex_response[0:start_freq] = complex_response[1:start_freq+1].reshape(start_freq,1)
-
-            # Starting jumping frequencies after last undecimated frequency
-            selected_frequency = start_freq
-
-            # Pick frequencies at logaritmically equal increments. Loop can start minimum from 1 index because floor(0) would lead to 0 Hz and so log10(0) error when logx=True
-            for ind in np.arange(start_freq,amount_of_points,1):
-
-                # Calculate next frequency
-                selected_frequency *= jump_of_factor
-                freq_ind = math.floor(selected_frequency)
-
-                # Store the frequency for plots to know the correct x coordinate for plots
-                self.decimated_frequencies[ind-1] = frequencies[freq_ind]
-
-                # Store the complex amplitude at selected frequency
-                decimated_complex_response[ind-1] = complex_response[freq_ind]
-
-
-            # New fft's magnitudes
-            new_input_fft_magnitude_in_dB = 20*np.log10( np.add( np.absolute(decimated_complex_response), self.epsilon_noise.reshape(amount_of_points-1, 1) ) )
-
-            # Use peak dB value to scale the signal. dB values from 'freqz' aren't calculated in reference to any value. For this reason a sine wave with peak value of 1 
-            # results in different peak dB than a broadband noise with the same peak. 
-            peak_dB_value = 20*np.log10( np.max( np.absolute( self.circular_fft_buffer ) ) + 0.00001 ) # Adding 0.00001 (-100 dB) of noise to prevent log10(0) warning
-
-            # Calculate the fft's peak value
-            peak_fft_dB = np.max( new_input_fft_magnitude_in_dB )
-
-            # Calculate a correction term. peak_dB_value = peak_fft_dB + dB_correction -> dB_correction = peak_dB_value - peak_fft_dB
-            dB_correction = peak_dB_value - peak_fft_dB
-
-            # Scale the fft so that 0 dB digital signal will be at graph_ymax. I would have liked to add a secondary y axis on the right side which would have displayed 
-            # dB values from 0 dB down similarly to 'Logic pro eq'.
-            new_input_fft_magnitude_in_dB += dB_correction+graph_ymax
-
-            # Pick the largest values from the old and the new. First stack them to matrix and pick the larger value from the two to form a new array.
-            self.input_fft_magnitude_in_dB = np.amax( np.concatenate((new_input_fft_magnitude_in_dB.reshape(amount_of_points-1, 1), self.input_fft_magnitude_in_dB.reshape(amount_of_points-1, 1)),axis=1),axis=1 ).real # There was a harmless Complex number warning from the initial array so '.real' was added 
-
-            # Update points to plot
-            self.input_fft_area_plot.points = list(zip(self.decimated_frequencies, self.input_fft_magnitude_in_dB))
-            self.input_fft_curve_plot.points = self.input_fft_area_plot.points
-
-        else:
-            # TODO decay is dependent on 'samples_per_playback_buffer'. It would make more sense to have this decay on a separate clock
-
-            # Decay the seen response below the seen y values. The reshape is vital. This runs smoothly for few dozen
-            # iterations but transposes at some point which causes the output to be (N,N) matrix instead of a (N,1) array.
-            self.input_fft_magnitude_in_dB = self.input_fft_magnitude_in_dB*decay_factor + self.input_fft_decay_level.reshape(self.input_fft_magnitude_in_dB.shape).real
-
-            # Input the new points
-            self.input_fft_area_plot.points = list(zip(self.decimated_frequencies, self.input_fft_magnitude_in_dB))
-            self.input_fft_curve_plot.points = self.input_fft_area_plot.points
-
-        # Increase index
-        self.circular_buffer_ind += samples_per_playback_buffer
+        # Calculate new fft only when PEQPopup is open
+        self.SpectrumAnalyzer.push(audio_buffer, PEQPopup.is_open)
 
-        # Loop index to beginning if over limits
-        if self.circular_buffer_ind >= self.fft_buffer_size:
-            self.circular_buffer_ind = 0
+        # Input the new points
+        self.input_fft_area_plot.points = list(zip(self.SpectrumAnalyzer.decimated_frequencies, self.SpectrumAnalyzer.magnitudes_in_dB))
+        self.input_fft_curve_plot.points = self.input_fft_area_plot.points
 
 
 class PEQPopup(Popup):
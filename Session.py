@@ -0,0 +1,292 @@
+# Project files
+from Mixer import region_edges
+
+# General Python imports
+import numpy as np
+
+# Global variables
+# An EQ whose response differs from flat by less than this everywhere is bypassed. This is -120 dB.
+flat_response_tolerance = 1e-6
+
+
+def clip_range(clip):
+    # Samples of the timeline which a clip covers, as a (start_sample, end_sample) pair
+    return (clip.start_sample, clip.start_sample+len(clip.samples))
+
+
+def clip_tuples(clips):
+    # ClipStates in the form the mixer takes them
+    return tuple((clip.start_sample, clip.samples, clip.region_edges) for clip in clips)
+
+
+class ClipState:
+
+    ########################################### Brief description ###########################################
+    # ClipState is the audio engine's view of one SoundClip: where its audio file is, at which sample it
+    # starts, its samples and its silence map. SoundClip widgets hold their ClipState and change it only
+    # through Session. regions are the (start, end) sample ranges of the clip which are played, from
+    # WaveformPeaks.sounding_regions, or None to play the whole clip. region_edges are the same in the form
+    # the mixer takes them.
+    #########################################################################################################
+
+    __slots__ = ('path', 'start_sample', 'samples', 'regions', 'region_edges')
+
+    def __init__(self, path, start_sample, samples, regions=None):
+        self.path = path
+        self.start_sample = int(start_sample)
+        self.samples = samples
+        self.regions = regions
+        self.region_edges = region_edges(regions)
+
+
+class TrackState:
+
+    ########################################### Brief description ###########################################
+    # TrackState holds the mixing settings of one Track and the ClipStates on it. Tracks hold their
+    # TrackState and change it only through Session. eq_response is the first half of the complex response
+    # of the Track's PEQ, or None when the EQ is flat. track_id is unique in the Session and never reused.
+    # render is a (TrackRender, version) pair of the Track's flattened clips, or None if there is no render.
+    #########################################################################################################
+
+    __slots__ = ('track_id', 'gain', 'pan', 'mute', 'solo', 'eq_response', 'clips', 'render')
+
+    def __init__(self, track_id):
+        # Linear gain, pan from 0 (left) to 1 (right), EQ response and the Track's ClipStates
+        self.track_id = track_id
+        self.gain = 1.0
+        self.pan = 0.5
+        self.mute = False
+        self.solo = False
+        self.eq_response = None
+        self.clips = []
+        self.render = None
+
+
+class SessionSnapshot:
+
+    ########################################### Brief description ###########################################
+    # SessionSnapshot is what the audio engine reads once per playback buffer. It is never changed after it
+    # has been created: the arrays are read only and clips are tuples of (start_sample, samples, regions), one
+    # tuple per Track, in the form Mixer.gather_clips takes them. Mute and solo are already resolved, so
+    # Tracks which aren't played have no clips and zero gain. track_eqs has a (track_id, eq_response) pair
+    # for each played Track with an EQ and None for the rest. track_renders has the (TrackRender, version)
+    # pair of each played Track which has one, which the mixer reads instead of the clips when it's ready.
+    #########################################################################################################
+
+    __slots__ = ('track_clips', 'track_gains', 'track_pans', 'track_eqs', 'track_renders', 'master_gain')
+
+    def __init__(self, track_clips, track_gains, track_pans, track_eqs, track_renders, master_gain):
+        self.track_clips = track_clips
+        self.track_gains = track_gains
+        self.track_pans = track_pans
+        self.track_eqs = track_eqs
+        self.track_renders = track_renders
+        self.master_gain = master_gain
+
+        self.track_gains.flags.writeable = False
+        self.track_pans.flags.writeable = False
+
+
+class Session:
+
+    ########################################### Brief description ###########################################
+    # Session is the model of everything the audio engine plays: TrackStates in the order of
+    # TrackContainer.Tracks, their ClipStates and the master gain. Widgets edit the model from the GUI thread
+    # with the methods below, each of which publishes a new SessionSnapshot. Publishing replaces the
+    # 'snapshot' attribute with a single assignment, so the audio thread always sees either the old or the
+    # new snapshot as a whole and never a half edited model. Nothing here uses Kivy.
+    #
+    # length_in_samples is the length of the time axis (TimeSlider.max), which SoundClips need to convert
+    # their x position to a start sample.
+    #
+    # With a TrackRenderCache, every change of a Track's clips queues a render of the changed sample range.
+    #
+    # Every edit also marks its Tracks, or the master settings, as edited. take_edits hands the marks over to
+    # the autosave, which writes only the edited Tracks. Changes which don't reach the audio engine, like
+    # Track names and colors, are marked by the widgets with mark_edited.
+    #########################################################################################################
+
+    def __init__(self, length_in_samples, TrackRenderCache=None, *args, **kwargs):
+        super(Session, self).__init__(*args, **kwargs)
+
+        # Length of the time axis in samples
+        self.length_in_samples = length_in_samples
+
+        # Flattened renders of the Tracks' clips, optional
+        self.TrackRenderCache = TrackRenderCache
+
+        # TrackStates in the order of TrackContainer.Tracks
+        self.TrackStates = []
+
+        # Linear gain of the output
+        self.master_gain = 1.0
+
+        # track_id of the next TrackState
+        self.next_track_id = 0
+
+        # track_ids of the Tracks edited since the last take_edits and whether the master settings were
+        self.edited_track_ids = set()
+        self.master_edited = False
+
+        # Latest published snapshot, read by the audio thread
+        self.snapshot = None
+        self.publish()
+
+    def publish(self, *args, **kwargs):
+        # Build a new snapshot of the model and swap it in. If any Track is soloed, only soloed Tracks are played.
+        any_track_soloed = any(track.solo for track in self.TrackStates)
+        track_count = len(self.TrackStates)
+
+        track_clips = []
+        track_eqs = []
+        track_renders = []
+        track_gains = np.zeros(track_count, dtype=np.float32)
+        track_pans = np.zeros(track_count, dtype=np.float32)
+
+        for ind, track in enumerate(self.TrackStates):
+            # Muted Tracks and Tracks which aren't soloed when some other Track is have no clips and zero gain
+            if track.mute or (any_track_soloed and not track.solo):
+                track_clips.append(())
+                track_eqs.append(None)
+                track_renders.append(None)
+                continue
+
+            track_gains[ind] = track.gain
+            track_pans[ind] = track.pan
+            track_clips.append(clip_tuples(track.clips))
+            track_eqs.append(None if track.eq_response is None else (track.track_id, track.eq_response))
+            track_renders.append(track.render)
+
+        self.snapshot = SessionSnapshot(tuple(track_clips), track_gains, track_pans, tuple(track_eqs), tuple(track_renders), self.master_gain)
+
+    def add_track(self, *args, **kwargs):
+        # New Tracks are added last, like in TrackContainer.Tracks
+        track = TrackState(self.next_track_id)
+        self.next_track_id += 1
+        self.TrackStates.append(track)
+        self.mark_edited(track)
+        self.publish()
+        return track
+
+    def remove_track(self, track, *args, **kwargs):
+        # Removing a Track removes its clips
+        self.TrackStates.remove(track)
+        if self.TrackRenderCache:
+            self.TrackRenderCache.remove(track.track_id)
+        self.mark_edited(track)
+        self.publish()
+
+    def set_track(self, track, gain=None, pan=None, mute=None, solo=None, *args, **kwargs):
+        # Change the given settings of a TrackState
+        if gain is not None:
+            track.gain = float(gain)
+        if pan is not None:
+            track.pan = float(pan)
+        if mute is not None:
+            track.mute = bool(mute)
+        if solo is not None:
+            track.solo = bool(solo)
+        self.mark_edited(track)
+        self.publish()
+
+    def set_track_eq(self, track, complete_complex_response, *args, **kwargs):
+        # complete_complex_response is the whole response of the Track's PEQ including the fft mirror image, like
+        # OverlapAddFilter.complete_complex_response. Only the first half is kept and a flat EQ is stored as None, so it costs nothing.
+        response = np.asarray(complete_complex_response).reshape(-1)
+        if np.amax(np.absolute(response-1)) < flat_response_tolerance:
+            track.eq_response = None
+        else:
+            half_response = response[0:len(response)//2+1].astype(np.complex128)
+            half_response.flags.writeable = False
+            track.eq_response = half_response
+        self.mark_edited(track)
+        self.publish()
+
+    def set_master_gain(self, gain, *args, **kwargs):
+        self.master_gain = float(gain)
+        self.mark_edited()
+        self.publish()
+
+    def add_clip(self, track, path, start_sample, samples, regions=None, *args, **kwargs):
+        # Add a clip to a Track and return its ClipState
+        clip = ClipState(path, start_sample, samples, regions)
+        track.clips.append(clip)
+        self.render_track(track, [clip_range(clip)])
+        self.publish()
+        return clip
+
+    def move_clip(self, clip, start_sample=None, track=None, *args, **kwargs):
+        # Move a clip in time, to another Track or both. Nothing is published if the clip didn't move, which is the case for most
+        # position changes of SoundClip widgets, for example when the time axis is zoomed.
+        moved = False
+        old_range = clip_range(clip)
+        old_track = self.find_track(clip)
+
+        if start_sample is not None and int(start_sample) != clip.start_sample:
+            clip.start_sample = int(start_sample)
+            moved = True
+
+        # A clip which is on no Track, for example one which has just been removed, is only added to the new Track
+        if track is not None and clip not in track.clips:
+            if old_track is not None:
+                old_track.clips.remove(clip)
+            track.clips.append(clip)
+            moved = True
+
+        if moved:
+            # The old range is rendered again without the clip and the new range with it
+            new_track = self.find_track(clip)
+            if old_track is not None:
+                self.render_track(old_track, [old_range, clip_range(clip)] if new_track is old_track else [old_range])
+            if new_track is not None and new_track is not old_track:
+                self.render_track(new_track, [clip_range(clip)])
+            self.publish()
+
+    def set_clip_regions(self, clip, regions, *args, **kwargs):
+        # Change which parts of a clip are played, for example to strip its silence. The samples aren't touched.
+        clip.regions = regions
+        clip.region_edges = region_edges(regions)
+        track = self.find_track(clip)
+        if track:
+            self.render_track(track, [clip_range(clip)])
+        self.publish()
+
+    def remove_clip(self, clip, *args, **kwargs):
+        track = self.find_track(clip)
+        if track:
+            track.clips.remove(clip)
+            self.render_track(track, [clip_range(clip)])
+        self.publish()
+
+    def find_track(self, clip, *args, **kwargs):
+        # TrackState which has the clip, or None
+        for track in self.TrackStates:
+            if clip in track.clips:
+                return track
+        return None
+
+    def mark_edited(self, track=None, *args, **kwargs):
+        # Mark a TrackState, or the master settings when track is None, to be autosaved
+        if track is None:
+            self.master_edited = True
+        else:
+            self.edited_track_ids.add(track.track_id)
+
+    def take_edits(self, *args, **kwargs):
+        # Return the track_ids of the edited Tracks and whether the master settings were edited, and clear the marks
+        edited_track_ids, master_edited = self.edited_track_ids, self.master_edited
+        self.edited_track_ids = set()
+        self.master_edited = False
+        return edited_track_ids, master_edited
+
+    def render_track(self, track, sample_ranges, *args, **kwargs):
+        # Queue a render of the changed ranges of a Track's timeline and mark the Track edited. The clips are handed over as they are now,
+        # since the render thread renders them later while this thread may already be changing the list.
+        self.mark_edited(track)
+        if self.TrackRenderCache:
+            track_clips = clip_tuples(track.clips)
+            version, TrackRender = self.TrackRenderCache.invalidate(track.track_id, sample_ranges, track_clips, self.length_in_samples)
+            track.render = (TrackRender, version)
+
+    def has_clips(self, *args, **kwargs):
+        return any(track.clips for track in self.TrackStates)
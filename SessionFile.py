@@ -0,0 +1,53 @@
+# General Python imports
+import os
+import json
+import numpy as np
+
+# Global variables
+# Version of the manifest. Files of newer versions are refused, older ones are read as they are.
+session_format_version = 1
+
+# Extension of session files
+session_file_extension = '.dawsession'
+
+
+############################### Session files ###############################
+# Reading and writing session files without Kivy. A session file is an uncompressed NumPy .npz archive: 'manifest' is the session as
+# JSON (Tracks, their settings and clips) and the rest are arrays the manifest refers to by name, like the WaveformPeaks and silence maps
+# of clips. The audio isn't in the file. Clips refer to their audio files by paths relative to the session file, so a session can be
+# moved together with its 'Recorded Audio Files'. np.load reads members only when they are accessed, so the manifest can be read first
+# and the peaks clip by clip.
+
+
+def write_session_file(path, manifest, arrays):
+    # Write the manifest and arrays. The file is written next to path and then moved over it, so a crash while saving never leaves a
+    # broken session file behind.
+    manifest = dict(manifest, format_version=session_format_version)
+    temporary_path = path+'.tmp'
+    with open(temporary_path, 'wb') as session_file:
+        np.savez(session_file, manifest=np.frombuffer(json.dumps(manifest).encode('utf-8'), dtype=np.uint8), **arrays)
+        session_file.flush()
+        os.fsync(session_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def read_session_file(path):
+    # Return the manifest and the archive of arrays. The archive has to be closed after the arrays have been read.
+    arrays = np.load(path, allow_pickle=False)
+    manifest = json.loads(arrays['manifest'].tobytes().decode('utf-8'))
+
+    if manifest.get('format_version', 0) > session_format_version:
+        arrays.close()
+        raise ValueError("Session file '{}' is from a newer version of the program".format(path))
+
+    return manifest, arrays
+
+
+def relative_audio_path(audio_path, session_path):
+    # Path of an audio file as it is stored in a session file
+    return os.path.relpath(os.path.abspath(audio_path), os.path.dirname(os.path.abspath(session_path)))
+
+
+def absolute_audio_path(stored_path, session_path):
+    # Inverse of relative_audio_path
+    return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(session_path)), stored_path))
@@ -0,0 +1,219 @@
+# Project files
+from SessionFile import write_session_file, read_session_file
+
+# General Python imports
+import os
+import json
+import base64
+import threading
+import queue
+import numpy as np
+
+# Global variables
+# The journal of a session file is next to it, named by the session file and this extension
+journal_file_extension = '.journal'
+
+# When the journal grows past this many bytes, the session is written to the session file and the journal is emptied
+compaction_size_in_bytes = 16*2**20
+
+# How long the writer waits for edits before checking if it should stop, in seconds
+writer_interval = 0.5
+
+
+def encode_array(array):
+    # Arrays are stored in journal entries as base64 of their bytes
+    array = np.ascontiguousarray(array)
+    return {'dtype': array.dtype.str, 'shape': list(array.shape), 'data': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+def decode_array(encoded_array):
+    # Inverse of encode_array
+    return np.frombuffer(base64.b64decode(encoded_array['data']), dtype=encoded_array['dtype']).reshape(encoded_array['shape'])
+
+
+def apply_edits(state, arrays, master, tracks, new_arrays):
+    # Apply one set of edits to a session state. state has the master settings and the Track manifests by track_id in the order of the
+    # Tracks. Each Track is replaced as a whole and None removes it, so applying the same edits twice gives the same state.
+    if master:
+        state['master'] = master
+    for track_id, track_manifest in tracks.items():
+        if track_manifest is None:
+            state['tracks'].pop(track_id, None)
+        else:
+            state['tracks'][track_id] = track_manifest
+    arrays.update(new_arrays)
+
+
+def merge_edits(earlier_edits, later_edits):
+    # One set of edits with the same result as applying earlier_edits and then later_edits. Both are (master, tracks, arrays).
+    earlier_master, earlier_tracks, earlier_arrays = earlier_edits
+    later_master, later_tracks, later_arrays = later_edits
+    return later_master or earlier_master, dict(earlier_tracks, **later_tracks), dict(earlier_arrays, **later_arrays)
+
+
+def session_manifest(state):
+    # Manifest of a session file from a session state
+    return dict(state['master'], tracks=list(state['tracks'].values()))
+
+
+def used_arrays(state, arrays):
+    # Arrays which the clips of a session state refer to. Arrays of removed clips are left out.
+    keys = [clip_manifest['arrays'] for track_manifest in state['tracks'].values() for clip_manifest in track_manifest['clips']]
+    return {name: arrays[name] for key in keys for name in (key+"_minimums", key+"_maximums", key+"_regions") if name in arrays}
+
+
+def read_journaled_session(path):
+    # Read a session file with the edits of its journal applied. Returns the manifest and a dictionary of the arrays. A session without a
+    # journal is read as it is. A crash while an entry was written leaves a broken last line, which is skipped. A broken line before the
+    # last one is reported and skipped too, so the entries written after it aren't lost.
+    state = {'master': {}, 'tracks': {}}
+    arrays = {}
+
+    if os.path.exists(path):
+        manifest, session_arrays = read_session_file(path)
+        state['master'] = {key: value for key, value in manifest.items() if key != 'tracks'}
+        for ind, track_manifest in enumerate(manifest['tracks']):
+            state['tracks'][str(track_manifest.get('track_id', ind))] = track_manifest
+        arrays = {name: session_arrays[name] for name in session_arrays.files if name != 'manifest'}
+        session_arrays.close()
+
+    if os.path.exists(path+journal_file_extension):
+        with open(path+journal_file_extension, 'r', encoding='utf-8') as journal_file:
+            lines = journal_file.readlines()
+            for ind, line in enumerate(lines):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    if ind < len(lines)-1:
+                        print("Skipped broken entry "+str(ind)+" of journal "+path+journal_file_extension)
+                    continue
+                apply_edits(state, arrays, entry['master'], entry['tracks'], {name: decode_array(encoded_array) for name, encoded_array in entry['arrays'].items()})
+
+    return session_manifest(state), used_arrays(state, arrays)
+
+
+class SessionJournal:
+
+    ########################################### Brief description ###########################################
+    # SessionJournal autosaves a session to session_path without blocking the GUI or the audio thread. The
+    # GUI hands it the edits since the previous autosave with record: the master settings if they changed
+    # and the manifests of the edited Tracks, or None for removed ones, with the arrays of new clips. The
+    # writer thread appends each set of edits as one JSON line to the journal next to the session file, so
+    # an autosave costs as much as the edits and not the whole session. When the journal grows past
+    # compaction_size_in_bytes, the session is written to the session file and the journal is emptied.
+    # read_journaled_session reads the session file with the journal applied.
+    #
+    # An autosave left behind by a previous run, for example after a crash, is first written to
+    # recovered_path and the new autosave starts empty.
+    #########################################################################################################
+
+    def __init__(self, session_path, recovered_path, *args, **kwargs):
+        super(SessionJournal, self).__init__(*args, **kwargs)
+
+        self.session_path = session_path
+        self.journal_path = session_path+journal_file_extension
+        self.recovered_path = recovered_path
+
+        # The session as it has been written, used for compacting
+        self.state = {'master': {}, 'tracks': {}}
+        self.arrays = {}
+
+        # Statistics
+        self.entries = 0
+        self.compactions = 0
+
+        # Edits from the GUI thread
+        self.edit_queue = queue.Queue()
+
+        # Bool for the writer loop
+        self.writing = True
+        self.thread = threading.Thread(target=self.writer_process, daemon=True)
+        self.thread.start()
+
+    def stop(self, *args, **kwargs):
+        # Edits which have been recorded are written before the thread ends
+        self.writing = False
+        self.thread.join()
+
+    def record(self, master, tracks, arrays, *args, **kwargs):
+        # Called from the GUI thread. The arrays mustn't be changed afterwards, WaveformPeaks of finished clips never are.
+        self.edit_queue.put((master, tracks, arrays))
+
+    def recover_previous_session(self, *args, **kwargs):
+        # Keep the autosave of a previous run in recovered_path and remove it from session_path
+        if not os.path.exists(self.session_path) and not os.path.exists(self.journal_path):
+            return
+        manifest, arrays = read_journaled_session(self.session_path)
+        if manifest['tracks']:
+            write_session_file(self.recovered_path, manifest, arrays)
+            print("Previous autosave kept in "+self.recovered_path)
+        if os.path.exists(self.session_path):
+            os.remove(self.session_path)
+
+    def append(self, master, tracks, arrays, journal_file, *args, **kwargs):
+        # Write one set of edits to the journal and apply it to state. If the write fails, the journal is cut back to where the entry started,
+        # so no partial line is left for the next entry to be appended to, and the error is raised again.
+        entry = json.dumps({'master': master, 'tracks': tracks, 'arrays': {name: encode_array(array) for name, array in arrays.items()}})
+        entry_position = journal_file.tell()
+        try:
+            journal_file.write(entry+"\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        except Exception:
+            journal_file.seek(entry_position)
+            journal_file.truncate()
+            raise
+        apply_edits(self.state, self.arrays, master, tracks, arrays)
+        self.entries += 1
+
+    def compact(self, journal_file, *args, **kwargs):
+        # Write the whole session to the session file and empty the journal. If the program stops in between, the journal is applied to
+        # the new session file, which gives the same session since applying edits again doesn't change it.
+        self.arrays = used_arrays(self.state, self.arrays)
+        write_session_file(self.session_path, session_manifest(self.state), self.arrays)
+        journal_file.seek(0)
+        journal_file.truncate()
+        os.fsync(journal_file.fileno())
+        self.compactions += 1
+
+    def writer_process(self, *args, **kwargs):
+        # A previous autosave which can't be read mustn't stop this one
+        try:
+            self.recover_previous_session()
+        except Exception as error:
+            print("Previous autosave couldn't be recovered: "+str(error))
+
+        # Edits which failed to be written. Session has already handed them over, so they are kept here and merged to the next edits.
+        failed_edits = None
+
+        with open(self.journal_path, 'w', encoding='utf-8') as journal_file:
+            while self.writing or not self.edit_queue.empty():
+                try:
+                    edits = self.edit_queue.get(timeout=writer_interval)
+                except queue.Empty:
+                    # Failed edits are tried again even if nothing new has been edited
+                    if failed_edits is None:
+                        continue
+                    edits = ({}, {}, {})
+
+                if failed_edits is not None:
+                    edits = merge_edits(failed_edits, edits)
+                    failed_edits = None
+
+                # An edit which fails to be written, for example because the disk is full, is reported and tried again with the next ones
+                try:
+                    self.append(*edits, journal_file)
+                except Exception as error:
+                    failed_edits = edits
+                    print("Autosave failed, retrying: "+str(error))
+                    continue
+
+                # The edits are in the journal even if compacting fails, so it is only tried again when the journal grows
+                try:
+                    if journal_file.tell() > compaction_size_in_bytes:
+                        self.compact(journal_file)
+                except Exception as error:
+                    print("Autosave compaction failed: "+str(error))
+
+        if failed_edits is not None:
+            print("Autosave stopped with edits which couldn't be written")
@@ -1,22 +1,33 @@
 # Kivy imports
 from kivy.uix.button import Button
-from kivy.graphics import Color
-from kivy.garden.graph import Graph, MeshStemPlot
+from kivy.graphics import Color, Rectangle, InstructionGroup
 from kivy.core.window import Window
 
 # Project files
+from WaveformPeaks import WaveformPeaks, samples_per_peak_block, section_regions
+from WaveformTileCache import get_tile_level, get_tile_blocks, tile_width
+from ClipFile import load_clip, write_clip, split_clip
+from AudioConfig import audio_config
 from GlobalAudioVariables import *
 
 # General Python imports
 import gc
 import numpy as np
-import librosa
-import soundfile
 
 # Global variables
 # Define some pixel which is most likely never reaced
 impossible_pixel = (-999,-999)
 
+# Color of the waveform drawn on top of the Track's color
+waveform_color = (1,1,1, 0.3)
+
+# How many zoom levels away from the current one cached tiles are looked for while the current level's tiles are rendered
+max_tile_level_distance = 4
+
+# Strip silence removes blocks below this level. Blocks next to the kept ones are kept too, so quiet starts and tails of sounds aren't cut.
+strip_silence_threshold_in_dB = -50
+strip_silence_padding_blocks = 2
+
 
 class MoveableButton(Button):
 
@@ -68,33 +79,22 @@ class MoveableButton(Button):
         self.pressed = True
 
 
-class SoundClipPlot(Graph):
-
-    ########################################### Brief description ###########################################
-    # SoundClipPlot is the graph containing a SoundClip's wav waveform.
-    #########################################################################################################
-
-    def __init__(self,**kwargs):
-        super(SoundClipPlot, self).__init__(**kwargs)
-
-        # Which values of the wav file are plotted. Starting from the first sample (xmin=0), plot amplitude values between -1 and 1. To 'add gain'/zoom in to the plots you can use smaller ymin and ymax values.
-        self.xmin = 0
-        self.ymin = -1
-        self.ymax = 1
-
-        # Remove x and y axes from plots and remove the defaul padding to center the wav plot.
-        self.border_color = [0,0,0, 0] # the alpha has to be 0, the rgb values don't make a difference when alpha=0.
-        self.padding = 0 # Graph.padding is receives only single value, rather than [left,top,right,down] or single value
-
-
 class SoundClip(MoveableButton):
 
     ########################################### Brief description ###########################################
-    # SoundClip is a MoveableButton which has SoundClipPlot bounded to its position. SoundClip's horizontal
+    # SoundClip is a MoveableButton which draws its waveform on its canvas. SoundClip's horizontal
     # position (=x) changes when its wav is played and vertical position (=y), to which Track it belongs to.
     # Different Tracks can have different volume (=gain) and stereo panning settings. 
+    #
+    # The waveform is a rectangle of the Track's color with textured rectangles on top of it, one for each
+    # tile of WaveformTileCache in view, see WaveformTexture.py. It is drawn only while TrackContainer shows
+    # the SoundClip. update_tiles draws the tiles of the zoom level which fits the SoundClip's width and
+    # requests the ones which aren't cached. Until they have been rendered, the drawn tiles are stretched to
+    # the new width, or if there are none, cached tiles of the nearest level are, and a clip with no
+    # cached tiles shows only its color as a placeholder. Resizing only stretches the rectangles.
     #   
-    # SoundClips can be split when the user has pressed 'x' and the cursor has changed to an ibeam and
+    # SoundClips can be split when the user has pressed 'x' and the cursor has changed to an ibeam,
+    # stripped of silence when the user has pressed 's' and the cursor has changed to a hand, and
     # deleted when user has pressed 'backspace' and cursor has changed to a crosshair. Splitting splits
     # a single SoundClip in to two SoundClips from the clicked position and deleting deletes the clicked
     # SoundClip. Both of these modes can be exited by pressing any other key which is indicated by the
@@ -102,7 +102,7 @@ class SoundClip(MoveableButton):
     # changing SoundClip editing modes from change_SoundClip_editing_mode in main.py
     #########################################################################################################
 
-    def __init__(self, recorded_audio_path, samples_in_time_axis, height, SoundClipField_width, color, start_sample, *args, **kwargs):
+    def __init__(self, recorded_audio_path, samples_in_time_axis, height, SoundClipField_width, color, start_sample, peaks=None, *args, **kwargs):
         super(SoundClip, self).__init__(*args, **kwargs)
 
         # Set the button's color to transparent so it is never visible
@@ -110,43 +110,42 @@ class SoundClip(MoveableButton):
 
         # Where this SoundClip's audio file is found from
         self.path = recorded_audio_path
-        # Read wav file, librosa doesn't have a close
-        amplitudes, _ = librosa.load(self.path, sr=sampling_rate, dtype=np.float32)
+
+        # Waveform overview of the audio. Recorded, dropped and split clips already have their peaks, so the wav is read and scanned only when they weren't given.
+        if peaks is None:
+            # Read wav file
+            amplitudes = load_clip(self.path, audio_config.sampling_rate)
+            peaks = WaveformPeaks.from_samples(amplitudes)
+        self.WaveformPeaks = peaks
 
         # Define SoundClip's size not to depend on layout size
         self.size_hint = (None,None)
 
         # Calculate the length of this SoundClip in pixels by getting its size percentages of all samples available and multiplying that by the amount of pixels in that same area
-        self.length_in_samples = len(amplitudes)
+        self.length_in_samples = self.WaveformPeaks.sample_count
         clip_length_in_pixels = (self.length_in_samples/samples_in_time_axis) * SoundClipField_width
         self.size = (clip_length_in_pixels, height)
 
-        # Init the audio waveform plot
-        self.SoundClipPlot = SoundClipPlot(size_hint=(None,None),size=self.size)
-        self.SoundClipPlot.background_color = color
-        self.add_widget(self.SoundClipPlot)
-
-        # Bind plot size to the SoundClip's size
-        self.bind(size=self.scale_plot)
+        # Instructions drawing the waveform. SoundClips are added to the layout only when they are near the view, the instructions are created then with show.
+        self.waveform_instructions = None
+        self.clip_color = color
 
-        # Create time amplitude curve containing object
-        self.TimeAmplitudeCurve = MeshStemPlot(color=[1,1,1, 0.3])
+        # WaveformTileCache given by show, the drawn tiles as (Rectangle, first block, block after the last), their level and the blocks they cover
+        self.WaveformTileCache = None
+        self.drawn_tiles = []
+        self.drawn_level = None
+        self.drawn_blocks = (0,0)
 
-        # Decrease the amount of sample drawn
-        plot_decimation_rate = 200 # Draw every 200th sample
-        amplitudes = [amplitudes[ind] for ind in range(0,self.length_in_samples, plot_decimation_rate)] # Pick every 200th sample
+        # Part of SoundClipField in view, given by TrackContainer with update_tiles
+        self.visible_range = None
 
-        # Create sample index vector which gives the plot the correct x coordinates
-        soundclip_length = np.linspace(0,self.length_in_samples-1, num=self.length_in_samples)
-        # Combine the two vectors to a list which contains (x,y) coordinate pairs 
-        audio_time_curve = list(zip(soundclip_length, amplitudes))
+        # Regions of the audio which are drawn, None draws all of it. Changed by draw_regions, which also changes waveform_version so tiles of the old waveform aren't used.
+        self.drawn_regions = None
+        self.drawn_peaks = None
+        self.waveform_version = 0
 
-        # Add points to plot
-        self.TimeAmplitudeCurve.points = audio_time_curve
-        # Change the plot's length to be equal to the amount of points added. +1 prevents zero division. The program crahed once and the error stated "File "C:\Users\Aki\.kivy\garden\garden.graph\__init__.py", line 1036, in x_px 'ratiox = (size[2] - size[0]) / float(xmax - xmin)'  ZeroDivisionError: float division by zero", meaning xmax and xmin were both zero.
-        self.SoundClipPlot.xmax = len(self.TimeAmplitudeCurve.points) + 1
-        # Add plot
-        self.SoundClipPlot.add_plot(self.TimeAmplitudeCurve)
+        # Bind plot size to the SoundClip's size
+        self.bind(size=self.scale_plot)
 
         # When the audio starts playing
         self.start_sample = int(start_sample)
@@ -157,23 +156,165 @@ class SoundClip(MoveableButton):
         self.relative_x = self.x/SoundClipField_width
         self.relative_width = clip_length_in_pixels/SoundClipField_width
 
+        # Session and the state of this SoundClip in it, given by Track.add_SoundClip
+        self.Session = None
+        self.ClipState = None
+
+        # True when silence has been stripped with strip_silence, which saved sessions remember
+        self.silence_stripped = False
+
+        # Name of the SoundClip's arrays in the autosave, given by MainView.autosave
+        self.autosave_key = None
+
+        # Silence map which was last written to the autosave, so it is written again only when it changes
+        self.autosaved_regions = None
+
         # Bind SoundClip's movement to move_plot method
         self.bind(pos=self.move_plot)
 
+    def show(self, WaveformTileCache, *args, **kwargs):
+        # Draw the placeholder, called by TrackContainer when self comes in to view. The tiles are drawn by update_tiles.
+        self.WaveformTileCache = WaveformTileCache
+        self.clip_color_instruction = Color(rgba=self.clip_color)
+        self.background_rectangle = Rectangle(pos=self.pos, size=self.size)
+        self.tile_instructions = InstructionGroup()
+
+        self.waveform_instructions = InstructionGroup()
+        self.waveform_instructions.add(self.clip_color_instruction)
+        self.waveform_instructions.add(self.background_rectangle)
+        self.waveform_instructions.add(Color(rgba=waveform_color))
+        self.waveform_instructions.add(self.tile_instructions)
+        self.canvas.add(self.waveform_instructions)
+
+    def hide(self, *args, **kwargs):
+        # Remove the waveform when self leaves the view. The tiles stay in WaveformTileCache.
+        self.canvas.remove(self.waveform_instructions)
+        self.waveform_instructions = None
+        self.drawn_tiles = []
+        self.drawn_level = None
+        self.drawn_blocks = (0,0)
+
+    def get_waveform_key(self, *args, **kwargs):
+        return (self.path, self.waveform_version)
+
+    def get_tile_inds(self, level, first_block, last_block, *args, **kwargs):
+        blocks_per_tile = tile_width * 2**level
+        return range(first_block//blocks_per_tile, last_block//blocks_per_tile+1)
+
+    def get_cached_tiles(self, level, first_block, last_block, *args, **kwargs):
+        # (tile_ind, texture) of the level's tiles from first_block to last_block if all of them are cached, otherwise None
+        keys = [(self.get_waveform_key(), level, tile_ind) for tile_ind in self.get_tile_inds(level, first_block, last_block)]
+        if not all(self.WaveformTileCache.contains(key) for key in keys):
+            return None
+        return [(key[2], self.WaveformTileCache.get(key)) for key in keys]
+
+    def update_tiles(self, visible_range=None, *args, **kwargs):
+        # Draw the tiles in view at the zoom level of self's width. Also the callback of WaveformTileCache, which calls it without arguments.
+        if visible_range is not None:
+            self.visible_range = visible_range
+        if not self.waveform_instructions or self.visible_range is None:
+            return
+
+        minimums, maximums = self.get_drawn_peaks()
+        block_count = len(maximums)
+        if block_count == 0 or self.width <= 0:
+            return
+
+        # Blocks in view
+        pixels_per_block = self.width/block_count
+        first_block = max(int((self.visible_range[0]-self.x)/pixels_per_block), 0)
+        last_block = min(int((self.visible_range[1]-self.x)/pixels_per_block), block_count-1)
+        if last_block < first_block:
+            return
+
+        # Nothing to do if the drawn tiles are at the right level and cover the view
+        level = get_tile_level(pixels_per_block)
+        drawn_tiles_cover = self.drawn_blocks[0] <= first_block and self.drawn_blocks[1] > last_block
+        if self.drawn_level == level and drawn_tiles_cover:
+            return
+
+        tiles = self.get_cached_tiles(level, first_block, last_block)
+        if tiles is None:
+            # Render the missing tiles
+            for tile_ind in self.get_tile_inds(level, first_block, last_block):
+                key = (self.get_waveform_key(), level, tile_ind)
+                if not self.WaveformTileCache.contains(key):
+                    tile_start, tile_end = get_tile_blocks(level, tile_ind, block_count)
+                    self.WaveformTileCache.request(key, minimums[tile_start:tile_end], maximums[tile_start:tile_end], self.update_tiles)
+
+            # Meanwhile keep the drawn tiles, which are stretched to the new width. If they don't cover the view, use the nearest level which is cached.
+            if drawn_tiles_cover:
+                return
+            nearest_levels = sorted((other_level for other_level in range(max(level-max_tile_level_distance, 0), level+max_tile_level_distance+1) if other_level != level),
+                                    key=lambda other_level : abs(other_level-level))
+            for other_level in nearest_levels:
+                tiles = self.get_cached_tiles(other_level, first_block, last_block)
+                if tiles is not None:
+                    level = other_level
+                    break
+            else:
+                return
+
+        self.draw_tiles(level, tiles)
+
+    def draw_tiles(self, level, tiles, *args, **kwargs):
+        # Replace the drawn tiles with the (tile_ind, texture) of a level
+        block_count = len(self.get_drawn_peaks()[1])
+        self.tile_instructions.clear()
+        self.drawn_tiles = []
+        for tile_ind, texture in tiles:
+            tile_start, tile_end = get_tile_blocks(level, tile_ind, block_count)
+            rectangle = Rectangle(texture=texture)
+            self.tile_instructions.add(rectangle)
+            self.drawn_tiles.append((rectangle, tile_start, tile_end))
+
+        self.drawn_level = level
+        self.drawn_blocks = (self.drawn_tiles[0][1], self.drawn_tiles[-1][2])
+        self.place_tiles()
+
+    def place_tiles(self, *args, **kwargs):
+        # Stretch the drawn tiles to self's position and size
+        self.background_rectangle.pos = self.pos
+        self.background_rectangle.size = self.size
+
+        if self.drawn_tiles:
+            pixels_per_block = self.width/len(self.get_drawn_peaks()[1])
+            for rectangle, tile_start, tile_end in self.drawn_tiles:
+                rectangle.pos = (self.x + tile_start*pixels_per_block, self.y)
+                rectangle.size = ((tile_end-tile_start)*pixels_per_block, self.height)
+
+    def set_color(self, color, *args, **kwargs):
+        # The texture is white, so only the Color instruction changes
+        self.clip_color = color
+        if self.waveform_instructions:
+            self.clip_color_instruction.rgba = color
+
     def scale_plot(self, *args, **kwargs):
-        self.SoundClipPlot.size = self.size
+        if self.waveform_instructions:
+            self.place_tiles()
 
     def move_plot(self, *args, **kwargs):
+        # SoundClips which are far from the view aren't in the layout. They are placed when they are shown.
+        if not self.parent:
+            return
+
         SoundClipField = self.parent.parent
 
         if SoundClipField:
-            # Synchronize SoundClipPlot (the wav plot) with the button
-            self.SoundClipPlot.pos = self.pos
-            # Calculate the new relative position of SoundClip
-            self.relative_x = self.x/SoundClipField.width
-            # Calculate at which sample the audio starts
-            MainView = self.parent.parent.parent.parent.parent
-            self.start_sample = int( MainView.MiddleBar.TrackAxis.TimeSlider.max * self.x/SoundClipField.width )
+            # Synchronize the waveform with the button
+            if self.waveform_instructions:
+                self.place_tiles()
+
+            # Only dragging moves the audio. Placing the SoundClip when the view is zoomed or scrolled doesn't, so the start sample isn't rounded to pixels.
+            if self.pressed:
+                # Calculate the new relative position of SoundClip
+                self.relative_x = self.x/SoundClipField.width
+                # Calculate at which sample the audio starts and move the clip in Session
+                self.start_sample = int( self.Session.length_in_samples * self.x/SoundClipField.width )
+                self.Session.move_clip(self.ClipState, self.start_sample)
+
+                # Dragging a long clip brings blocks into view which may not have been drawn. Nothing is requested if the drawn tiles cover the view.
+                self.update_tiles()
         else:
             print("Error! SoundClip "+str(self)+" has belongs to no SoundClipField and so has most likely been removed.")
 
@@ -186,14 +327,15 @@ class SoundClip(MoveableButton):
         # Remove self
         for track in TrackContainer.Tracks:
             if self in track.SoundClips:
-                # Remove from parent Track's list of SoundClips
+                # Remove from parent Track's list of SoundClips and from Session
                 track.SoundClips.remove(self)
+                self.Session.remove_clip(self.ClipState)
 
-                # Remove from the layout
-                track.TrackSoundClipLayout.remove_widget(self)
+                # Remove from the layout and release the waveform
+                TrackContainer.hide_SoundClip(track, self)
 
-                # Remove self from wav_dict
-                del MainView.wav_dict[self.path]
+                # Remove self from ClipCache
+                MainView.ClipCache.remove(self.path)
 
                 # Delete self and free memory
                 del self
@@ -217,60 +359,67 @@ class SoundClip(MoveableButton):
         # How self is split
         percentage_split = (Window.mouse_pos[0]-x_in_relation_to_window)/self.width
 
-        # Open self's wav to get the samples for the 2 new SoundClips
-        samples = MainView.wav_dict[self.path]
+        # Get self's samples for the 2 new SoundClips, read again from the file if ClipCache has evicted them
+        samples = MainView.ClipCache.get(self.path)
 
         # Get sample at which self is split
         split_sample = int( np.floor( len(samples) * percentage_split ) )
 
         # Get samples for the new SoundClips
-        new_samples_first_half = samples[0:split_sample]
-        new_samples_second_half = samples[split_sample+1:-1]
+        new_samples_first_half, new_samples_second_half = split_clip(samples, split_sample)
 
         # Create new wavs
         new_name_first_half = self.path.split(".wav")[0] + '_1.wav' # add '_1' to the end of the first half to create a new unique name
-        soundfile.write(new_name_first_half, np.frombuffer(b''.join(new_samples_first_half), "Float32"), sampling_rate)
+        write_clip(new_name_first_half, new_samples_first_half, audio_config.sampling_rate)
 
         new_name_second_half = self.path.split(".wav")[0] + '_2.wav' # add '_2' to the end of the second half to create a new unique name
-        soundfile.write(new_name_second_half, np.frombuffer(b''.join(new_samples_second_half), "Float32"), sampling_rate)
+        write_clip(new_name_second_half, new_samples_second_half, audio_config.sampling_rate)
+
+        # Peaks of the halves, then the halves are handed to ClipCache
+        peaks_first_half = WaveformPeaks.from_samples(new_samples_first_half)
+        peaks_second_half = WaveformPeaks.from_samples(new_samples_second_half)
+        new_samples_first_half = MainView.ClipCache.put(new_name_first_half, new_samples_first_half)
+        new_samples_second_half = MainView.ClipCache.put(new_name_second_half, new_samples_second_half)
+
+        # The halves keep self's silence map, so stripped silence stays stripped. The second half starts after the split sample.
+        regions_first_half = section_regions(self.ClipState.regions, 0, split_sample)
+        regions_second_half = section_regions(self.ClipState.regions, split_sample+1, split_sample+1+len(new_samples_second_half))
 
         # Loop to find Track which holds self
         for track in TrackContainer.Tracks:
             if self in track.SoundClips:
 
-                # Create new SoundClip, add it to the layout and open it to wav_dict
+                # Create new SoundClip and add it to the layout
                 track.add_SoundClip(new_name_first_half,                                             # recorded_audio_path
                                     MainView.MiddleBar.TrackScaleController.TimeAxisSlider.max,      # samples_in_time_axis
                                     MainView.TrackContainer.Track_height,                            # Track_height
                                     MainView.TrackContainer.TrackSoundClipView.SoundClipField.width, # SoundClipField_width
-                                    self.start_sample)                                               # start_sample
-
-                # Add to layout
-                track.TrackSoundClipLayout.add_widget(track.SoundClips[-1])
-                # Add to wav_dict
-                MainView.wav_dict[track.SoundClips[-1].path] = new_samples_first_half
+                                    self.start_sample,                                               # start_sample
+                                    new_samples_first_half,                                          # samples
+                                    peaks_first_half,                                                # peaks
+                                    regions_first_half)                                              # regions
 
-                # Place the SoundClip in the layout
-                track.SoundClips[-1].y = track.TrackSoundClipLayout.y
-                track.SoundClips[-1].x = track.SoundClips[-1].relative_x * MainView.TrackContainer.TrackSoundClipView.SoundClipField.width
-                track.SoundClips[-1].move_plot()
+                # Add to layout if it is in view
+                TrackContainer.place_SoundClip(track, track.SoundClips[-1])
+                if self.silence_stripped:
+                    track.SoundClips[-1].draw_regions(regions_first_half)
+                    track.SoundClips[-1].silence_stripped = True
 
                 # The same but this time for the second half
                 track.add_SoundClip(new_name_second_half,                                            # recorded_audio_path
                                     MainView.MiddleBar.TrackScaleController.TimeAxisSlider.max,      # samples_in_time_axis
                                     MainView.TrackContainer.Track_height,                            # Track_height
                                     MainView.TrackContainer.TrackSoundClipView.SoundClipField.width, # SoundClipField_width
-                                    self.start_sample+split_sample+1)                                # start_sample
+                                    self.start_sample+split_sample+1,                                # start_sample
+                                    new_samples_second_half,                                         # samples
+                                    peaks_second_half,                                               # peaks
+                                    regions_second_half)                                             # regions
 
-                # Add to layout
-                track.TrackSoundClipLayout.add_widget(track.SoundClips[-1])
-                # Add to wav_dict
-                MainView.wav_dict[track.SoundClips[-1].path] = new_samples_second_half
-
-                # Place the SoundClip in the layout
-                track.SoundClips[-1].y = track.TrackSoundClipLayout.y
-                track.SoundClips[-1].x = track.SoundClips[-1].relative_x * MainView.TrackContainer.TrackSoundClipView.SoundClipField.width
-                track.SoundClips[-1].move_plot()
+                # Add to layout if it is in view
+                TrackContainer.place_SoundClip(track, track.SoundClips[-1])
+                if self.silence_stripped:
+                    track.SoundClips[-1].draw_regions(regions_second_half)
+                    track.SoundClips[-1].silence_stripped = True
 
                 # Break out since only one SoundClip can be split at a time
                 break
@@ -278,6 +427,34 @@ class SoundClip(MoveableButton):
         # Remove self (the old SoundClip which was just split)
         self.remove_self()
 
+    def strip_silence(self, *args, **kwargs):
+        # Play only the parts of self which are above strip_silence_threshold_in_dB. The silence map is changed in Session and the audio isn't copied or rewritten.
+        regions = self.WaveformPeaks.sounding_regions(strip_silence_threshold_in_dB, strip_silence_padding_blocks)
+        self.Session.set_clip_regions(self.ClipState, regions)
+        self.draw_regions(regions)
+        self.silence_stripped = True
+
+    def draw_regions(self, regions, *args, **kwargs):
+        # Draw only the regions of the audio, so stripped silence isn't drawn. The old tiles are drawn until the new ones have been rendered.
+        self.drawn_regions = regions
+        self.drawn_peaks = None
+        self.waveform_version += 1
+        self.drawn_level = None
+        self.drawn_blocks = (0,0)
+        self.update_tiles()
+
+    def get_drawn_peaks(self, *args, **kwargs):
+        # Peaks of the waveform with the blocks outside drawn_regions flattened, calculated once for each drawn_regions
+        if self.drawn_peaks is None:
+            minimums, maximums = self.WaveformPeaks.get_peaks()
+            if self.drawn_regions is not None:
+                kept_blocks = np.zeros(len(maximums), dtype=bool)
+                for region_start, region_end in self.drawn_regions.tolist():
+                    kept_blocks[region_start//samples_per_peak_block : -(-region_end//samples_per_peak_block)] = True
+                minimums, maximums = np.where(kept_blocks, minimums, 0), np.where(kept_blocks, maximums, 0)
+            self.drawn_peaks = (minimums, maximums)
+        return self.drawn_peaks
+
     def on_press(self, *args, **kwargs):
         MainView = self.parent.parent.parent.parent.parent
 
@@ -285,6 +462,9 @@ class SoundClip(MoveableButton):
         if MainView.cursor_mode == 'x':
             self.split_self()
 
+        elif MainView.cursor_mode == 's':
+            self.strip_silence()
+
         elif MainView.cursor_mode == 'backspace':
             self.remove_self()
 
@@ -299,8 +479,8 @@ class SoundClip(MoveableButton):
             # Naming this parent.parent... chain for clarity
             TrackContainer = self.parent.parent.parent.parent
 
-            # Loop through the Tracks
-            for track in TrackContainer.Tracks:
+            # Loop through the Tracks in view, the others aren't in the layout
+            for track in TrackContainer.shown_Tracks:
                 # If the mouse is between the track.TrackSoundClipLayout's height
                 if self.prev_mouse_pos[1] >= track.TrackSoundClipLayout.y and self.prev_mouse_pos[1] <= track.TrackSoundClipLayout.y+track.TrackSoundClipLayout.height:
 
@@ -319,10 +499,11 @@ class SoundClip(MoveableButton):
                             # print(self.path+" removed from "+parent_Track.TrackControls.TrackNameField.text)
 
                     # Change the moved SoundClip's color to match the Track
-                    self.SoundClipPlot.background_color = track.TrackControls.ColorPickerPopup.ColorWheel.color 
+                    self.set_color(track.TrackControls.color)
 
-                    # Add SoundClip to current track
+                    # Add SoundClip to current track, also in Session
                     track.SoundClips.append(self)
+                    self.Session.move_clip(self.ClipState, track=track.TrackState)
 
                     # Add to Track's layout for SoundClips
                     track.TrackSoundClipLayout.add_widget(self)
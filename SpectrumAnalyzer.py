@@ -0,0 +1,138 @@
+# Project files
+from GlobalAudioVariables import *
+
+# General Python imports
+import math
+from scipy import signal
+import numpy as np
+
+# Global variables
+# How many factors less points are in the plots
+denominator = 10 # There are 1/decimation_factor amount of points in the end
+# Hox many points are in the original frequency response. This is the resolution of the plots and stays the same if the sampling rate is changed.
+points_in_full_frequency_response = int(sampling_rate/2)
+# Calculate how many points are in the final responses
+amount_of_points = math.floor(points_in_full_frequency_response/denominator)
+# TODO 'amount_of_points-1' seems to be more common than, 'amount_of_points' it self due mostly to logarithmic
+# jumps in loops. Should this be changed so that 'amount_of_points' would be more common and the few exceptions
+# would have +/- 1 when/if needed?
+
+# Do not decimate points under this frequency
+start_freq = 1000
+
+# Input fft decay factor
+decay_factor = 0.96
+
+
+def decimate_response(frequencies, complex_response):
+    # Logaritmic x axis stacks more points to right side. This gliches the graph figure if points aren't decreased.
+    # Since there are more points in the right side (at higher frequencies) more points can be skipped there.
+    # The only issue with this is that high q value filters look weird at some low frequencies because their center
+    # frequencies (i.e. where their peaks values are) may not exist in the plot.
+    # 'frequencies' and 'complex_response' are from 'signal.freqz' with 'worN=points_in_full_frequency_response'.
+
+    # List for frequencies
+    decimated_frequencies = np.zeros((amount_of_points-1, 1), dtype=np.float32) # -1 was added to prevent 0 Hz which would lead to log10(0) because of logarithmic x axis
+
+    # List for magnitudes
+    decimated_complex_response = np.empty((amount_of_points-1, 1), dtype='complex_') # Data type has to be specified as complex, so that imaginary values wouldn't be omitted
+
+    # Divide points at equal distances on a logarithmic scale, starting from start_freq
+    jump_of_factor = ((points_in_full_frequency_response)/start_freq)**(1/(amount_of_points-start_freq))
+
+    # Add undecimated points to output arrays. Omit 0 Hz by starting reading from index 1
+    decimated_frequencies[0:start_freq] = frequencies[1:start_freq+1].reshape(start_freq,1)
+    decimated_complex_response[0:start_freq] = complex_response[1:start_freq+1].reshape(start_freq,1)
+
+    # Pick frequencies at logaritmically equal increments. Loop can start minimum from 1 index because floor(0) would lead to 0 Hz and so log10(0) error when logx=True.
+    # Indexes are calculated at once, starting jumping frequencies after last undecimated frequency.
+    freq_inds = np.floor(start_freq * jump_of_factor**np.arange(1, amount_of_points-start_freq+1)).astype(np.int64)
+
+    # Store the frequencies for plots to know the correct x coordinate for plots and the complex amplitudes at selected frequencies
+    decimated_frequencies[start_freq-1:amount_of_points-1] = frequencies[freq_inds].reshape(-1,1)
+    decimated_complex_response[start_freq-1:amount_of_points-1] = complex_response[freq_inds].reshape(-1,1)
+
+    return decimated_frequencies, decimated_complex_response
+
+
+class SpectrumAnalyzer:
+
+    ########################################### Brief description ###########################################
+    # SpectrumAnalyzer calculates the decimated magnitude spectrum of the output which PEQLayout plots. Each
+    # pushed buffer is stored to a circular buffer of about 0.5 seconds. A new fft is taken twice per round
+    # of the circular buffer and in between the magnitudes decay. Magnitudes are scaled so that a 0 dB
+    # digital signal is at 'ceiling_in_dB'.
+    #########################################################################################################
+
+    def __init__(self, fs, buffer_size, floor_in_dB, ceiling_in_dB, *args, **kwargs):
+        super(SpectrumAnalyzer, self).__init__(*args, **kwargs)
+
+        self.floor_in_dB = floor_in_dB
+        self.ceiling_in_dB = ceiling_in_dB
+
+        # Array for storing input fft's magnitudes
+        self.magnitudes_in_dB = np.ones((amount_of_points-1, 1), dtype=np.float32) * -80
+        self.decimated_frequencies = np.ones((amount_of_points-1, 1), dtype=np.float32)
+        self.decay_level = np.ones(self.magnitudes_in_dB.shape,dtype=np.float32) * (floor_in_dB-1) * (1-decay_factor) # Array of some dB values
+        self.epsilon_noise = np.ones((amount_of_points-1, 1), dtype='complex_')*10**((floor_in_dB-1)/20) # Add noise to prevent log10(0) when plotting graph
+
+        self.init_buffers(fs, buffer_size)
+
+    def init_buffers(self, fs, buffer_size, *args, **kwargs):
+        # Buffer for storing input signal data for fft
+        self.fs = fs
+        self.fft_buffer_size = max(math.floor( (((fs)/2)/buffer_size) ), 1) * buffer_size # This is how many full buffers of samples can fit to 0.5 seconds.
+        self.circular_fft_buffer = np.zeros((self.fft_buffer_size), dtype=np.float32)
+        self.circular_buffer_ind = 0
+        self.hann = np.hanning(self.fft_buffer_size) # Hanning window used for windowing fft
+
+    def push(self, audio_buffer, analyze=True, *args, **kwargs):
+        # Put new audio_buffer to circular_fft_buffer. A new fft is calculated only if analyze is True, otherwise only the decay is applied.
+        self.circular_fft_buffer[self.circular_buffer_ind : self.circular_buffer_ind+len(audio_buffer)] = audio_buffer
+
+        # Calculate new fft only some times
+        if (self.circular_buffer_ind == 0 or self.circular_buffer_ind == int(self.fft_buffer_size/2)) and analyze:
+
+            # Put circular buffer in order
+            buffer_in_order = np.concatenate((self.circular_fft_buffer[0:self.circular_buffer_ind], self.circular_fft_buffer[self.circular_buffer_ind:self.fft_buffer_size])) #, axis=1) # buffer may have to be '.reshape()'d.
+            buffer_in_order = np.multiply(buffer_in_order,self.hann) # Apply hanning window to buffer
+
+            # Calculate fft
+            frequencies, complex_response = signal.freqz(buffer_in_order, 1, worN=points_in_full_frequency_response, fs=self.fs) # When denominator 'a' is 1, freqz works as a fft function
+
+            # Decimate points for the logarithmic plot
+            self.decimated_frequencies, decimated_complex_response = decimate_response(frequencies, complex_response)
+
+            # New fft's magnitudes
+            new_magnitudes_in_dB = 20*np.log10( np.add( np.absolute(decimated_complex_response), self.epsilon_noise.reshape(amount_of_points-1, 1) ) )
+
+            # Use peak dB value to scale the signal. dB values from 'freqz' aren't calculated in reference to any value. For this reason a sine wave with peak value of 1
+            # results in different peak dB than a broadband noise with the same peak.
+            peak_dB_value = 20*np.log10( np.max( np.absolute( self.circular_fft_buffer ) ) + 0.00001 ) # Adding 0.00001 (-100 dB) of noise to prevent log10(0) warning
+
+            # Calculate the fft's peak value
+            peak_fft_dB = np.max( new_magnitudes_in_dB )
+
+            # Calculate a correction term. peak_dB_value = peak_fft_dB + dB_correction -> dB_correction = peak_dB_value - peak_fft_dB
+            dB_correction = peak_dB_value - peak_fft_dB
+
+            # Scale the fft so that 0 dB digital signal will be at ceiling_in_dB. I would have liked to add a secondary y axis on the right side which would have displayed
+            # dB values from 0 dB down similarly to 'Logic pro eq'.
+            new_magnitudes_in_dB += dB_correction+self.ceiling_in_dB
+
+            # Pick the largest values from the old and the new. First stack them to matrix and pick the larger value from the two to form a new array.
+            self.magnitudes_in_dB = np.amax( np.concatenate((new_magnitudes_in_dB.reshape(amount_of_points-1, 1), self.magnitudes_in_dB.reshape(amount_of_points-1, 1)),axis=1),axis=1 ).real # There was a harmless Complex number warning from the initial array so '.real' was added
+
+        else:
+            # TODO decay is dependent on the playback buffer size. It would make more sense to have this decay on a separate clock
+
+            # Decay the seen response below the seen y values. The reshape is vital. This runs smoothly for few dozen
+            # iterations but transposes at some point which causes the output to be (N,N) matrix instead of a (N,1) array.
+            self.magnitudes_in_dB = self.magnitudes_in_dB*decay_factor + self.decay_level.reshape(self.magnitudes_in_dB.shape).real
+
+        # Increase index
+        self.circular_buffer_ind += len(audio_buffer)
+
+        # Loop index to beginning if over limits
+        if self.circular_buffer_ind >= self.fft_buffer_size:
+            self.circular_buffer_ind = 0
@@ -0,0 +1,226 @@
+# Project files
+from Mixer import gather_clips, apply_track_eqs, mix_to_stereo
+from OverlapAddFilter import OverlapAddFilter, BatchedOverlapAddFilter
+from ClipFile import load_clip
+
+# General Python imports
+import os
+import queue
+import threading
+import multiprocessing
+import concurrent.futures
+import numpy as np
+import soundfile
+
+# Global variables
+# Worker processes report their progress after this many buffers
+buffers_per_progress_report = 64
+
+# Stems and the master are written as float WAV, so nothing is clipped or rounded before mastering
+stem_subtype = 'FLOAT'
+
+# Share of the whole export which mixing the master from the stems is counted as
+master_share_of_progress = 0.05
+
+# Progress queue and cancel event of a worker process, given by init_stem_worker
+worker_progress_queue = None
+worker_cancel_event = None
+
+
+############################### Stem export ###############################
+# Rendering Tracks to their own files without Kivy. Each Track is rendered in a worker process with the mixer's functions, the same way
+# the playback callback mixes it: clips gathered with their silence maps, the Track's EQ, its gain and its pan. Processes read the clips
+# from their files, which are the store ClipCache reads from too, so no audio is sent from the GUI process.
+
+
+class StemJob:
+
+    ########################################### Brief description ###########################################
+    # StemJob is everything a worker process needs to render one Track: its clips as (start_sample, path,
+    # region_edges), its gain, pan and EQ response from Session, and the file to write. cost is the amount
+    # of clip samples, used to start the longest renders first. StemJob is picklable so it can be sent to
+    # the process.
+    #########################################################################################################
+
+    __slots__ = ('job_ind', 'path', 'clips', 'gain', 'pan', 'eq_response', 'length_in_samples', 'buffer_size', 'fs', 'cost')
+
+    def __init__(self, job_ind, path, clips, gain, pan, eq_response, length_in_samples, buffer_size, fs, cost=0):
+        self.job_ind = job_ind
+        self.path = path
+        self.clips = clips
+        self.gain = gain
+        self.pan = pan
+        self.eq_response = eq_response
+        self.length_in_samples = length_in_samples
+        self.buffer_size = buffer_size
+        self.fs = fs
+        self.cost = cost
+
+
+def init_stem_worker(progress_queue, cancel_event):
+    # Initializer of the worker processes
+    global worker_progress_queue, worker_cancel_event
+    worker_progress_queue = progress_queue
+    worker_cancel_event = cancel_event
+
+
+def render_stem(job):
+    # Render one Track to a stereo file in buffers of job.buffer_size, the buffer size its EQ response was calculated for. Runs in a worker
+    # process. Returns the job's index, or None if the export was cancelled, in which case the unfinished file is removed.
+    samples_by_path = {}
+    clips = []
+    for start_sample, path, regions in job.clips:
+        if path not in samples_by_path:
+            samples_by_path[path] = load_clip(path, job.fs)
+        clips.append((start_sample, samples_by_path[path], regions))
+
+    TrackEQFilter = BatchedOverlapAddFilter()
+    track_eqs = [None if job.eq_response is None else (0, job.eq_response)]
+    track_gains = np.array([job.gain], dtype=np.float32)
+    track_pans = np.array([job.pan], dtype=np.float32)
+    track_buffers = np.zeros((1,job.buffer_size), dtype=np.float32)
+    output_buffer = np.zeros((job.buffer_size,2), dtype=np.float32)
+
+    buffer_starts = range(0, job.length_in_samples, job.buffer_size)
+    cancelled = False
+    with soundfile.SoundFile(job.path, 'w', job.fs, 2, stem_subtype) as stem_file:
+        for buffer_ind, buffer_start_sample in enumerate(buffer_starts):
+            if worker_cancel_event.is_set():
+                cancelled = True
+                break
+
+            track_buffers[:,:] = 0
+            gather_clips(track_buffers, [clips], buffer_start_sample)
+            apply_track_eqs(TrackEQFilter, track_buffers, track_eqs)
+            mix_to_stereo(track_buffers, track_gains, track_pans, output_buffer)
+            stem_file.write(output_buffer)
+
+            if (buffer_ind+1) % buffers_per_progress_report == 0:
+                worker_progress_queue.put((job.job_ind, (buffer_ind+1)/len(buffer_starts)))
+
+    if cancelled:
+        os.remove(job.path)
+        return None
+
+    worker_progress_queue.put((job.job_ind, 1.0))
+    return job.job_ind
+
+
+def mix_master(stem_paths, master_path, master_gain, master_response, buffer_size, fs, cancel_event):
+    # Sum the stems to the master, apply the master gain and the output EQ like the playback callback does. The stems are read one buffer
+    # at a time, so the master takes no more memory than a buffer per stem. Stops at the next buffer when cancel_event is set.
+    output_filter = None
+    if master_response is not None:
+        output_filter = OverlapAddFilter(buffer_size, 2)
+        output_filter.complete_complex_response = master_response
+
+    stem_files = [soundfile.SoundFile(path) for path in stem_paths]
+    try:
+        with soundfile.SoundFile(master_path, 'w', fs, 2, stem_subtype) as master_file:
+            while not cancel_event.is_set():
+                stem_buffers = [stem_file.read(buffer_size, dtype='float32', always_2d=True) for stem_file in stem_files]
+                if len(stem_buffers[0]) == 0:
+                    break
+
+                output_buffer = np.zeros((buffer_size,2), dtype=np.float32)
+                for stem_buffer in stem_buffers:
+                    output_buffer[0:len(stem_buffer)] += stem_buffer
+                output_buffer *= master_gain
+
+                if output_filter:
+                    output_buffer[:,0] = output_filter.filter_audio(output_buffer[:,0], 0)
+                    output_buffer[:,1] = output_filter.filter_audio(output_buffer[:,1], 1)
+                master_file.write(output_buffer[0:len(stem_buffers[0])])
+    finally:
+        for stem_file in stem_files:
+            stem_file.close()
+
+
+class StemExport:
+
+    ########################################### Brief description ###########################################
+    # StemExport renders StemJobs in a pool of process_count worker processes and then mixes the stems to
+    # the master file. Tracks are independent, so with as many processes as cores the stems take about the
+    # time of the longest Track instead of all of them. The longest renders are started first so the pool
+    # isn't left waiting for one late Track. Everything runs in StemExport's own thread, the GUI only polls
+    # get_progress and may cancel. Cancelling stops the workers at their next buffer and removes the
+    # unfinished files.
+    #
+    # status is 'running', 'done', 'cancelled' or 'failed', in which case error has the exception.
+    #########################################################################################################
+
+    def __init__(self, jobs, master_path, master_gain, master_response, process_count=0, *args, **kwargs):
+        super(StemExport, self).__init__(*args, **kwargs)
+
+        self.jobs = jobs
+        self.master_path = master_path
+        self.master_gain = master_gain
+        self.master_response = master_response
+
+        # 0 uses all cores
+        if process_count <= 0:
+            process_count = os.cpu_count() or 1
+        self.process_count = min(process_count, max(len(jobs),1))
+
+        # Progress of each job from 0 to 1 and of the master
+        self.job_progress = [0.0]*len(jobs)
+        self.master_progress = 0.0
+
+        self.status = 'running'
+        self.error = None
+
+        # Processes are spawned, so the workers don't inherit the audio device or the GUI's threads. Spawned processes import the program's
+        # main module again, which imports Kivy. Without a window provider Kivy doesn't open a window in them.
+        os.environ['KIVY_WINDOW'] = 'none'
+        context = multiprocessing.get_context('spawn')
+        self.progress_queue = context.Queue()
+        self.cancel_event = context.Event()
+        self.context = context
+
+        self.thread = threading.Thread(target=self.export_process, daemon=True)
+        self.thread.start()
+
+    def cancel(self, *args, **kwargs):
+        self.cancel_event.set()
+
+    def get_progress(self, *args, **kwargs):
+        # Progress of the whole export from 0 to 1. Called from the GUI thread.
+        while True:
+            try:
+                job_ind, progress = self.progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.job_progress[job_ind] = progress
+
+        stems_progress = sum(self.job_progress)/len(self.job_progress) if self.job_progress else 1.0
+        return (1-master_share_of_progress)*stems_progress + master_share_of_progress*self.master_progress
+
+    def remove_files(self, *args, **kwargs):
+        for path in [job.path for job in self.jobs]+[self.master_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def export_process(self, *args, **kwargs):
+        try:
+            with concurrent.futures.ProcessPoolExecutor(self.process_count, mp_context=self.context, initializer=init_stem_worker, initargs=(self.progress_queue, self.cancel_event)) as executor:
+                futures = [executor.submit(render_stem, job) for job in sorted(self.jobs, key=lambda job: job.cost, reverse=True)]
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+
+            if not self.cancel_event.is_set() and self.jobs:
+                buffer_size = self.jobs[0].buffer_size
+                mix_master([job.path for job in self.jobs], self.master_path, self.master_gain, self.master_response, buffer_size, self.jobs[0].fs, self.cancel_event)
+                self.master_progress = 1.0
+
+        except Exception as error:
+            self.cancel_event.set()
+            self.remove_files()
+            self.error = error
+            self.status = 'failed'
+            return
+
+        if self.cancel_event.is_set():
+            self.remove_files()
+            self.status = 'cancelled'
+        else:
+            self.status = 'done'
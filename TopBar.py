@@ -3,8 +3,10 @@ from kivy.uix.floatlayout import FloatLayout
 from kivy.graphics import Color, Line
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
+from kivy.uix.label import Label
 
 # Project files
+from AudioConfig import audio_config
 from GlobalAudioVariables import *
 from VolumeSliderBox import VolumeSliderBox
 from PEQPopup import PEQPopup
@@ -91,7 +93,72 @@ class TimeTable(TextInput):
 
             # Move TimeSlider once value has been changed
             TimeSlider = self.parent.parent.MiddleBar.TrackAxis.TimeSlider
-            TimeSlider.value = float(self.text)*sampling_rate
+            TimeSlider.value = float(self.text)*audio_config.sampling_rate
+
+
+class LoudnessReadout(Label):
+
+    ########################################### Brief description ###########################################
+    # LoudnessReadout is a Label in TopBar which shows the output's momentary (M), short-term (S) and
+    # integrated (I) loudness in LUFS and true peak (TP) in dBTP, measured by LoudnessMeter.
+    #########################################################################################################
+
+    def __init__(self, *args, **kwargs):
+        super(LoudnessReadout, self).__init__(**kwargs)
+
+        # Define text color and size
+        self.color = (0.9,0.9,0.9, 1)
+        self.font_size = 14
+
+        # Define size
+        self.size_hint = (None,None)
+        self.size = (360,20)
+
+        # Show empty values until something has been played
+        self.show_results({'momentary_LUFS': None, 'short_term_LUFS': None, 'integrated_LUFS': None, 'true_peak_dBTP': None})
+
+    def format_value(self, value, *args, **kwargs):
+        # Values are -inf or None when there is nothing to measure
+        if value is None or value == float('-inf'):
+            return " -inf"
+        return "{:5.1f}".format(value)
+
+    def show_results(self, results, *args, **kwargs):
+        text = "M "+self.format_value(results['momentary_LUFS'])+"   S "+self.format_value(results['short_term_LUFS'])+"   I "+self.format_value(results['integrated_LUFS'])+" LUFS   TP "+self.format_value(results['true_peak_dBTP'])+" dBTP"
+
+        # Setting text re-renders the label, so only do it if it has changed
+        if text != self.text:
+            self.text = text
+
+
+class DSPLoadReadout(Button):
+
+    ########################################### Brief description ###########################################
+    # DSPLoadReadout is a button in TopBar which shows how much of the deadline the playback callback uses
+    # on average and at most, and how many times the output has run out of audio (XRUN). Pressing it dumps
+    # the measurements of DSPLoadMonitor to a JSON file.
+    #########################################################################################################
+
+    def __init__(self, *args, **kwargs):
+        super(DSPLoadReadout, self).__init__(**kwargs)
+
+        # Look like a label
+        self.background_color = (0,0,0, 0)
+        self.color = (0.9,0.9,0.9, 1)
+        self.font_size = 14
+
+        # Define size
+        self.size_hint = (None,None)
+        self.size = (260,20)
+
+        self.show_summary({'mean_load': 0.0, 'maximum_load': 0.0, 'status_counts': {'output_underflow': 0}})
+
+    def show_summary(self, summary, *args, **kwargs):
+        text = "DSP {:3.0f}%   max {:3.0f}%   XRUN {}".format(summary['mean_load'], summary['maximum_load'], summary['status_counts']['output_underflow'])
+
+        # Setting text re-renders the label, so only do it if it has changed
+        if text != self.text:
+            self.text = text
 
 
 class TopBar(FloatLayout):
@@ -174,5 +241,13 @@ class TopBar(FloatLayout):
         self.MasterVolume = VolumeSliderBox(size_hint=(0.2,1),pos_hint={"center_y":0.05,"right":0.95})
         self.add_widget(self.MasterVolume)
 
+        # Add LoudnessReadout above PEQButton
+        self.LoudnessReadout = LoudnessReadout(pos_hint={"center_y":0.85,"right":0.95})
+        self.add_widget(self.LoudnessReadout)
+
+        # Add DSPLoadReadout to the upper left corner
+        self.DSPLoadReadout = DSPLoadReadout(pos_hint={"center_y":0.85,"x":0.02})
+        self.add_widget(self.DSPLoadReadout)
+
     def open_PEQPopup(self, *args, **kwargs):
         self.PEQPopup.open()
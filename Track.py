@@ -6,17 +6,22 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.button import Button
 from kivy.uix.colorpicker import ColorPicker
 from kivy.uix.popup import Popup
-from kivy.graphics import Color, Rectangle, InstructionGroup
+from kivy.graphics import Color, Rectangle, Mesh, InstructionGroup
+from kivy.properties import BooleanProperty, ListProperty
 
 # Project files
 from SoundClip import SoundClip
+from PEQPopup import PEQPopup
 from VolumeSliderBox import VolumeSliderBox
+from WaveformPeaks import WaveformPeaks
+from ClipFile import write_clip
+from ClipSamples import ClipSamples
+from AudioConfig import audio_config
 from GlobalAudioVariables import *
 
 # General Python imports
+import os
 import random 
-import pyaudio
-import soundfile
 import numpy as np
 import gc
 
@@ -36,16 +41,14 @@ class ColorWheel(ColorPicker):
             if c != self.wheel:
                 self.wheel.parent.remove_widget(c)
 
-        # Have some other color than white when Track is added
-        self.color = (random.random(),random.random(),random.random(), 1)
-
 
 class ColorPickerPopup(Popup):
 
     ########################################### Brief description ###########################################
     # ColorPickerPopup allows the user to change a Track's SoundClip's color. ColorPickerPopup can be opened
     # by pressing the 'C' button on each TrackControls. Just like all popups, ColorPickerPopup can be closed
-    # by clicking outside the popup.
+    # by clicking outside the popup. ColorPickers are slow to create, so TrackControls creates its
+    # ColorPickerPopup when the button is pressed the first time.
     #########################################################################################################
 
     def __init__(self, *args, **kwargs):
@@ -109,9 +112,18 @@ class TrackControls(FloatLayout):
 
     ########################################### Brief description ###########################################
     # TrackControls is a layout which stores objects controling the Track. TrackControls objects are stacked 
-    # to TrackControllerField (TrackContainer.py), located in the left side of the main layout.
+    # to TrackControllerField (TrackContainer.py), located in the left side of the main layout. mute_bool
+    # and solo_bool are Kivy properties, so Track can bind to them and pass the changes on to Session. So is
+    # color, the color of the Track's SoundClips, which ColorPickerPopup changes.
     #########################################################################################################
 
+    # Bools for wheather the channel is muted or soloed
+    mute_bool = BooleanProperty(False)
+    solo_bool = BooleanProperty(False)
+
+    # Color of the Track's SoundClips
+    color = ListProperty([1,1,1, 1])
+
     def __init__(self, Nth_track_created, **kwargs):
         super(TrackControls, self).__init__(**kwargs)
 
@@ -153,16 +165,31 @@ class TrackControls(FloatLayout):
         # Bind MuteBoolBtn to its method
         self.RecBoolBtn.bind(on_release=self.change_Track_recording_status)
 
-        # Icon image, optional
-        self.ColorPickerPopup = ColorPickerPopup()
-        self.ColorPickerBtn = Button(text="C", color=self.ColorPickerPopup.ColorWheel.color, size_hint=(None,None), size=(10,10), pos_hint={'center_x':0.35, 'top':0.4})
+        # Have some other color than white when Track is added
+        self.color = [random.random(),random.random(),random.random(), 1]
+
+        # Icon image, optional. The ColorPickerPopup is created when ColorPickerBtn is pressed the first time.
+        self.ColorPickerPopup = None
+        self.ColorPickerBtn = Button(text="C", color=self.color, size_hint=(None,None), size=(10,10), pos_hint={'center_x':0.35, 'top':0.4})
         self.add_widget(self.ColorPickerBtn)
-        self.ColorPickerBtn.bind(on_release=self.ColorPickerPopup.open)
+        self.ColorPickerBtn.bind(on_release=self.open_ColorPickerPopup)
+
+        # Button for opening the Track's parametric equalizer. Track binds it, since the PEQPopup is created on the first press.
+        self.EQBtn = Button(text="E", size_hint=(None,None), size=(10,10), pos_hint={'center_x':0.45, 'top':0.4})
+        self.add_widget(self.EQBtn)
 
         # Slider for controling the Track's panning between left and right channels
         self.TrackPanSlider = Slider(orientation='horizontal', size_hint=(None,None), size=(180,10), min=0,max=1,value=0.5, pos_hint={'right':1, 'top':0.4})
         self.add_widget(self.TrackPanSlider)
 
+    def open_ColorPickerPopup(self, *args, **kwargs):
+        # Create the popup on first use, starting from the Track's color
+        if self.ColorPickerPopup is None:
+            self.ColorPickerPopup = ColorPickerPopup()
+            self.ColorPickerPopup.ColorWheel.color = self.color
+            self.ColorPickerPopup.ColorWheel.bind(color=lambda ColorWheel, color : setattr(self, 'color', list(color)))
+        self.ColorPickerPopup.open()
+
     def change_Track_mute_status(self, *args, **kwargs):
         if self.mute_bool:
             # If the channel was muted, turn mute off and set the original color
@@ -204,7 +231,8 @@ class RecordingPlotLayout(BoxLayout):
 
     ########################################### Brief description ###########################################
     # RecordingPlotLayout is a red box which appears when a Track is recording. RecordingPlotLayout's length
-    # indicates how much has been recorded.
+    # indicates how much has been recorded and the waveform drawn on top of it is grown from the recording
+    # Track's WaveformPeaks as the audio arrives.
     #########################################################################################################
 
     def __init__(self, **kwargs):
@@ -212,6 +240,9 @@ class RecordingPlotLayout(BoxLayout):
 
         # Was using a Graph previously, but it had unsolvable Warnings (invalid frustrum...) so switched to a canvas instead
 
+        # WaveformPeaks of the audio being recorded. Set by Track when recording starts and removed when it stops.
+        self.peaks = None
+
         # Create instructions for canvas and add it
         self.canvas_instructions = InstructionGroup()
         self.canvas_instructions.add(Color(rgba=(0.7,0.1,0.1, 1)))
@@ -234,9 +265,31 @@ class RecordingPlotLayout(BoxLayout):
         self.canvas_instructions.add(Color(rgba=(0.7,0.1,0.1, 1)))
         self.canvas_instructions.add(Rectangle(size=self.size,pos=self.pos))
 
+        # Draw the waveform recorded so far on top of the red box
+        if self.peaks:
+            self.add_waveform_instructions()
+
         # Add new canvas
         self.canvas.add(self.canvas_instructions)
 
+    def add_waveform_instructions(self, *args, **kwargs):
+        # Combine peaks so that there is at most one vertical line per pixel
+        minimums, maximums = self.peaks.reduced(self.width)
+        column_count = len(maximums)
+
+        if column_count == 0:
+            return
+
+        # Each column is a vertical line from the minimum to the maximum. Vertices are (x, y, u, v) and two vertices form a line.
+        vertices = np.zeros((column_count*2, 4), dtype=np.float32)
+        vertices[0::2,0] = self.x + np.arange(column_count) * self.width/column_count
+        vertices[1::2,0] = vertices[0::2,0]
+        vertices[0::2,1] = self.y + (minimums+1)/2 * self.height # Amplitudes from -1 to 1 are scaled to the height of self
+        vertices[1::2,1] = self.y + (maximums+1)/2 * self.height
+
+        self.canvas_instructions.add(Color(rgba=(1,1,1, 0.6)))
+        self.canvas_instructions.add(Mesh(vertices=vertices.reshape(-1).tolist(), indices=list(range(column_count*2)), mode='lines'))
+
 
 class Track:
 
@@ -244,9 +297,16 @@ class Track:
     # Track is the class which contains all objects related to a single Track.
     #########################################################################################################
 
-    def __init__(self, Nth_track_created, *args, **kwargs):
+    def __init__(self, Nth_track_created, AudioBackend, Session, *args, **kwargs):
         super(Track, self).__init__(*args, **kwargs)
 
+        # AudioBackend shared with MainView, used for opening the input stream when recording
+        self.AudioBackend = AudioBackend
+
+        # Session shared with MainView and this Track's state in it. The audio engine reads the Track's settings and clips from Session, never from the widgets.
+        self.Session = Session
+        self.TrackState = Session.add_track()
+
         # Layout displaying how Track's recording is progressing with a red box
         self.RecordingPlotLayout = RecordingPlotLayout()
 
@@ -262,11 +322,20 @@ class Track:
         # Bind y of self.TrackControls and SoundClips to match
         self.TrackControls.bind(y=self.match_Track_attributes_ys)
 
-        # Bind ColorWheel to change the color of SoundClips. Method call is triggered when color attribute is changed.
-        self.TrackControls.ColorPickerPopup.ColorWheel.bind(color=self.change_color)
+        # Pass changes of the Track's controls to Session
+        self.TrackControls.VolumeSliderBox.VolumeSlider.bind(linear_gain_factor=self.update_TrackState)
+        self.TrackControls.TrackPanSlider.bind(value=self.update_TrackState)
+        self.TrackControls.bind(mute_bool=self.update_TrackState, solo_bool=self.update_TrackState)
+
+        # Parametric equalizer of the Track. Most Tracks never use theirs, so it is created when EQBtn is pressed the first time.
+        self.PEQPopup = None
+        self.TrackControls.EQBtn.bind(on_release=self.open_PEQPopup)
 
-        # Basic object for recording audio
-        self.audio = pyaudio.PyAudio()
+        # Bind the Track's color to change the color of SoundClips. Method call is triggered when color attribute is changed.
+        self.TrackControls.bind(color=self.change_color)
+
+        # Names and colors aren't heard, so Session doesn't see their changes. They are marked for the autosave here.
+        self.TrackControls.TrackNameField.bind(text=lambda TrackNameField, text : self.Session.mark_edited(self.TrackState))
 
         # Add variable for latest recorded clip of audio
         self.latest_recorded_audio_file = ''
@@ -280,31 +349,60 @@ class Track:
         # Initiate list for holding audio buffers
         self.recorded_buffers = []
 
+        # How many samples have been recorded so far. Used by MainView to move TimeSlider during recording.
+        self.recorded_sample_count = 0
+
+        # WaveformPeaks which are calculated while recording
+        self.recording_peaks = None
+
+        # Samples and WaveformPeaks of the latest recorded clip. These are handed to the new SoundClip and ClipCache so the recorded file doesn't have to be read and scanned again.
+        self.latest_recorded_samples = None
+        self.latest_recorded_peaks = None
+
         # Unique number used for naming unique audio file names
         self.Nth_track_created = Nth_track_created
 
+    def new_audio_file_path(self, *args, **kwargs):
+        # Unique name for the Track's next audio file. Files of loaded sessions may already have the names the counter gives, so existing names are skipped.
+        while True:
+            path = ".\\Recorded Audio Files\\"+str(self.Nth_track_created)+"_"+self.TrackControls.TrackNameField.text+"#"+str(self.audio_clip_counter)+".wav"
+            # Increase counter so next audio file has a unique name and doesn't overwrite previous files
+            self.audio_clip_counter += 1
+            if not os.path.exists(path):
+                return path
+
     def match_Track_attributes_ys(self, *args, **kwargs):
         # Match RecordingPlotLayout's y with TrackControl box y
         self.RecordingPlotLayout.y = self.TrackControls.y
 
-        # Match all SoundClips y coordinate to the TrackControl box y.
+        # Match all SoundClips y coordinate to the TrackControl box y. SoundClips which aren't in the layout are placed when they are shown.
         for clip in self.SoundClips:
-            clip.y = self.TrackControls.y
+            if clip.parent:
+                clip.y = self.TrackControls.y
 
     def recording_process(self, start_or_stop_rec=True, *args, **kwargs):
         # start_or_stop_rec==True->Start recording, False->Stop recording
         if start_or_stop_rec:
             # Initiate audio input stream
-            self.stream = self.audio.open(format=pyaudio.paFloat32, channels=number_of_input_channels, rate=sampling_rate, input=True, frames_per_buffer=samples_per_recording_buffer)
+            # Buffer size is read once, so a setting changed during recording doesn't affect this recording
+            buffer_size = audio_config.samples_per_recording_buffer
+            self.stream = self.AudioBackend.open_input_stream(audio_config.number_of_input_channels, audio_config.sampling_rate, buffer_size)
             # List containing received audio buffers
             self.recorded_buffers = []
+            self.recorded_sample_count = 0
+            # Peaks are calculated buffer by buffer so RecordingPlotLayout can draw the waveform during recording. A local name is used in the loop since the attribute is cleared when recording stops.
+            recording_peaks = WaveformPeaks()
+            self.recording_peaks = recording_peaks
+            self.RecordingPlotLayout.peaks = recording_peaks
             # Make sure the loop starts
             self.receiving_audio = True
 
             # Start receiving audio until self.recording_process(False) is called
             while self.receiving_audio:
-                data = self.stream.read(samples_per_recording_buffer)
+                data = self.stream.read(buffer_size).reshape(-1)
                 self.recorded_buffers.append(data)
+                recording_peaks.append(data)
+                self.recorded_sample_count += len(data)
 
         else:
             # Stop while loop in the separate thread
@@ -315,11 +413,21 @@ class Track:
             self.stream.close()
 
             # Save the recorded file's name so this file can be added to the GUI
-            self.latest_recorded_audio_file = ".\\Recorded Audio Files\\"+str(self.Nth_track_created)+"_"+self.TrackControls.TrackNameField.text+"#"+str(self.audio_clip_counter)+".wav"
-            # Increase counter so next audio file has a unique name and doesn't overwrite previous files
-            self.audio_clip_counter += 1
+            self.latest_recorded_audio_file = self.new_audio_file_path()
+            # Combine the buffers and store them in recorded_clip_encoding
+            self.latest_recorded_samples = ClipSamples.from_float(np.concatenate(self.recorded_buffers) if self.recorded_buffers else np.zeros(0, dtype=np.float32), recorded_clip_encoding)
             # Write the audio file
-            soundfile.write(self.latest_recorded_audio_file, np.frombuffer(b''.join(self.recorded_buffers), "Float32"), sampling_rate)
+            write_clip(self.latest_recorded_audio_file, self.latest_recorded_samples, audio_config.sampling_rate)
+
+            # Write the last partial block of peaks. The recording thread may have appended one more buffer while the stream was stopped, so recalculate if the counts don't match.
+            self.recording_peaks.finalize()
+            if self.recording_peaks.sample_count != len(self.latest_recorded_samples):
+                self.recording_peaks = WaveformPeaks.from_samples(self.latest_recorded_samples)
+            self.latest_recorded_peaks = self.recording_peaks
+
+            # Stop drawing the recording waveform
+            self.recording_peaks = None
+            self.RecordingPlotLayout.peaks = None
 
             # Delete and free memory from the recorded audio
             del self.recorded_buffers
@@ -333,18 +441,46 @@ class Track:
         self.TrackControls.height = height
         self.RecordingPlotLayout.height = height
 
-        # Change all SoundClips height
+        # Change the height of the SoundClips in the layout, the others get it when they are shown
         for clip in self.SoundClips:
-            clip.height = height
+            if clip.parent:
+                clip.height = height
 
     def change_color(self, *args, **kwargs):
         # Change the color button's letter color
-        self.TrackControls.ColorPickerBtn.color = self.TrackControls.ColorPickerPopup.ColorWheel.color
+        self.TrackControls.ColorPickerBtn.color = self.TrackControls.color
 
         # Change plot colors
         for clip in self.SoundClips:
-            clip.SoundClipPlot.background_color = self.TrackControls.ColorPickerPopup.ColorWheel.color
-
-    def add_SoundClip(self, recorded_audio_path, samples_in_time_axis, Track_height, SoundClipField_width, start_sample, *args, **kwargs):
-        # Append new SoundClip to self's list
-        self.SoundClips.append(SoundClip(recorded_audio_path, samples_in_time_axis, Track_height, SoundClipField_width, self.TrackControls.ColorPickerPopup.ColorWheel.color, start_sample))
+            clip.set_color(self.TrackControls.color)
+
+        self.Session.mark_edited(self.TrackState)
+
+    def update_TrackState(self, *args, **kwargs):
+        # Copy the settings of TrackControls to the Track's state in Session
+        self.Session.set_track(self.TrackState,
+                               gain=self.TrackControls.VolumeSliderBox.VolumeSlider.linear_gain_factor,
+                               pan=self.TrackControls.TrackPanSlider.value,
+                               mute=self.TrackControls.mute_bool,
+                               solo=self.TrackControls.solo_bool)
+
+    def create_PEQPopup(self, *args, **kwargs):
+        # Create the PEQ on first use. It is only an editor, its response is passed to Session and the audio engine filters the Track.
+        if self.PEQPopup is None:
+            self.PEQPopup = PEQPopup()
+            self.PEQPopup.PEQLayout.response_callback = self.update_EQ
+
+    def open_PEQPopup(self, *args, **kwargs):
+        self.create_PEQPopup()
+        self.PEQPopup.open()
+
+    def update_EQ(self, complete_complex_response, *args, **kwargs):
+        self.Session.set_track_eq(self.TrackState, complete_complex_response)
+
+    def add_SoundClip(self, recorded_audio_path, samples_in_time_axis, Track_height, SoundClipField_width, start_sample, samples, peaks=None, regions=None, *args, **kwargs):
+        # Append new SoundClip to self's list and add its samples to Session. If the clip's WaveformPeaks are already known they are reused. The
+        # silence map comes from the same peaks, so blocks below playback_silence_threshold_in_dB are skipped by the mixer without scanning the audio again, unless regions are given.
+        self.SoundClips.append(SoundClip(recorded_audio_path, samples_in_time_axis, Track_height, SoundClipField_width, self.TrackControls.color, start_sample, peaks))
+        self.SoundClips[-1].Session = self.Session
+        self.SoundClips[-1].ClipState = self.Session.add_clip(self.TrackState, recorded_audio_path, self.SoundClips[-1].start_sample, samples,
+                                                         regions if regions is not None else self.SoundClips[-1].WaveformPeaks.sounding_regions())
@@ -1,6 +1,6 @@
 # Kivy imports
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.gridlayout import GridLayout
+from kivy.uix.floatlayout import FloatLayout
 from kivy.graphics import Color, Rectangle, Line, InstructionGroup
 from kivy.uix.slider import Slider
 from kivy.core.window import Window
@@ -9,13 +9,14 @@ from kivy.uix.button import Button
 
 # Project files
 from Track import Track
+from AudioConfig import audio_config
 from GlobalAudioVariables import *
 
 # General Python imports
 import gc
 
 # Global variables
-# Minimum and maximum amount of time shown in TrackSoundClipView
+# Minimum and maximum amount of time shown in TrackSoundClipView on start up. MainView scales the sliders if the sampling rate is changed.
 minimum_time = 5  * sampling_rate # Seconds * Sampling rate = Samples
 maximum_time = 60 * sampling_rate # Seconds * Sampling rate = Samples
 
@@ -24,6 +25,12 @@ minimum_track_height = 100
 maximum_track_height = 400
 init_track_height = 200
 
+# SoundClips within this many view widths to the left and right of TrackSoundClipView are kept in the layout, so scrolling doesn't show them late
+clip_view_margin = 0.5
+
+# Tracks within this many rows above and below TrackSoundClipView are kept in the layouts
+track_view_margin = 2
+
 
 ############################### FOLLOWING CLASSES USED FOR MiddleBar ###############################
 
@@ -48,7 +55,7 @@ class TimeSlider(Slider):
 
     ########################################### Brief description ###########################################
     # TimeSlider controls which SoundClips are played and where Tracks will record. Values correspond to
-    # audio sample values, meaning each second of audio has 'sampling_rate' amount of samples.
+    # audio sample values, meaning each second of audio has 'audio_config.sampling_rate' amount of samples.
     #########################################################################################################
 
     def __init__(self, *args, **kwargs):
@@ -97,7 +104,7 @@ class TimeSlider(Slider):
         TimeTable = self.parent.parent.parent.parent.TopBar.TimeTable
 
         # Set new value to TimeTable
-        value = str(round(self.value/sampling_rate,1))
+        value = str(round(self.value/audio_config.sampling_rate,1))
 
         # Align TimeTable's value to the right using spaces if needed.
         if len(value) < 4:
@@ -260,8 +267,8 @@ class TrackControllerView(ScrollView):
         # Define size
         self.size_hint = (0.2,1)
 
-        # Add layout containing TrackControls 
-        self.TrackControllerField = GridLayout(cols=1,size_hint=(1,None),height=0)
+        # Add layout containing TrackControls. TrackContainer places the TrackControls of the Tracks in view.
+        self.TrackControllerField = FloatLayout(size_hint=(1,None),height=0)
         self.add_widget(self.TrackControllerField)
 
         # "Disable" scrolling from this layout by setting bars as only type of scrolling and bar_width to 0
@@ -311,8 +318,8 @@ class TrackSoundClipView(ScrollView):
         self.bar_color = [0.8,0.8,0.8, 0.9]
         self.bar_inactive_color = [0.8,0.8,0.8, 0.2]
 
-        # Add the layout to the ScrollView
-        self.SoundClipField = GridLayout(cols=1,size_hint=(None,None),size=(0,0)) # height has to be 0 on init since there are no objects inside the layout, width is 0 because in init self.width is 100 and so the width has to be altered after init anyway
+        # Add the layout to the ScrollView. TrackContainer places the TrackSoundClipLayouts of the Tracks in view.
+        self.SoundClipField = FloatLayout(size_hint=(None,None),size=(0,0)) # height has to be 0 on init since there are no objects inside the layout, width is 0 because in init self.width is 100 and so the width has to be altered after init anyway
         self.add_widget(self.SoundClipField)
 
     def init_background_color(self, r, g, b, alpha, *args, **kwargs):
@@ -340,6 +347,12 @@ class TrackContainer(BoxLayout):
     ########################################### Brief description ###########################################
     # TrackContainer is the layout under TopBar and MiddleBar. It splits in to TrackControllerView and 
     # TrackSoundClipView and holds all Tracks.
+    #
+    # Only the Tracks in view, and track_view_margin rows around it, have their TrackControls and
+    # TrackSoundClipLayout in the layouts. The order of the rows is the order of Tracks and every row is
+    # Track_height high, so where a Track goes is calculated from its index, and adding, removing or
+    # resizing Tracks places only the rows in view however many Tracks there are. shown_Tracks are the
+    # Tracks in the layouts.
     #########################################################################################################
 
     def __init__(self, *args, **kwargs):
@@ -359,9 +372,12 @@ class TrackContainer(BoxLayout):
         # Attribute holding MiddleBar.TrackScaleController.TrackHeightSlider.value
         self.Track_height = init_track_height
 
-        # List for Track objects
+        # List for Track objects, from the top row to the bottom one
         self.Tracks = []
 
+        # Tracks whose layouts are in TrackControllerField and SoundClipField
+        self.shown_Tracks = []
+
         # Which Track object is active. Used for removing 
         self.active_Track = None
 
@@ -371,9 +387,13 @@ class TrackContainer(BoxLayout):
         # Counter which gives Tracks unique names
         self.Tracks_created_counter = 1
 
+        # Show and hide SoundClips and Tracks when the view is scrolled or resized
+        self.TrackSoundClipView.bind(scroll_x=self.update_visible_SoundClips, width=self.update_visible_SoundClips)
+        self.TrackSoundClipView.bind(scroll_y=self.update_visible_Tracks, height=self.update_visible_Tracks)
+
     def add_Track(self, *args, **kwargs):
-        # Create new Track
-        track = Track(self.Tracks_created_counter)
+        # Create new Track. Tracks record through MainView's AudioBackend and add their state to MainView's Session.
+        track = Track(self.Tracks_created_counter, self.parent.AudioBackend, self.parent.Session)
 
         # Increase counter used to give Tracks unique names
         self.Tracks_created_counter += 1
@@ -381,63 +401,43 @@ class TrackContainer(BoxLayout):
         # Add Track to list of Tracks
         self.Tracks.append(track)
 
-        # Set height
-        track.set_height(self.Track_height)
-
-        # Set the TrackControls' width to match the left side box's width
-        track.TrackControls.width = self.TrackControllerView.TrackControllerField.width
-
-        # Add the Track's controls to the layout. Located in the left side of the GUI
-        self.TrackControllerView.TrackControllerField.add_widget(track.TrackControls)
-
-        # Increase the left side layout's height by the Track's height
-        self.TrackControllerView.TrackControllerField.height = self.TrackControllerView.TrackControllerField.height + self.Track_height
-
-        # Add self.Track_height to all SoundClip's y so they stay were they were, since the height was increased
-        for track in self.Tracks:
-            for clip in track.SoundClips:
-                clip.y += self.Track_height
+        # Rows have their height set by TrackContainer, their width follows the layouts
+        track.TrackControls.size_hint = (1,None)
+        track.TrackSoundClipLayout.size_hint = (1,None)
 
         # Bind on_touch_up events to change the active_Track attribute
         track.TrackControls.bind(on_touch_up=self.change_active_Track)
         track.TrackSoundClipLayout.bind(on_touch_up=self.remove_active_Track)
 
-        # Increase the size SoundClipField
+        # Increase the left side layout's and SoundClipField's height by the Track's height
+        self.TrackControllerView.TrackControllerField.height = self.TrackControllerView.TrackControllerField.height + self.Track_height
         self.TrackSoundClipView.SoundClipField.height = self.TrackSoundClipView.SoundClipField.height + self.Track_height
 
-        # Add the track's layout containing SoundClip objects
-        self.TrackSoundClipView.SoundClipField.add_widget(track.TrackSoundClipLayout)
+        # The rows in view move up, since the height was increased. The new Track is shown if it is in view.
+        self.update_visible_Tracks()
 
     def remove_Track(self, *args, **kwargs):
         # If active_Track != None, remove a Track. Just a reminder: self.active_Track isn't a bool but a Track object or None.
         if self.active_Track:
 
-            # Close the object responsible for recording audio
-            self.active_Track.audio.terminate()
+            # Remove all layouts assosiated with Track, also its SoundClips
+            if self.active_Track in self.shown_Tracks:
+                self.hide_Track(self.active_Track)
+                self.shown_Tracks.remove(self.active_Track)
 
-            # Remove the Tracks all SoundClip objects
+            # Remove the clips' samples from MainView's ClipCache and free their memory
             for clip in self.active_Track.SoundClips:
-
-                # Remove individual SoundClip
-                self.active_Track.TrackSoundClipLayout.remove_widget(clip)
-
-                # Remove wav from MainView's wav_dict
                 MainView = self.parent
-
-                # Delete open wav from dict and free its memory. You don't have to "pop" from list if an object has already been deleted.
-                del MainView.wav_dict[clip.path]
+                MainView.ClipCache.remove(clip.path)
                 gc.collect()
 
-            # Remove all layouts assosiated with Track
-            self.TrackControllerView.TrackControllerField.remove_widget(self.active_Track.TrackControls)
-            self.TrackSoundClipView.SoundClipField.remove_widget(self.active_Track.TrackSoundClipLayout)
-
             # Reduce height of parent layouts
             self.TrackSoundClipView.SoundClipField.height = self.TrackSoundClipView.SoundClipField.height - self.Track_height
             self.TrackControllerView.TrackControllerField.height = self.TrackControllerView.TrackControllerField.height - self.Track_height
 
-            # Remove from self.Tracks
+            # Remove from self.Tracks and the Track and its clips from Session
             self.Tracks.remove(self.active_Track)
+            self.parent.Session.remove_track(self.active_Track.TrackState)
 
             # Delete the active Track and free active Tracks memory with garbage collector
             del self.active_Track
@@ -446,6 +446,9 @@ class TrackContainer(BoxLayout):
             # Logically better here. Can be probably moved outside of if.
             self.active_Track = None
 
+            # The rows below the removed one move up
+            self.update_visible_Tracks()
+
     def update_active_Track_highlight(self, track, *args, **kwargs):
         # If there was a previous active_Track, remove its highlight
         if self.active_Track:
@@ -484,14 +487,118 @@ class TrackContainer(BoxLayout):
 
     def change_Track_width(self, new_time, *args, **kwargs):
         # Scale the Layout inside of scrollable view
-        # When TimeAxisSlider.value == maximum_time -> SoundClipField.width == TrackSoundClipView.width
-        # When TimeAxisSlider.value == minimum_time -> SoundClipField.width == TrackSoundClipView.width*(maximum_time/minimum_time)
-        self.TrackSoundClipView.SoundClipField.width = self.TrackSoundClipView.width * maximum_time/new_time
+        # When TimeAxisSlider.value == TimeAxisSlider.max -> SoundClipField.width == TrackSoundClipView.width
+        # When TimeAxisSlider.value == TimeAxisSlider.min -> SoundClipField.width == TrackSoundClipView.width*(TimeAxisSlider.max/TimeAxisSlider.min)
+        TimeAxisSlider = self.parent.MiddleBar.TrackScaleController.TimeAxisSlider
+        self.TrackSoundClipView.SoundClipField.width = self.TrackSoundClipView.width * TimeAxisSlider.max/new_time
+
+        # Only the SoundClips in view are placed, the others are placed when they are shown
+        self.update_visible_SoundClips()
+
+    def get_visible_Track_range(self, *args, **kwargs):
+        # Indexes of the first Track in view and of the one after the last, widened by track_view_margin
+        SoundClipField_height = self.TrackSoundClipView.SoundClipField.height
+        bottom = self.TrackSoundClipView.scroll_y * max(SoundClipField_height-self.TrackSoundClipView.height, 0)
+        top = bottom + self.TrackSoundClipView.height
+        first = int((SoundClipField_height-top)//self.Track_height) - track_view_margin
+        last = int(-(-(SoundClipField_height-bottom)//self.Track_height)) + track_view_margin
+        return max(first, 0), min(last, len(self.Tracks))
+
+    def show_Track(self, track, *args, **kwargs):
+        # Add the Track's layouts to TrackControllerField and SoundClipField
+        self.TrackControllerView.TrackControllerField.add_widget(track.TrackControls)
+        self.TrackSoundClipView.SoundClipField.add_widget(track.TrackSoundClipLayout)
+
+    def hide_Track(self, track, *args, **kwargs):
+        # Remove the Track's layouts and SoundClips, which releases their waveforms
+        for clip in track.SoundClips:
+            self.hide_SoundClip(track, clip)
+        self.TrackControllerView.TrackControllerField.remove_widget(track.TrackControls)
+        self.TrackSoundClipView.SoundClipField.remove_widget(track.TrackSoundClipLayout)
 
-        for track in self.Tracks:
-            for clip in track.SoundClips:
-                clip.x = clip.relative_x * self.TrackSoundClipView.SoundClipField.width
-                clip.width = clip.relative_width * self.TrackSoundClipView.SoundClipField.width
+    def place_Track(self, track, track_ind, *args, **kwargs):
+        # Move and resize the Track's row. TrackControls' y is bound to move the SoundClips and RecordingPlotLayout.
+        y = (len(self.Tracks)-1-track_ind) * self.Track_height
+        if track.TrackControls.height == self.Track_height and track.TrackControls.y == y:
+            return
+
+        track.set_height(self.Track_height)
+        track.TrackSoundClipLayout.height = self.Track_height
+        track.TrackSoundClipLayout.y = y
+        track.TrackControls.y = y
+
+        # Update highlight
+        if track == self.active_Track:
+            self.update_active_Track_highlight(track)
+
+    def update_visible_Tracks(self, *args, **kwargs):
+        # Show the Tracks which have come in to view, hide the ones which have left it and place the ones in view
+        first, last = self.get_visible_Track_range()
+        visible_Tracks = self.Tracks[first:last]
+
+        for track in set(self.shown_Tracks)-set(visible_Tracks):
+            self.hide_Track(track)
+
+        visible_range = self.get_visible_range()
+        for track_ind, track in enumerate(visible_Tracks, first):
+            self.place_Track(track, track_ind)
+            if track not in self.shown_Tracks:
+                self.show_Track(track)
+                self.update_visible_SoundClips_of_Track(track, visible_range)
+
+        self.shown_Tracks = visible_Tracks
+
+    def get_visible_range(self, *args, **kwargs):
+        # Left and right edge of the part of SoundClipField which is in view, widened by clip_view_margin
+        view_width = self.TrackSoundClipView.width
+        left = self.TrackSoundClipView.scroll_x * max(self.TrackSoundClipView.SoundClipField.width-view_width, 0)
+        return left - clip_view_margin*view_width, left + (1+clip_view_margin)*view_width
+
+    def is_SoundClip_visible(self, clip, visible_range, *args, **kwargs):
+        SoundClipField_width = self.TrackSoundClipView.SoundClipField.width
+        return clip.relative_x*SoundClipField_width < visible_range[1] and (clip.relative_x+clip.relative_width)*SoundClipField_width > visible_range[0]
+
+    def show_SoundClip(self, track, clip, visible_range, *args, **kwargs):
+        # Add a SoundClip to its Track's layout and draw its waveform with MainView's WaveformTileCache. The SoundClip is placed first, since it hasn't followed zooming while it was hidden.
+        SoundClipField_width = self.TrackSoundClipView.SoundClipField.width
+        clip.pos = (clip.relative_x * SoundClipField_width, track.TrackSoundClipLayout.y)
+        clip.size = (clip.relative_width * SoundClipField_width, self.Track_height)
+        clip.show(self.parent.WaveformTileCache)
+        track.TrackSoundClipLayout.add_widget(clip)
+        clip.update_tiles(visible_range)
+
+    def hide_SoundClip(self, track, clip, *args, **kwargs):
+        # Remove a SoundClip from its Track's layout and release its waveform
+        if clip.parent:
+            track.TrackSoundClipLayout.remove_widget(clip)
+            clip.hide()
+
+    def place_SoundClip(self, track, clip, *args, **kwargs):
+        # Show a new SoundClip if it and its Track are in view
+        visible_range = self.get_visible_range()
+        if track in self.shown_Tracks and self.is_SoundClip_visible(clip, visible_range):
+            self.show_SoundClip(track, clip, visible_range)
+
+    def update_visible_SoundClips(self, *args, **kwargs):
+        # Show the SoundClips which have come in to view and hide the ones which have left it. Only the shown ones are placed, so zooming
+        # and scrolling lay out as many SoundClips as fit the view however many there are. Tracks out of view have no SoundClips shown.
+        visible_range = self.get_visible_range()
+        for track in self.shown_Tracks:
+            self.update_visible_SoundClips_of_Track(track, visible_range)
+
+    def update_visible_SoundClips_of_Track(self, track, visible_range, *args, **kwargs):
+        # The SoundClip which is being dragged is kept. Zooming stretches the drawn tiles and update_tiles requests the ones of the new zoom level.
+        SoundClipField_width = self.TrackSoundClipView.SoundClipField.width
+        for clip in track.SoundClips:
+            if self.is_SoundClip_visible(clip, visible_range):
+                if clip.parent:
+                    clip.x = clip.relative_x * SoundClipField_width
+                    clip.width = clip.relative_width * SoundClipField_width
+                    clip.update_tiles(visible_range)
+                else:
+                    self.show_SoundClip(track, clip, visible_range)
+            elif clip.parent and not clip.pressed:
+                self.hide_SoundClip(track, clip)
 
     def change_Track_height(self, height_slider, *args, **kwargs):
         # Store for later use in other methods
@@ -501,11 +608,5 @@ class TrackContainer(BoxLayout):
         self.TrackControllerView.TrackControllerField.height = len(self.Tracks) * self.Track_height
         self.TrackSoundClipView.SoundClipField.height = len(self.Tracks) * self.Track_height
 
-        # Set all Tracks to correct height
-        for ind in range(0,len(self.Tracks)):
-            track = self.Tracks[ind]
-            track.set_height(self.Track_height)
-
-            # Update highlight
-            if track == self.active_Track:
-                self.update_active_Track_highlight(track)
+        # Set the Tracks in view to correct height, the others are resized when they are shown
+        self.update_visible_Tracks()
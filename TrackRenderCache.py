@@ -0,0 +1,153 @@
+# Project files
+from Mixer import gather_clips
+from ClipCache import CachedSamples
+
+# General Python imports
+import os
+import shutil
+import tempfile
+import threading
+import queue
+import numpy as np
+
+
+class TrackRender:
+
+    ########################################### Brief description ###########################################
+    # TrackRender is the flattened timeline of one Track: all of its clips summed to one float32 array of
+    # the length of the time axis, memory-mapped to a file so long sessions don't need the RAM. Only the
+    # render thread writes to it and only the audio thread reads from it.
+    #
+    # Each edit of the Track's clips has a version. A render of a version is written between setting
+    # writing_version and rendered_version. The audio thread reads a buffer only if both equal the version
+    # of its snapshot, and checks writing_version again after the read, so a buffer which was being
+    # rewritten while it was read is never used.
+    #########################################################################################################
+
+    def __init__(self, path, length_in_samples, *args, **kwargs):
+        super(TrackRender, self).__init__(*args, **kwargs)
+
+        # 'w+' creates a file of zeros
+        self.samples = np.memmap(path, dtype=np.float32, mode='w+', shape=(max(int(length_in_samples),1),))
+
+        self.writing_version = 0
+        self.rendered_version = 0
+
+    def read(self, track_row, buffer_start_sample, version, *args, **kwargs):
+        # Called from the audio thread. Copies the buffer to track_row and returns True, or returns False and leaves track_row silent
+        # if the render isn't complete for this version or the buffer is past its end.
+        buffer_end_sample = buffer_start_sample+len(track_row)
+        if self.rendered_version != version or self.writing_version != version or buffer_end_sample > len(self.samples):
+            return False
+
+        track_row[:] = self.samples[buffer_start_sample:buffer_end_sample]
+
+        # The render thread started a newer version during the copy
+        if self.writing_version != version:
+            track_row[:] = 0
+            return False
+
+        return True
+
+    def render(self, version, sample_ranges, track_clips, *args, **kwargs):
+        # Called from the render thread. Only the changed ranges are rendered again: they are cleared and the clips overlapping them summed in.
+        # Only the clips overlapping the ranges are needed. Those which ClipCache has evicted are loaded first, so they aren't rendered as silence,
+        # while the others stay on disk.
+        track_clips = tuple((start_sample, samples.load() if isinstance(samples, CachedSamples) else samples, regions)
+                            for start_sample, samples, regions in track_clips
+                            if any(start_sample < end_sample and start_sample+len(samples) > range_start_sample for range_start_sample, end_sample in sample_ranges))
+        self.writing_version = version
+
+        for start_sample, end_sample in sample_ranges:
+            start_sample = max(start_sample, 0)
+            end_sample = min(end_sample, len(self.samples))
+            if start_sample >= end_sample:
+                continue
+
+            # A (1, samples) view of the range, so the mixer's gather_clips sums the clips straight to the file
+            range_view = self.samples[start_sample:end_sample].reshape(1,-1)
+            range_view[:,:] = 0
+            gather_clips(range_view, [track_clips], start_sample)
+
+        self.rendered_version = version
+
+
+class TrackRenderCache:
+
+    ########################################### Brief description ###########################################
+    # TrackRenderCache keeps a TrackRender of every Track and renders them in its own thread. Session calls
+    # invalidate whenever clips are added, moved or removed, with the sample ranges which changed and the
+    # Track's clips at that moment. The render of those ranges is queued and the new version returned, which
+    # Session puts to its snapshots. Until the render thread has finished a version, the mixer gathers the
+    # Track's clips as before, so edits are heard immediately.
+    #
+    # Gain, pan, mute, solo and EQ are applied by the mixer after reading the render, so changing them
+    # never invalidates anything. The files are removed when the cache is stopped.
+    #########################################################################################################
+
+    def __init__(self, directory=None, *args, **kwargs):
+        super(TrackRenderCache, self).__init__(*args, **kwargs)
+
+        # Directory of the render files, a new temporary one by default
+        self.directory = directory or tempfile.mkdtemp(prefix='track_renders_')
+
+        # TrackRenders by track_id
+        self.TrackRenders = {}
+
+        # Latest version given to each Track
+        self.versions = {}
+
+        # Queued renders as (TrackRender, version, sample_ranges, track_clips)
+        self.render_queue = queue.Queue()
+
+        # Bool for the render loop
+        self.rendering = True
+        self.thread = threading.Thread(target=self.render_process, daemon=True)
+        self.thread.start()
+
+    def stop(self, *args, **kwargs):
+        # Stop the render thread and remove the files
+        self.rendering = False
+        self.thread.join()
+        self.TrackRenders = {}
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def invalidate(self, track_id, sample_ranges, track_clips, length_in_samples, *args, **kwargs):
+        # Called from the GUI thread. track_clips are (start_sample, samples, regions) of all clips on the Track after the change. Returns the
+        # Track's new version and its TrackRender.
+        if track_id not in self.TrackRenders:
+            self.TrackRenders[track_id] = TrackRender(os.path.join(self.directory, str(track_id)+'.f32'), length_in_samples)
+            self.versions[track_id] = 0
+
+        self.versions[track_id] += 1
+        self.render_queue.put((self.TrackRenders[track_id], self.versions[track_id], sample_ranges, track_clips))
+        return self.versions[track_id], self.TrackRenders[track_id]
+
+    def remove(self, track_id, *args, **kwargs):
+        # The file stays until stop, since the audio thread may still be reading the removed Track's last buffer
+        self.TrackRenders.pop(track_id, None)
+        self.versions.pop(track_id, None)
+
+    def render_process(self, *args, **kwargs):
+        while self.rendering:
+            try:
+                renders = [self.render_queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            # Dragging a SoundClip queues a render for every pixel it moves. Everything queued is taken at once and the renders of each Track
+            # are merged to one, with the ranges of all of them and the latest version and clips.
+            while not self.render_queue.empty():
+                renders.append(self.render_queue.get())
+
+            merged_renders = {}
+            for TrackRender, version, sample_ranges, track_clips in renders:
+                merged_ranges = merged_renders[TrackRender][1] if TrackRender in merged_renders else []
+                merged_renders[TrackRender] = (version, merged_ranges+list(sample_ranges), track_clips)
+
+            # A render which fails, for example because a clip's file can't be read, must not stop the renders of the other Tracks or later edits
+            for TrackRender, (version, sample_ranges, track_clips) in merged_renders.items():
+                try:
+                    TrackRender.render(version, sample_ranges, track_clips)
+                except Exception as error:
+                    print("Track render of version "+str(version)+" failed: "+str(error))
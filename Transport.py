@@ -0,0 +1,111 @@
+# Project files
+from AudioConfig import audio_config
+from GlobalAudioVariables import *
+
+# General Python imports
+import time
+
+# Global variables
+# Output latencies reported outside these limits (in seconds) are treated as unknown. Some host APIs report zeros or garbage for the stream times.
+minimum_output_latency = 0
+maximum_output_latency = 1
+
+
+class Transport:
+
+    ########################################### Brief description ###########################################
+    # Transport is the playhead. It holds an integer sample position which is advanced only by the audio
+    # engine, one buffer at a time, so the playhead stays in sync with the audio that is rendered. The GUI
+    # doesn't change the position directly but asks for a new position with locate, which is applied at the
+    # start of the next buffer.
+    #
+    # audible_position gives the sample which is heard at the moment it is called. It uses the output
+    # latency from PortAudio's 'time_info' (output_buffer_dac_time - current_time) and the time elapsed since
+    # the latest buffer, so the GUI can read it at display rate and the playhead doesn't drift against what
+    # is heard.
+    #
+    # Starting and stopping work the same way. start and stop set a command which the audio engine applies
+    # at the start of the next buffer with apply_command, so the output stream can stay open all the time.
+    #########################################################################################################
+
+    def __init__(self, *args, **kwargs):
+        super(Transport, self).__init__(*args, **kwargs)
+
+        # Sample at which the next buffer starts
+        self.position = 0
+
+        # Position requested by the GUI, None if there is no request
+        self.pending_locate = None
+
+        # Whether the audio engine is rendering audio or silence
+        self.playing = False
+
+        # 'start' or 'stop' requested by the GUI, None if there is no request
+        self.pending_command = None
+
+        # (first sample, amount of samples, time.perf_counter() of the callback, output latency in seconds, located sample) of the latest buffer.
+        # Located sample is where playback was last started from, the playhead never shows anything before it. Stored as a single tuple so the
+        # GUI thread always reads values of the same buffer.
+        self.latest_buffer = (0, 0, time.perf_counter(), 0.0, 0)
+
+    def locate(self, sample, *args, **kwargs):
+        # Called from the GUI thread. The new position is taken in use at the start of the next buffer.
+        self.pending_locate = max(int(sample), 0)
+
+        # Until the next buffer is heard audible_position shows the requested position
+        self.latest_buffer = (self.pending_locate, 0, time.perf_counter(), 0.0, self.pending_locate)
+
+    def start(self, *args, **kwargs):
+        # Called from the GUI thread. Playback starts at the next buffer.
+        self.pending_command = 'start'
+
+    def stop(self, *args, **kwargs):
+        # Called from the GUI thread. Playback stops at the next buffer.
+        self.pending_command = 'stop'
+
+    def apply_command(self, *args, **kwargs):
+        # Called by the audio engine at the start of each buffer. Returns 'start' or 'stop' if playing changed at this buffer, otherwise None.
+        command = self.pending_command
+        self.pending_command = None
+
+        if command == 'start' and not self.playing:
+            self.playing = True
+            return 'start'
+        elif command == 'stop' and self.playing:
+            self.playing = False
+            return 'stop'
+
+        return None
+
+    def advance(self, frame_count, time_info=None, *args, **kwargs):
+        # Called by the audio engine once per buffer. Returns the first sample of the buffer to be rendered.
+        callback_time = time.perf_counter()
+
+        # Apply a position requested by the GUI at the buffer boundary
+        located_sample = self.latest_buffer[4]
+        pending_locate = self.pending_locate
+        if pending_locate is not None:
+            self.position = pending_locate
+            self.pending_locate = None
+            located_sample = pending_locate
+
+        # Time it takes until the first sample of this buffer is heard
+        output_latency = 0.0
+        if time_info:
+            output_latency = time_info.get('output_buffer_dac_time', 0) - time_info.get('current_time', 0)
+            if output_latency < minimum_output_latency or output_latency > maximum_output_latency:
+                output_latency = 0.0
+
+        first_sample = self.position
+        self.position += frame_count
+        self.latest_buffer = (first_sample, frame_count, callback_time, output_latency, located_sample)
+
+        return first_sample
+
+    def audible_position(self, *args, **kwargs):
+        # Called from the GUI thread. The sample heard now is the first sample of the latest buffer plus the time since that buffer reached the output.
+        first_sample, frame_count, callback_time, output_latency, located_sample = self.latest_buffer
+        samples_since_output = int((time.perf_counter() - callback_time - output_latency) * audio_config.sampling_rate)
+
+        # Before the latest buffer is heard the previous buffers are playing, but not anything from before the located sample. The playhead can't be ahead of what has been rendered.
+        return max(located_sample, min(first_sample + samples_since_output, first_sample + frame_count))
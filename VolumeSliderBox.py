@@ -1,9 +1,7 @@
 # Kivy imports
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.slider import Slider
-
-# General Python imports
-from numpy import log10
+from kivy.properties import NumericProperty
 
 
 class LevelIndicator(Slider):
@@ -11,13 +9,14 @@ class LevelIndicator(Slider):
     ########################################### Brief description ###########################################
     # LevelIndicator is a Slider object used to display signal levels. It is placed under VolumeSlider
     # in VolumeSliderBox and so cannot be accessed by the user. LevelIndicator's color is bounded to its
-    # values and hence length.
+    # values and hence length. Levels are calculated by MeterEngine (MeterEngine.py) and set to all
+    # LevelIndicators at display rate by MainView, so LevelIndicators are never touched by the audio thread.
     #########################################################################################################
 
     def __init__(self, *args, **kwargs):
         super(LevelIndicator, self).__init__(**kwargs)
 
-        # Set scale of values. This expects value from 0 to 1, basic audio float scale, where 0 is silence and >1 digital distortion
+        # Set scale of values in dB. 0 dB is the maximum of the basic audio float scale (-1 to 1), anything above is digital distortion
         self.min = -80
         self.max = 0
 
@@ -33,11 +32,11 @@ class LevelIndicator(Slider):
         # Set value track width
         self.value_track_width = 5
 
-        # Initiate level
-        self.old_level = self.min
+        # Start hidden below the minimum
+        self.value = self.min-1
 
-        # Decay factor used for smoothing level changes
-        self.decay_factor = 0.2
+        # Smallest change in dB which is drawn. Setting value dispatches binds and redraws, so changes which can't be seen are skipped.
+        self.smallest_visible_change = 0.05
 
         # Bind value changes to hide value track if values are too small
         self.bind(value=self.hide_value_track)
@@ -49,18 +48,16 @@ class LevelIndicator(Slider):
         else:
             self.value_track = True
 
-    def calculate_level(self, new_value, *args, **kwargs):
-        # Convert values to dB, if values are below minimum force them below the minimum
-        if new_value <= 0.0001:
+    def set_level(self, new_value, *args, **kwargs):
+        # new_value is in dB and has the meter ballistics already applied. Values below minimum are forced below the minimum which hides the indicator.
+        if new_value < self.min:
             new_value = self.min-1
-        else:
-            new_value = float(20*log10(new_value))
 
-        # Calculate 2 point moving average of new input and previous output. For more info look into '2 point moving average filter'.
-        self.value = ((new_value)*self.decay_factor + self.old_level*(1-self.decay_factor))
-        
-        # Store old value for later iterations
-        self.old_level = self.value
+        # Skip changes which wouldn't be visible
+        if abs(new_value-self.value) < self.smallest_visible_change:
+            return
+
+        self.value = float(new_value)
 
         # Logic for gradient colors:
         # -80 blue, -40 green, 0 red, -60 between blue and green, -20 between green and red
@@ -83,9 +80,13 @@ class LevelIndicator(Slider):
 class VolumeSlider(Slider):
 
     ########################################### Brief description ###########################################
-    # VolumeSlider is the Slider in VolumeSliderBox which controls signal volume (=gain).
+    # VolumeSlider is the Slider in VolumeSliderBox which controls signal volume (=gain). linear_gain_factor
+    # is a Kivy property, so Tracks and MainView can bind to it and pass the gain on to Session.
     #########################################################################################################
 
+    # Gain as a linear factor, follows the value in dB
+    linear_gain_factor = NumericProperty(1.0)
+
     def __init__(self, *args, **kwargs):
         super(VolumeSlider, self).__init__(**kwargs)
 
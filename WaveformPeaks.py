@@ -0,0 +1,176 @@
+# Project files
+from GlobalAudioVariables import *
+
+# General Python imports
+import math
+import numpy as np
+
+# Global variables
+# How many samples are represented by one minimum/maximum pair. 'samples_per_recording_buffer' is divisible by this, so recorded buffers fill whole blocks.
+samples_per_peak_block = 256
+
+# How many blocks fit in the arrays when a WaveformPeaks object is created. Arrays are doubled when they get full.
+init_peak_capacity = 1024
+
+
+class WaveformPeaks:
+
+    ########################################### Brief description ###########################################
+    # WaveformPeaks is the waveform overview of a single audio clip. It stores the minimum and maximum value
+    # of every 'samples_per_peak_block' samples. Peaks can be calculated at once from an array of samples or
+    # grown buffer by buffer while a Track is recording, which allows drawing the recording as it arrives
+    # and reusing the same peaks for the finished SoundClip instead of scanning the audio again.
+    #
+    # The same blocks make the silence map of the clip: sounding_regions returns the sample ranges whose
+    # blocks are above a threshold, which the mixer plays instead of the whole clip. By default the threshold
+    # is 'playback_silence_threshold_in_dB', so room noise below the meter floor isn't mixed, and strip_silence
+    # uses a higher one.
+    #
+    # The recording thread appends while the GUI thread reads. Values are always written before block_count
+    # is increased and grown arrays are swapped in whole, so the first 'block_count' values are always valid.
+    #########################################################################################################
+
+    def __init__(self, capacity=init_peak_capacity, *args, **kwargs):
+        super(WaveformPeaks, self).__init__(*args, **kwargs)
+
+        # Arrays for block minimums and maximums. Only the first block_count values are in use.
+        self.minimums = np.zeros(max(int(capacity),1), dtype=np.float32)
+        self.maximums = np.zeros(max(int(capacity),1), dtype=np.float32)
+
+        # How many full blocks and how many samples in total have been added
+        self.block_count = 0
+        self.sample_count = 0
+
+        # Samples which didn't fill a whole block yet. They are added to the next appended buffer or written as a shorter block by finalize().
+        self.partial_block = np.zeros(samples_per_peak_block, dtype=np.float32)
+        self.partial_block_length = 0
+
+    @classmethod
+    def from_samples(cls, samples, *args, **kwargs):
+        # Calculate peaks of an already existing array of samples in one go
+        peaks = cls(capacity=math.ceil(len(samples)/samples_per_peak_block))
+        peaks.append(samples)
+        peaks.finalize()
+        return peaks
+
+    @classmethod
+    def from_peaks(cls, minimums, maximums, sample_count, *args, **kwargs):
+        # Peaks which have been calculated before, for example read from a session file
+        peaks = cls(capacity=len(maximums))
+        peaks.write_blocks(np.stack((np.asarray(minimums, dtype=np.float32), np.asarray(maximums, dtype=np.float32)), axis=1))
+        peaks.sample_count = int(sample_count)
+        return peaks
+
+    def ensure_capacity(self, needed_blocks, *args, **kwargs):
+        # Grow the arrays by doubling them. New arrays are filled before they replace the old ones so readers never see unwritten values.
+        if needed_blocks <= len(self.maximums):
+            return
+
+        new_capacity = len(self.maximums)
+        while new_capacity < needed_blocks:
+            new_capacity *= 2
+
+        new_minimums = np.zeros(new_capacity, dtype=np.float32)
+        new_maximums = np.zeros(new_capacity, dtype=np.float32)
+        new_minimums[0:self.block_count] = self.minimums[0:self.block_count]
+        new_maximums[0:self.block_count] = self.maximums[0:self.block_count]
+        self.minimums = new_minimums
+        self.maximums = new_maximums
+
+    def append(self, samples, *args, **kwargs):
+        # Add new mono samples, for example a single recorded buffer, and calculate peaks for every block which is now full
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        self.sample_count += len(samples)
+
+        # Fill the partial block first
+        if self.partial_block_length > 0:
+            samples_to_fill = min(samples_per_peak_block-self.partial_block_length, len(samples))
+            self.partial_block[self.partial_block_length : self.partial_block_length+samples_to_fill] = samples[0:samples_to_fill]
+            self.partial_block_length += samples_to_fill
+            samples = samples[samples_to_fill:]
+
+            # If the partial block is full, store it as a normal block
+            if self.partial_block_length == samples_per_peak_block:
+                self.write_blocks(self.partial_block.reshape(1,samples_per_peak_block))
+                self.partial_block_length = 0
+
+        # Calculate all full blocks at once by reshaping samples to (blocks, samples_per_peak_block)
+        full_block_count = len(samples)//samples_per_peak_block
+        if full_block_count > 0:
+            self.write_blocks(samples[0:full_block_count*samples_per_peak_block].reshape(full_block_count,samples_per_peak_block))
+
+        # Keep the rest for the next call
+        rest = samples[full_block_count*samples_per_peak_block:]
+        if len(rest) > 0:
+            self.partial_block[0:len(rest)] = rest
+            self.partial_block_length = len(rest)
+
+    def write_blocks(self, blocks, *args, **kwargs):
+        # blocks has shape (amount of blocks, samples in each block)
+        self.ensure_capacity(self.block_count+len(blocks))
+        self.minimums[self.block_count : self.block_count+len(blocks)] = np.amin(blocks, axis=1)
+        self.maximums[self.block_count : self.block_count+len(blocks)] = np.amax(blocks, axis=1)
+
+        # Increase the count only after the values have been written
+        self.block_count += len(blocks)
+
+    def finalize(self, *args, **kwargs):
+        # Write the remaining partial block. Called when no more samples will be added.
+        if self.partial_block_length > 0:
+            self.write_blocks(self.partial_block[0:self.partial_block_length].reshape(1,self.partial_block_length))
+            self.partial_block_length = 0
+
+    def get_peaks(self, *args, **kwargs):
+        # Return the (minimums, maximums) which are in use. block_count is read first, see the brief description.
+        block_count = self.block_count
+        return self.minimums[0:block_count], self.maximums[0:block_count]
+
+    def sounding_regions(self, threshold_in_dB=playback_silence_threshold_in_dB, padding_blocks=0, *args, **kwargs):
+        # Return the (start_sample, end_sample) ranges of the clip which have a peak above threshold_in_dB, as an int64 array of shape (regions, 2).
+        # With threshold_in_dB None only blocks which are all zeros are left out.
+        # padding_blocks neighbouring blocks are kept on both sides of each region, so the starts and tails of sounds aren't cut.
+        minimums, maximums = self.get_peaks()
+        threshold = 0 if threshold_in_dB is None else 10**(threshold_in_dB/20)
+        sounding = np.maximum(np.absolute(minimums), np.absolute(maximums)) > threshold
+
+        # Widen sounding blocks by the padding
+        if padding_blocks > 0 and len(sounding) > 0:
+            padded = np.convolve(sounding.astype(np.int64), np.ones(2*padding_blocks+1, dtype=np.int64), mode='same')
+            sounding = padded > 0
+
+        # Regions start where a sounding run starts and end where it ends. The last block may be shorter than the others.
+        edges = np.diff(np.concatenate(([0], sounding.astype(np.int8), [0])))
+        regions = np.stack((np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)), axis=1).astype(np.int64) * samples_per_peak_block
+        np.minimum(regions, self.sample_count, out=regions)
+
+        return regions
+
+    def reduced(self, column_count, *args, **kwargs):
+        # Return peaks combined so that there are at most column_count (minimum, maximum) pairs, for example one per pixel
+        return reduce_peaks(*self.get_peaks(), column_count)
+
+
+def section_regions(regions, start_sample, end_sample):
+    # Regions of the samples [start_sample, end_sample) of a clip, relative to start_sample, for example of one half of a split clip.
+    # None, which plays the whole clip, stays None.
+    if regions is None:
+        return None
+
+    regions = np.clip(regions-start_sample, 0, max(end_sample-start_sample, 0))
+    return regions[regions[:,1] > regions[:,0]]
+
+
+def reduce_peaks(minimums, maximums, column_count):
+    # Combine peaks so that there are at most column_count (minimum, maximum) pairs
+    column_count = max(int(column_count),1)
+
+    if len(maximums) <= column_count:
+        return minimums, maximums
+
+    # Combine 'blocks_per_column' neighbouring blocks. The end is padded with the last values so that the padding doesn't change the peaks.
+    blocks_per_column = math.ceil(len(maximums)/column_count)
+    padding = (-len(maximums)) % blocks_per_column
+    minimums = np.pad(minimums, (0,padding), mode='edge').reshape(-1,blocks_per_column)
+    maximums = np.pad(maximums, (0,padding), mode='edge').reshape(-1,blocks_per_column)
+
+    return np.amin(minimums, axis=1), np.amax(maximums, axis=1)
@@ -0,0 +1,42 @@
+# Kivy imports
+from kivy.graphics.texture import Texture
+
+# General Python imports
+import numpy as np
+
+# Global variables
+# Rows of a waveform texture, stretched to the height of the Track
+waveform_texture_height = 128
+
+
+############################### Waveform textures ###############################
+# SoundClips draw their waveform as textured Rectangles, one per tile of WaveformTileCache. The waveform is rasterized from WaveformPeaks
+# with NumPy, one column per (minimum, maximum) pair, and uploaded with blit_buffer. Textures are white with the waveform in the alpha
+# channel, so SoundClips can tint them and change their color without rasterizing again. Rasterizing doesn't use Kivy and can be done in
+# any thread, textures are created in the GUI thread.
+
+
+def rasterize_waveform(minimums, maximums, height):
+    # Alpha values of the waveform as an uint8 array of shape (height, columns), 255 from each column's minimum to its maximum and 0
+    # elsewhere. Amplitudes from -1 to 1 are scaled to the height and the first row is the bottom one, like in textures.
+    low_rows = np.floor((np.clip(minimums,-1,1)+1)/2 * (height-1)).astype(np.int32)
+    high_rows = np.ceil((np.clip(maximums,-1,1)+1)/2 * (height-1)).astype(np.int32)
+    rows = np.arange(height, dtype=np.int32).reshape(-1,1)
+    return ((rows >= low_rows) & (rows <= high_rows)).astype(np.uint8) * 255
+
+
+def waveform_pixels(minimums, maximums, height=waveform_texture_height):
+    # RGBA pixels of the waveform as an uint8 array of shape (height, columns, 4)
+    if len(maximums) == 0:
+        minimums, maximums = np.zeros(1), np.zeros(1)
+
+    pixels = np.full((height, len(maximums), 4), 255, dtype=np.uint8)
+    pixels[:,:,3] = rasterize_waveform(minimums, maximums, height)
+    return pixels
+
+
+def create_waveform_texture(pixels):
+    # Upload pixels from waveform_pixels to a texture. Called from the GUI thread.
+    texture = Texture.create(size=(pixels.shape[1], pixels.shape[0]), colorfmt='rgba')
+    texture.blit_buffer(pixels.tobytes(), colorfmt='rgba', bufferfmt='ubyte')
+    return texture
@@ -0,0 +1,149 @@
+# Project files
+from WaveformPeaks import reduce_peaks
+from WaveformTexture import waveform_pixels, create_waveform_texture
+
+# General Python imports
+import math
+import threading
+import queue
+import collections
+
+# Global variables
+# Columns of a full tile. The last tile of a clip may be narrower.
+tile_width = 256
+
+# How long the renderer thread waits for requests before checking if it should stop, in seconds
+renderer_interval = 0.1
+
+
+def get_tile_level(pixels_per_block):
+    # Zoom level at which a clip drawn with pixels_per_block pixels per peak block has at least one column per pixel. Level L combines
+    # 2**L blocks in to a column, so each level has half the columns of the one below it.
+    if pixels_per_block <= 0:
+        return 0
+    return max(int(math.floor(math.log2(1/pixels_per_block))), 0)
+
+
+def get_tile_blocks(level, tile_ind, block_count):
+    # First peak block and the block after the last of a tile
+    blocks_per_tile = tile_width * 2**level
+    return tile_ind*blocks_per_tile, min((tile_ind+1)*blocks_per_tile, block_count)
+
+
+class WaveformTileCache:
+
+    ########################################### Brief description ###########################################
+    # WaveformTileCache holds waveform textures of SoundClips as tiles of tile_width columns, keyed by
+    # (waveform_key, level, tile_ind). waveform_key names a SoundClip's drawn waveform and level is the zoom
+    # level from get_tile_level. Missing tiles are requested with request, which rasterizes them from the
+    # peaks in the renderer thread, so the GUI thread never waits for waveforms. The newest requests are
+    # rendered first, so during zooming the tiles of the latest zoom level come first.
+    #
+    # upload_tiles is called by a Clock in the GUI thread. It creates textures of the rendered tiles, which
+    # OpenGL allows only in that thread, and calls the callbacks given with the requests. Tiles which have
+    # been used least recently are dropped when the textures take more than budget_in_bytes. Only the GUI
+    # thread reads or changes tiles and pending, the renderer thread is given its work through queues.
+    #########################################################################################################
+
+    def __init__(self, budget_in_bytes, *args, **kwargs):
+        super(WaveformTileCache, self).__init__(*args, **kwargs)
+
+        self.budget_in_bytes = budget_in_bytes
+
+        # Textures by key, least recently used first, and the bytes they take
+        self.tiles = collections.OrderedDict()
+        self.tile_bytes = 0
+
+        # Callbacks of the requested tiles by key
+        self.pending = {}
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.evictions = 0
+
+        # Requests to the renderer thread and the pixels of the tiles it has rendered
+        self.request_queue = queue.LifoQueue()
+        self.rendered_queue = queue.Queue()
+
+        # Bool for the renderer loop
+        self.rendering = True
+        self.thread = threading.Thread(target=self.renderer_process, daemon=True)
+        self.thread.start()
+
+    def stop(self, *args, **kwargs):
+        self.rendering = False
+        self.thread.join()
+
+    def get(self, key, *args, **kwargs):
+        # Texture of a tile or None if it hasn't been rendered
+        texture = self.tiles.get(key)
+        if texture is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.tiles.move_to_end(key)
+        return texture
+
+    def contains(self, key, *args, **kwargs):
+        # Like get but doesn't count or change the order
+        return key in self.tiles
+
+    def request(self, key, minimums, maximums, callback, *args, **kwargs):
+        # Render a tile from the peaks of its blocks, 2**level blocks per column. callback is called when the tile is in the cache.
+        if key in self.pending:
+            if callback not in self.pending[key]:
+                self.pending[key].append(callback)
+            return
+
+        self.pending[key] = [callback]
+        self.request_queue.put((key, minimums, maximums))
+
+    def upload_tiles(self, *args, **kwargs):
+        # Create the textures of the rendered tiles, drop the least recently used tiles over the budget and call the callbacks
+        callbacks = []
+        while True:
+            try:
+                key, pixels = self.rendered_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            # A tile which failed to render is no longer pending, so it can be requested again. Its callbacks aren't called, since they
+            # would request it again right away.
+            if pixels is None:
+                self.pending.pop(key, None)
+                continue
+
+            self.tiles[key] = create_waveform_texture(pixels)
+            self.tile_bytes += pixels.nbytes
+            for callback in self.pending.pop(key, []):
+                if callback not in callbacks:
+                    callbacks.append(callback)
+
+        while self.tile_bytes > self.budget_in_bytes and len(self.tiles) > 1:
+            _, texture = self.tiles.popitem(last=False)
+            self.tile_bytes -= texture.width*texture.height*4
+            self.evictions += 1
+
+        for callback in callbacks:
+            callback()
+
+    def renderer_process(self, *args, **kwargs):
+        while self.rendering:
+            try:
+                key, minimums, maximums = self.request_queue.get(timeout=renderer_interval)
+            except queue.Empty:
+                continue
+
+            # A tile which fails to render must not stop the renders of the others
+            try:
+                level = key[1]
+                column_count = -(-len(maximums)//2**level)
+                pixels = waveform_pixels(*reduce_peaks(minimums, maximums, column_count))
+                self.renders += 1
+            except Exception as error:
+                pixels = None
+                print("Waveform tile "+str(key)+" failed to render: "+str(error))
+            self.rendered_queue.put((key, pixels))
@@ -0,0 +1,520 @@
+########################################### Brief description ###########################################
+# Headless benchmarks for the mixing and DSP hot paths. Nothing here opens a window or an audio device,
+# only the Kivy free modules are used. Synthetic sessions are built from random noise with the given
+# amount of Tracks, clips per Track and clip lengths, and each case reports how many times faster than
+# realtime it runs. Results are written to JSON, and a previous results file can be given with --compare
+# to see which cases got slower.
+#
+# Usage, from the repository root:
+#   python benchmarks/run_benchmarks.py --output before.json
+#   python benchmarks/run_benchmarks.py --output after.json --compare before.json
+#
+# The null_backend_callback cases play a session through the null audio backend from a callback with the
+# stages of MainView.playback_audio_callback, so the whole path of a buffer is timed without a device.
+#########################################################################################################
+
+# General Python imports
+import os
+import sys
+import time
+import json
+import argparse
+import platform
+import tempfile
+import threading
+import numpy as np
+import scipy
+from scipy import signal
+
+# Project files are in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Mixer import gather_clips, mix_to_stereo, apply_track_eqs, region_edges, clip_cost, ParallelMixer
+from OverlapAddFilter import OverlapAddFilter, BatchedOverlapAddFilter
+from SpectrumAnalyzer import SpectrumAnalyzer
+from WaveformPeaks import WaveformPeaks
+from ClipSamples import ClipSamples
+from CompressedSamples import CompressedSamples
+from Session import Session
+from TrackRenderCache import TrackRenderCache
+from Transport import Transport
+from MeterEngine import MeterEngine
+from DSPLoadMonitor import DSPLoadMonitor, CLIP_GATHER, MIXING, PEQ_FILTERING, ANALYZER, METERING
+from AudioBackend import create_audio_backend
+from GlobalAudioVariables import *
+
+# Global variables
+# Defaults of the session parameters. Track counts can be given as a list, each count is its own set of cases.
+default_track_counts = [1, 8, 32]
+default_clips_per_track = 4
+default_clip_seconds = 10
+default_session_seconds = 60
+
+# Thread counts of the parallel mixer cases. Scaling shows when the counts are compared for the same amount of Tracks.
+default_thread_counts = [1, 2, 4, 8]
+
+# Heavily edited sessions have this many times more clips per Track, each this many times shorter
+edit_factor = 25
+
+# Each case is run this many times and the fastest run is reported, which is the least disturbed by other processes
+default_repeat = 5
+
+# A case is reported as a regression if its realtime multiple is this much lower than in the compared results
+default_regression_threshold = 0.1
+
+# Width in pixels used for reducing waveform peaks
+waveform_width_in_pixels = 1920
+
+# Graph limits of PEQPopup, used for the analyzer
+analyzer_floor_in_dB = -50
+analyzer_ceiling_in_dB = 50
+
+
+def build_session(track_count, clips_per_track, clip_seconds, session_seconds, fs, seed=0):
+    # Return a synthetic session: a list of (start_sample, samples, regions) per Track and Track gains and pans. Clips are spread evenly over the
+    # session with random offsets, so some of them overlap, like they would in a real session.
+    random_generator = np.random.RandomState(seed)
+    clip_length = int(clip_seconds*fs)
+    session_length = int(session_seconds*fs)
+
+    track_clips = []
+    for track_ind in range(0,track_count):
+        clips = []
+        for clip_ind in range(0,clips_per_track):
+            start_sample = int(clip_ind*session_length/clips_per_track + random_generator.randint(0, fs))
+            samples = (random_generator.uniform(-0.5, 0.5, clip_length)).astype(np.float32)
+            clips.append((start_sample, samples, None))
+        track_clips.append(clips)
+
+    track_gains = random_generator.uniform(0.5, 1, track_count).astype(np.float32)
+    track_pans = random_generator.uniform(0, 1, track_count).astype(np.float32)
+
+    return track_clips, track_gains, track_pans
+
+
+def silence_clips(track_clips, mapped):
+    # Return the session with the second half of every clip silent, like the tails of recorded takes. If mapped, the clips have the silence
+    # maps SoundClips get from WaveformPeaks.sounding_regions, so the mixer skips the silence.
+    silenced_track_clips = []
+    for clips in track_clips:
+        silenced_clips = []
+        for start_sample, samples, regions in clips:
+            samples = samples.copy()
+            samples[len(samples)//2:] = 0
+            regions = region_edges(WaveformPeaks.from_samples(samples).sounding_regions()) if mapped else None
+            silenced_clips.append((start_sample, samples, regions))
+        silenced_track_clips.append(silenced_clips)
+    return silenced_track_clips
+
+
+def encode_clips(track_clips, encoding, compressed=False):
+    # Return the session with every clip stored as ClipSamples in the given encoding, so the mixer converts them buffer by buffer. Compressed
+    # clips are stored like ClipCache stores idle clips and decoded chunk by chunk.
+    encoded_track_clips = [[(start_sample, ClipSamples.from_float(samples, encoding), regions) for start_sample, samples, regions in clips] for clips in track_clips]
+    if compressed:
+        encoded_track_clips = [[(start_sample, CompressedSamples.from_clip_samples(samples), regions) for start_sample, samples, regions in clips] for clips in encoded_track_clips]
+    return encoded_track_clips
+
+
+def time_case(function, repeat):
+    # Run function 'repeat' times and return the fastest time in seconds
+    fastest_time = float('inf')
+    for ind in range(0,repeat):
+        start_time = time.perf_counter()
+        function()
+        fastest_time = min(fastest_time, time.perf_counter()-start_time)
+    return fastest_time
+
+
+def bench_mixer(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, repeat):
+    # Mix the whole session buffer by buffer, like playback_audio_callback does
+    buffer_count = int(session_seconds*fs)//buffer_size
+    track_count = len(track_clips)
+
+    def mix_session():
+        output_buffer = np.zeros((buffer_size,2), dtype=np.float32)
+        for buffer_ind in range(0,buffer_count):
+            track_buffers = np.zeros((track_count,buffer_size), dtype=np.float32)
+            gather_clips(track_buffers, track_clips, buffer_ind*buffer_size)
+            mix_to_stereo(track_buffers, track_gains, track_pans, output_buffer)
+
+    return time_case(mix_session, repeat), buffer_count*buffer_size/fs
+
+
+def bench_parallel_mixer(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, thread_count, repeat):
+    # Mix the whole session buffer by buffer with ParallelMixer. With a thread count of 1 this is the serial mixer with the same overhead per buffer.
+    # The threads are used for every buffer, whatever its cost, so the cases show the scaling of the threads themselves.
+    buffer_count = int(session_seconds*fs)//buffer_size
+    track_count = len(track_clips)
+    Mixer = ParallelMixer(thread_count, minimum_cost_per_thread=0)
+
+    def mix_session():
+        output_buffer = np.zeros((buffer_size,2), dtype=np.float32)
+        for buffer_ind in range(0,buffer_count):
+            track_buffers = np.zeros((track_count,buffer_size), dtype=np.float32)
+            Mixer.mix(track_buffers, track_clips, track_gains, track_pans, buffer_ind*buffer_size, output_buffer)
+
+    timing = time_case(mix_session, repeat)
+    Mixer.stop()
+    return timing, buffer_count*buffer_size/fs
+
+
+def measure_mixer_crossover(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, thread_count, repeat):
+    # Return the cost per thread from clip_cost above which ParallelMixer should use threads, with the measurements it is calculated from.
+    # With n threads a buffer of cost W takes about W/n of work plus a hand-off of each of the n-1 workers, so threads pay off when the cost
+    # per thread takes longer than one hand-off.
+    buffer_count = int(session_seconds*fs)//buffer_size
+    track_count = len(track_clips)
+    total_cost = sum(int(np.sum(clip_cost(track_clips, (None,)*track_count, (None,)*track_count, buffer_ind*buffer_size, buffer_size)))
+                     for buffer_ind in range(0,buffer_count))
+    serial_seconds, audio_seconds = bench_parallel_mixer(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, 1, repeat)
+    seconds_per_cost = serial_seconds/total_cost
+
+    # Hand-offs are timed with Tracks which have no clips, so there is almost no work besides them
+    empty_clips = [[] for ind in range(0,thread_count)]
+    gains = np.ones(thread_count, dtype=np.float32)
+    pans = np.full(thread_count, 0.5, dtype=np.float32)
+    empty_serial_seconds, _ = bench_parallel_mixer(empty_clips, gains, pans, session_seconds, buffer_size, fs, 1, repeat)
+    empty_parallel_seconds, _ = bench_parallel_mixer(empty_clips, gains, pans, session_seconds, buffer_size, fs, thread_count, repeat)
+    hand_off_seconds = max(empty_parallel_seconds-empty_serial_seconds, 0)/buffer_count/max(thread_count-1,1)
+
+    return {'seconds_per_cost': seconds_per_cost, 'hand_off_seconds': hand_off_seconds, 'threads': thread_count,
+            'minimum_cost_per_thread': int(hand_off_seconds/seconds_per_cost)}
+
+
+def print_scaling_table(results, track_counts, clips_per_track, clip_seconds, thread_counts):
+    # Realtime multiples of the serial mixer and of each thread count, one row per Track count, as a Markdown table for benchmarks/README.md
+    print("\n| Tracks | serial | "+" | ".join("{} threads".format(thread_count) for thread_count in thread_counts)+" |")
+    print("|---"*(len(thread_counts)+2)+"|")
+    for track_count in track_counts:
+        names = ["mixer[tracks={},clips_per_track={},clip_seconds={}]".format(track_count, clips_per_track, clip_seconds)]
+        names += ["parallel_mixer[tracks={},clips_per_track={},clip_seconds={},threads={}]".format(track_count, clips_per_track, clip_seconds, thread_count)
+                  for thread_count in thread_counts]
+        print("| {} | ".format(track_count)+" | ".join("{:.0f}x".format(results[name]['realtime_multiple']) for name in names)+" |")
+    print()
+
+
+def peq_response(buffer_size, fs):
+    # Complete response of a few peaking filters, like a PEQLayout with moved filters
+    complete_complex_response = np.ones((1,buffer_size), dtype=np.complex128)
+    for center_freq in (100, 1000, 5000):
+        b, a = signal.iirpeak(center_freq, 1, fs=fs)
+        _, complex_response = signal.freqz(b, a, worN=buffer_size, whole=True, fs=fs)
+        complete_complex_response = complete_complex_response*complex_response
+    return complete_complex_response
+
+
+def bench_render_cache(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, cached, repeat):
+    # Mix the session through Session, either gathering the clips of every buffer or reading the Tracks' flattened renders
+    buffer_count = int(session_seconds*fs)//buffer_size
+    track_count = len(track_clips)
+    Cache = TrackRenderCache() if cached else None
+    session = Session(int(session_seconds*fs), Cache)
+    for ind, clips in enumerate(track_clips):
+        track = session.add_track()
+        session.set_track(track, gain=track_gains[ind], pan=track_pans[ind])
+        for start_sample, samples, regions in clips:
+            session.add_clip(track, '', start_sample, samples, regions)
+
+    # Wait for the renders, which happen in the background
+    if cached:
+        while not all(TrackRender.rendered_version == version for TrackRender, version in session.snapshot.track_renders):
+            time.sleep(0.01)
+
+    Mixer = ParallelMixer(1)
+    snapshot = session.snapshot
+
+    def mix_session():
+        output_buffer = np.zeros((buffer_size,2), dtype=np.float32)
+        for buffer_ind in range(0,buffer_count):
+            track_buffers = np.zeros((track_count,buffer_size), dtype=np.float32)
+            Mixer.mix(track_buffers, snapshot.track_clips, snapshot.track_gains, snapshot.track_pans, buffer_ind*buffer_size, output_buffer,
+                      snapshot.track_eqs, snapshot.track_renders)
+
+    timing = time_case(mix_session, repeat)
+    Mixer.stop()
+    if cached:
+        Cache.stop()
+    return timing, buffer_count*buffer_size/fs
+
+
+def bench_null_backend_callback(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, repeat):
+    # Play the session through the null audio backend, which pulls buffers as fast as the callback renders them. The callback has the stages of
+    # MainView.playback_audio_callback with the same objects: Transport, the Session snapshot mixed by ParallelMixer, master gain, output EQ,
+    # analyzer with PEQPopup closed and metering, timed by DSPLoadMonitor. MainView needs a window, so its callback is repeated here.
+    buffer_count = int(session_seconds*fs)//buffer_size
+    session = Session(int(session_seconds*fs))
+    for ind, clips in enumerate(track_clips):
+        track = session.add_track()
+        session.set_track(track, gain=track_gains[ind], pan=track_pans[ind])
+        for start_sample, samples, regions in clips:
+            session.add_clip(track, '', start_sample, samples, regions)
+
+    Mixer = ParallelMixer(mixer_threads)
+    OutputFilter = OverlapAddFilter(buffer_size, 2)
+    OutputFilter.complete_complex_response = peq_response(buffer_size, fs)
+    Analyzer = SpectrumAnalyzer(fs, buffer_size, analyzer_floor_in_dB, analyzer_ceiling_in_dB)
+    Meters = MeterEngine()
+    Meters.set_meter_count(len(track_clips)+1)
+    Monitor = DSPLoadMonitor()
+    PlaybackTransport = Transport()
+    finished = threading.Event()
+
+    def mark_clip_gather():
+        Monitor.mark_stage(CLIP_GATHER)
+
+    def playback_audio_callback(frame_count, time_info, status):
+        Monitor.count_status(status)
+        PlaybackTransport.apply_command()
+        Monitor.begin_callback()
+
+        output_buffer = np.zeros((frame_count,2), dtype=np.float32)
+        buffer_start_sample = PlaybackTransport.advance(frame_count, time_info)
+        snapshot = session.snapshot
+        track_buffers = np.zeros((len(snapshot.track_clips),frame_count), dtype=np.float32)
+        Mixer.mix(track_buffers, snapshot.track_clips, snapshot.track_gains, snapshot.track_pans, buffer_start_sample, output_buffer, snapshot.track_eqs,
+                  snapshot.track_renders, mark_clip_gather)
+        output_buffer *= snapshot.master_gain
+        Monitor.mark_stage(MIXING)
+
+        output_buffer[:,0] = OutputFilter.filter_audio(output_buffer[:,0], 0)
+        output_buffer[:,1] = OutputFilter.filter_audio(output_buffer[:,1], 1)
+        Monitor.mark_stage(PEQ_FILTERING)
+
+        Analyzer.push(np.add(output_buffer[:,0],output_buffer[:,1]), False)
+        Monitor.mark_stage(ANALYZER)
+
+        Meters.write_levels(track_buffers, output_buffer)
+        Monitor.mark_stage(METERING)
+        Monitor.end_callback(frame_count, fs)
+
+        # The session has been played
+        if PlaybackTransport.position >= buffer_count*buffer_size:
+            finished.set()
+        return output_buffer
+
+    Backend = create_audio_backend('null')
+
+    def play_session():
+        finished.clear()
+        PlaybackTransport.locate(0)
+        PlaybackTransport.start()
+        stream = Backend.open_output_stream(playback_audio_callback, 2, fs, buffer_size)
+        stream.start_stream()
+        finished.wait()
+        stream.close()
+
+    timing = time_case(play_session, repeat)
+    Mixer.stop()
+    Backend.terminate()
+    return timing, buffer_count*buffer_size/fs
+
+
+def bench_filter_audio(session_seconds, buffer_size, fs, repeat):
+    # Filter stereo noise through the overlap-add filter
+    OLA = OverlapAddFilter(buffer_size, 2)
+    OLA.complete_complex_response = peq_response(buffer_size, fs)
+
+    buffer_count = int(session_seconds*fs)//buffer_size
+    audio = np.random.RandomState(1).uniform(-0.5, 0.5, (buffer_count,buffer_size,2)).astype(np.float32)
+
+    def filter_session():
+        OLA.reset()
+        for buffer_ind in range(0,buffer_count):
+            OLA.filter_audio(audio[buffer_ind,:,0], 0)
+            OLA.filter_audio(audio[buffer_ind,:,1], 1)
+
+    return time_case(filter_session, repeat), buffer_count*buffer_size/fs
+
+
+def bench_track_eqs(track_count, session_seconds, buffer_size, fs, batched, repeat):
+    # Filter every Track through its own EQ. Batched filters all Tracks with one rfft and irfft per buffer like the mixer does, otherwise
+    # each Track is filtered separately like the output is.
+    buffer_count = int(session_seconds*fs)//buffer_size
+    audio = np.random.RandomState(4).uniform(-0.5, 0.5, (buffer_count,track_count,buffer_size)).astype(np.float32)
+    complete_complex_response = peq_response(buffer_size, fs)
+    track_eqs = [(track_ind, complete_complex_response[0,0:buffer_size//2+1]) for track_ind in range(0,track_count)]
+
+    def filter_batched():
+        Filter = BatchedOverlapAddFilter()
+        for buffer_ind in range(0,buffer_count):
+            apply_track_eqs(Filter, audio[buffer_ind].copy(), track_eqs)
+
+    def filter_separately():
+        Filters = [OverlapAddFilter(buffer_size, 1) for track_ind in range(0,track_count)]
+        for Filter in Filters:
+            Filter.complete_complex_response = complete_complex_response
+        for buffer_ind in range(0,buffer_count):
+            for track_ind in range(0,track_count):
+                Filters[track_ind].filter_audio(audio[buffer_ind,track_ind], 0)
+
+    return time_case(filter_batched if batched else filter_separately, repeat), buffer_count*buffer_size/fs
+
+
+def bench_analyzer(session_seconds, buffer_size, fs, repeat):
+    # Push mono noise to the analyzer with PEQPopup open, which is when ffts are calculated
+    buffer_count = int(session_seconds*fs)//buffer_size
+    audio = np.random.RandomState(2).uniform(-0.5, 0.5, (buffer_count,buffer_size)).astype(np.float32)
+
+    def analyze_session():
+        Analyzer = SpectrumAnalyzer(fs, buffer_size, analyzer_floor_in_dB, analyzer_ceiling_in_dB)
+        for buffer_ind in range(0,buffer_count):
+            Analyzer.push(audio[buffer_ind], True)
+
+    return time_case(analyze_session, repeat), buffer_count*buffer_size/fs
+
+
+def bench_waveform_generation(samples, fs, repeat):
+    # Peaks of a whole clip and reducing them to one column per pixel, like a new SoundClip
+    def generate_waveform():
+        WaveformPeaks.from_samples(samples).reduced(waveform_width_in_pixels)
+
+    return time_case(generate_waveform, repeat), len(samples)/fs
+
+
+def bench_clip_loading(samples, fs, directory, repeat):
+    # Read a WAV file the way SoundClips and dropped files are read
+    from ClipFile import load_clip, write_clip
+    path = os.path.join(directory, 'load.wav')
+    write_clip(path, samples, fs)
+
+    return time_case(lambda: load_clip(path, fs), repeat), len(samples)/fs
+
+
+def bench_split(samples, fs, directory, repeat):
+    # Everything SoundClip.split_self does apart from widgets: split the samples, write both halves and calculate their peaks
+    from ClipFile import write_clip, split_clip
+
+    def split():
+        first_half, second_half = split_clip(samples, len(samples)//2)
+        write_clip(os.path.join(directory, 'split_1.wav'), first_half, fs)
+        write_clip(os.path.join(directory, 'split_2.wav'), second_half, fs)
+        WaveformPeaks.from_samples(first_half)
+        WaveformPeaks.from_samples(second_half)
+
+    return time_case(split, repeat), len(samples)/fs
+
+
+def run_benchmarks(track_counts, clips_per_track, clip_seconds, session_seconds, buffer_size, fs, thread_counts, repeat):
+    # Run all cases and return the results as a dictionary of case name -> measurements
+    results = {}
+
+    def add_result(name, timing):
+        seconds, audio_seconds = timing
+        results[name] = {'seconds': seconds, 'audio_seconds': audio_seconds, 'realtime_multiple': audio_seconds/seconds}
+        print("{:75s} {:10.1f}x realtime".format(name, audio_seconds/seconds))
+
+    def add_optional_result(name, run_case):
+        # Cases which read or write files need the file libraries of the program. They are skipped if those aren't installed.
+        try:
+            add_result(name, run_case())
+        except ImportError as error:
+            print("{:75s} skipped, {}".format(name, error))
+
+    for track_count in track_counts:
+        track_clips, track_gains, track_pans = build_session(track_count, clips_per_track, clip_seconds, session_seconds, fs)
+        add_result("mixer[tracks={},clips_per_track={},clip_seconds={}]".format(track_count, clips_per_track, clip_seconds),
+                   bench_mixer(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, repeat))
+        for thread_count in thread_counts:
+            add_result("parallel_mixer[tracks={},clips_per_track={},clip_seconds={},threads={}]".format(track_count, clips_per_track, clip_seconds, thread_count),
+                       bench_parallel_mixer(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, thread_count, repeat))
+
+        for encoding in ('int16', 'int24', 'float16'):
+            add_result("clip_storage[tracks={},clips_per_track={},clip_seconds={},{}]".format(track_count, clips_per_track, clip_seconds, encoding),
+                       bench_mixer(encode_clips(track_clips, encoding), track_gains, track_pans, session_seconds, buffer_size, fs, repeat))
+        add_result("clip_storage[tracks={},clips_per_track={},clip_seconds={},int16,compressed]".format(track_count, clips_per_track, clip_seconds),
+                   bench_mixer(encode_clips(track_clips, 'int16', True), track_gains, track_pans, session_seconds, buffer_size, fs, repeat))
+        crossover = measure_mixer_crossover(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, max(max(thread_counts),2), repeat)
+        results["mixer_crossover[tracks={},clips_per_track={},clip_seconds={}]".format(track_count, clips_per_track, clip_seconds)] = crossover
+        print("{:75s} {:10d} cost per thread ({:.1f} us hand-off, {:.2f} ns per cost)".format(
+              "mixer_crossover[tracks={},clips_per_track={},clip_seconds={}]".format(track_count, clips_per_track, clip_seconds),
+              crossover['minimum_cost_per_thread'], crossover['hand_off_seconds']*1e6, crossover['seconds_per_cost']*1e9))
+
+        for mapped in (False, True):
+            add_result("silence_map[tracks={},clips_per_track={},clip_seconds={},{}]".format(track_count, clips_per_track, clip_seconds, 'mapped' if mapped else 'unmapped'),
+                       bench_mixer(silence_clips(track_clips, mapped), track_gains, track_pans, session_seconds, buffer_size, fs, repeat))
+
+    for track_count in track_counts:
+        track_clips, track_gains, track_pans = build_session(track_count, clips_per_track*edit_factor, clip_seconds/edit_factor, session_seconds, fs)
+        for cached in (False, True):
+            add_result("render_cache[tracks={},clips_per_track={},{}]".format(track_count, clips_per_track*edit_factor, 'cached' if cached else 'gathered'),
+                       bench_render_cache(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, cached, repeat))
+
+    for track_count in track_counts:
+        track_clips, track_gains, track_pans = build_session(track_count, clips_per_track, clip_seconds, session_seconds, fs)
+        add_result("null_backend_callback[tracks={},clips_per_track={},clip_seconds={}]".format(track_count, clips_per_track, clip_seconds),
+                   bench_null_backend_callback(track_clips, track_gains, track_pans, session_seconds, buffer_size, fs, repeat))
+
+    add_result("filter_audio[buffer={}]".format(buffer_size), bench_filter_audio(session_seconds, buffer_size, fs, repeat))
+    for track_count in track_counts:
+        add_result("track_eqs[tracks={},buffer={},batched]".format(track_count, buffer_size), bench_track_eqs(track_count, session_seconds, buffer_size, fs, True, repeat))
+        add_result("track_eqs[tracks={},buffer={},separate]".format(track_count, buffer_size), bench_track_eqs(track_count, session_seconds, buffer_size, fs, False, repeat))
+    add_result("analyzer[buffer={}]".format(buffer_size), bench_analyzer(session_seconds, buffer_size, fs, repeat))
+
+    clip = np.random.RandomState(3).uniform(-0.5, 0.5, int(clip_seconds*fs)).astype(np.float32)
+    add_result("waveform_generation[clip_seconds={}]".format(clip_seconds), bench_waveform_generation(clip, fs, repeat))
+
+    with tempfile.TemporaryDirectory() as directory:
+        add_optional_result("clip_loading[clip_seconds={}]".format(clip_seconds), lambda: bench_clip_loading(clip, fs, directory, repeat))
+        add_optional_result("split[clip_seconds={}]".format(clip_seconds), lambda: bench_split(clip, fs, directory, repeat))
+
+    print_scaling_table(results, track_counts, clips_per_track, clip_seconds, thread_counts)
+
+    return results
+
+
+def compare_results(results, previous_results, threshold):
+    # Print the change of each case which is in both results. Returns the names of cases which are slower by more than threshold.
+    regressions = []
+    print("\nComparison to previous results:")
+    for name, result in results.items():
+        if name not in previous_results or 'realtime_multiple' not in result:
+            continue
+
+        change = result['realtime_multiple']/previous_results[name]['realtime_multiple'] - 1
+        if change < -threshold:
+            regressions.append(name)
+            note = "REGRESSION"
+        else:
+            note = ""
+        print("{:75s} {:+7.1f}% {}".format(name, change*100, note))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmarks of the mixing and DSP hot paths.")
+    parser.add_argument('--tracks', type=int, nargs='+', default=default_track_counts, help="Track counts of the synthetic sessions")
+    parser.add_argument('--clips-per-track', type=int, default=default_clips_per_track)
+    parser.add_argument('--clip-seconds', type=float, default=default_clip_seconds)
+    parser.add_argument('--session-seconds', type=float, default=default_session_seconds)
+    parser.add_argument('--buffer-size', type=int, default=samples_per_playback_buffer)
+    parser.add_argument('--sampling-rate', type=int, default=sampling_rate)
+    parser.add_argument('--threads', type=int, nargs='+', default=default_thread_counts, help="Thread counts of the parallel mixer cases")
+    parser.add_argument('--repeat', type=int, default=default_repeat)
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Compare to results in this JSON file, exits with 1 if any case regressed")
+    parser.add_argument('--threshold', type=float, default=default_regression_threshold, help="Relative slowdown reported as a regression")
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.tracks, arguments.clips_per_track, arguments.clip_seconds, arguments.session_seconds,
+                             arguments.buffer_size, arguments.sampling_rate, arguments.threads, arguments.repeat)
+
+    if arguments.output:
+        data = {'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+                                'platform': platform.platform(), 'processor': platform.processor()},
+                'parameters': {'tracks': arguments.tracks, 'clips_per_track': arguments.clips_per_track, 'clip_seconds': arguments.clip_seconds,
+                               'session_seconds': arguments.session_seconds, 'buffer_size': arguments.buffer_size,
+                               'sampling_rate': arguments.sampling_rate, 'threads': arguments.threads, 'repeat': arguments.repeat},
+                'results': results}
+        with open(arguments.output, 'w') as json_file:
+            json.dump(data, json_file, indent=4)
+
+    if arguments.compare:
+        with open(arguments.compare) as json_file:
+            previous_results = json.load(json_file)['results']
+        if compare_results(results, previous_results, arguments.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,15 +15,31 @@ from kivy.graphics import Color, Rectangle, Line, InstructionGroup
 
 # Project files
 from TopBar import TopBar
+from ExportPopup import ExportPopup
 from TrackContainer import TrackContainer, MiddleBar
+from WaveformPeaks import WaveformPeaks
+from MeterEngine import MeterEngine
+from LoudnessMeter import LoudnessMeter, LoudnessMeterTap
+from Transport import Transport
+from Session import Session
+from TrackRenderCache import TrackRenderCache
+from ClipCache import ClipCache
+from WaveformTileCache import WaveformTileCache
+from Mixer import ParallelMixer
+from ClipFile import load_clip, write_clip
+from SessionFile import write_session_file, relative_audio_path, absolute_audio_path, session_file_extension
+from SessionJournal import SessionJournal, read_journaled_session
+from StemExport import StemJob, StemExport
+from MixdownExport import MixdownExport, MixdownTarget
+from DSPLoadMonitor import DSPLoadMonitor, CLIP_GATHER, MIXING, PEQ_FILTERING, ANALYZER, METERING
+from AudioBackend import create_audio_backend
+from AudioConfig import audio_config, AdaptiveBufferSize
 from GlobalAudioVariables import *
 
 # General Python imports
-import pyaudio
+import os
 import numpy as np
-import soundfile
 import _thread
-import librosa
 import time
 import gc
 
@@ -32,6 +48,23 @@ import gc
 frames_per_second = 40
 fps_in_seconds = 1/frames_per_second
 
+# Session saved with ctrl+s and loaded with ctrl+o. Dropping a session file on the window loads it instead.
+default_session_path = ".\\session"+session_file_extension
+
+# Autosave of the session, written every autosave_interval seconds. The autosave of a previous run is kept in recovered_autosave_path and loaded with ctrl+r.
+autosave_path = ".\\autosave"+session_file_extension
+recovered_autosave_path = ".\\recovered_autosave"+session_file_extension
+autosave_interval = 5
+
+# Stems of an export are written to a new folder in this one, named by the time of the export
+stem_export_directory = ".\\Exported Stems"
+
+# Mixdowns are written to this folder, one file per format of mixdown_formats in GlobalAudioVariables.py
+mixdown_directory = ".\\Mixdowns"
+
+# Memory for the textures of waveform tiles. Tiles which haven't been drawn for the longest are dropped and rendered again when needed.
+waveform_tile_cache_budget_in_MB = 256
+
 
 class MainView(BoxLayout):
 
@@ -62,20 +95,73 @@ class MainView(BoxLayout):
         self.TrackContainer = TrackContainer()
         self.add_widget(self.TrackContainer)
 
+        # Model of what the audio engine plays. Tracks, SoundClips and MasterVolume edit it, the audio thread reads its snapshots.
+        # Each Track's clips are flattened to a render in the background, which playback reads instead of gathering the clips.
+        self.TrackRenderCache = TrackRenderCache()
+        self.Session = Session(self.MiddleBar.TrackAxis.TimeSlider.max, self.TrackRenderCache)
+
         # Bind touch_up to other areas than Track's objects to remove active_Track
         self.bind(on_touch_up=self.TrackContainer.remove_active_Track)
 
         # Boolean representing current state for recording. When initializing the program is not recording.
         self.recording_active = False
 
-        # PyAudio object for creating the output sound
-        self.PyAudio = pyaudio.PyAudio()
+        # Audio device used for playback and recording. Chosen by 'audio_backend' in GlobalAudioVariables.py or the DAW_AUDIO_BACKEND environment variable.
+        # Without hardware the device is paced like a sound card, so the GUI process doesn't busy-spin.
+        self.AudioBackend = create_audio_backend(realtime=True)
+
+        # Output stream, opened after the controls have been created
+        self.audio_output_stream = None
+
+        # Silent buffer and fade gains, sized by the playback buffer size
+        self.init_playback_buffers()
+
+        # Sampling rate of the session. Positions of SoundClips, TimeSlider and Transport are in samples at this rate.
+        self.session_sampling_rate = audio_config.sampling_rate
+
+        # Grows and shrinks the playback buffer when audio_config.adaptive_buffer_size is on
+        self.AdaptiveBufferSize = AdaptiveBufferSize(audio_config)
+
+        # Rebuild buffers and reopen the output stream when audio settings change
+        audio_config.bind(self.apply_audio_config)
 
         # Boolean representing current state for playback. When initializing the program is not recording.
         self.playback_active = False
 
-        # Dictionary where wavs of all SoundClips are stored
-        self.wav_dict = {}
+        # Playhead of the audio engine. TimeSlider follows it at display rate during playback.
+        self.Transport = Transport()
+
+        # Latest value given to TimeSlider from Transport. Used to tell apart TimeSlider changes made by the user.
+        self.TimeSlider_value_from_Transport = None
+
+        # Samples of all SoundClips by path, within a memory budget. Clips far from the playhead are compressed, then evicted and read again from their files when needed.
+        self.ClipCache = ClipCache(lambda path: load_clip(path, audio_config.sampling_rate), clip_cache_budget_in_MB*2**20, audio_config.sampling_rate, clip_prefetch_seconds, clip_compression)
+
+        # Waveform tiles of SoundClips, rendered in their own thread
+        self.WaveformTileCache = WaveformTileCache(waveform_tile_cache_budget_in_MB*2**20)
+
+        # Writes the edits of the session to autosave_path in its own thread. The master settings are marked so the first autosave has them.
+        self.SessionJournal = SessionJournal(autosave_path, recovered_autosave_path)
+        self.autosaved_clip_counter = 0
+        self.Session.mark_edited()
+
+        # Levels of all Tracks and the output, written by the audio thread and shown by LevelIndicators
+        self.MeterEngine = MeterEngine(level_meter_mode)
+
+        # Loudness and true peak of the output. The audio thread only hands output buffers to the tap, measuring is done in the tap's own thread.
+        self.LoudnessMeterTap = LoudnessMeterTap(LoudnessMeter(audio_config.sampling_rate, audio_config.number_of_output_channels))
+        self.LoudnessMeterTap.start()
+
+        # Splits the per-Track work of large sessions between threads
+        self.ParallelMixer = ParallelMixer(mixer_threads)
+
+        # Export which is running, the folder it writes to and the popup showing its progress
+        self.Export = None
+        self.export_directory = ''
+        self.ExportPopup = None
+
+        # Timing of each playback callback, shown by TopBar.DSPLoadReadout
+        self.DSPLoadMonitor = DSPLoadMonitor()
 
         # Variable indicating which mode cursor is on
         self.cursor_mode = ''
@@ -101,11 +187,20 @@ class MainView(BoxLayout):
         # Add one track which has recording on
         Clock.schedule_once(self.add_one_Track_on_init)
 
+        # The output stream is opened once and stays open. It outputs silence until Transport is started.
+        # The callback uses TopBar and TrackContainer objects which are created in 'self.init_controls', so the stream is opened after it.
+        Clock.schedule_once(self.open_audio_output_stream)
+
 
     def create_SoundClip_from_dropped_file(self, window_object, dropped_file_path, *args, **kwargs):
         # Convert path from bytes to string
         dropped_file_path = dropped_file_path.decode("utf-8") 
 
+        # Dropped session files replace the current session
+        if dropped_file_path.lower().endswith(session_file_extension):
+            self.load_session(dropped_file_path)
+            return
+
         # Check if dropped file is wav
         if dropped_file_path[-4:].lower() != '.wav':
             return # If not wav return out of method
@@ -113,8 +208,8 @@ class MainView(BoxLayout):
         # Calculate mouse position in relation to SoundClipField
         dropped_relative_pos = self.TrackContainer.TrackSoundClipView.SoundClipField.to_widget(Window.mouse_pos[0], Window.mouse_pos[1], relative=True)
 
-        # Add file to Track
-        for track in self.TrackContainer.Tracks:
+        # Add file to Track. The file was dropped on the view, so only the Tracks in it are checked.
+        for track in self.TrackContainer.shown_Tracks:
 
             # Check if file was dropped on this Track's TrackSoundClipLayout
             if track.TrackSoundClipLayout.collide_point(*dropped_relative_pos):
@@ -127,33 +222,30 @@ class MainView(BoxLayout):
 
                 # Restrict too long files or cut them to the correct length 
                 samples_remaining = self.MiddleBar.TrackScaleController.TimeAxisSlider.max-start_sample        # Calculate maximum amount of samples which can be allowed
-                samples, _ = librosa.load(dropped_file_path, sr=sampling_rate, dtype=np.float32)               # Open dropped wav
-                samples = samples[0:samples_remaining]                                                         # Restrict amount of samples
+                samples = load_clip(dropped_file_path, audio_config.sampling_rate)                             # Open dropped wav
+                samples = samples.section(0, samples_remaining)                                                # Restrict amount of samples
 
                 # Create new path name
-                track.latest_recorded_audio_file = ".\\Recorded Audio Files\\"+str(track.Nth_track_created)+"_"+track.TrackControls.TrackNameField.text+"#"+str(track.audio_clip_counter)+".wav"
-                
-                # Increase counter so next audio file has a unique name and doesn't overwrite previous files
-                track.audio_clip_counter += 1
+                track.latest_recorded_audio_file = track.new_audio_file_path()
                 
                 # Write new wav to new path
-                soundfile.write(track.latest_recorded_audio_file, np.frombuffer(b''.join(samples), "Float32"), sampling_rate) 
+                write_clip(track.latest_recorded_audio_file, samples, audio_config.sampling_rate)
+
+                # Add the new SoundClip's samples to ClipCache. The samples are the ones just written, so there is no need to read the file again.
+                peaks = WaveformPeaks.from_samples(samples)
+                samples = self.ClipCache.put(track.latest_recorded_audio_file, samples)
 
                 # Add the recorded SoundClip to Track and to layout
                 track.add_SoundClip(track.latest_recorded_audio_file,                            # recorded_audio_path
                                     self.MiddleBar.TrackScaleController.TimeAxisSlider.max,      # samples_in_time_axis
                                     self.TrackContainer.Track_height,                            # Track_height
                                     self.TrackContainer.TrackSoundClipView.SoundClipField.width, # SoundClipField_width
-                                    start_sample)                                                # start_sample
-                track.TrackSoundClipLayout.add_widget(track.SoundClips[-1])
-
-                # Place the SoundClip in the layout
-                track.SoundClips[-1].y = track.TrackSoundClipLayout.y
-                track.SoundClips[-1].x = track.SoundClips[-1].relative_x * self.TrackContainer.TrackSoundClipView.SoundClipField.width
-                track.SoundClips[-1].move_plot()
+                                    start_sample,                                                # start_sample
+                                    samples,                                                     # samples
+                                    peaks)                                                       # peaks
 
-                # Add the new SoundClip's wav to the dictionary
-                self.wav_dict[track.SoundClips[-1].path], _ = librosa.load(track.SoundClips[-1].path, sr=sampling_rate, dtype=np.float32)
+                # Place the SoundClip in the layout if it is in view
+                self.TrackContainer.place_SoundClip(track, track.SoundClips[-1])
 
                 # Switch back to normal cursor 
                 Window.set_system_cursor('arrow')
@@ -161,6 +253,269 @@ class MainView(BoxLayout):
                 # Break out since dropped file can be added to only one Track
                 break
 
+    def get_master_manifest(self, *args, **kwargs):
+        # Settings of the whole session for a session file
+        return {'sampling_rate': audio_config.sampling_rate,
+                'master_volume_in_dB': float(self.TopBar.MasterVolume.VolumeSlider.value),
+                'output_eq': self.TopBar.PEQPopup.PEQLayout.get_filter_settings()}
+
+    def get_Track_manifest(self, track, session_path, clip_keys, *args, **kwargs):
+        # Settings and SoundClips of a Track for a session file. clip_keys name the arrays of each SoundClip.
+        TrackControls = track.TrackControls
+        return {'track_id': track.TrackState.track_id,
+                'name': TrackControls.TrackNameField.text,
+                'color': list(TrackControls.color),
+                'volume_in_dB': float(TrackControls.VolumeSliderBox.VolumeSlider.value),
+                'pan': float(TrackControls.TrackPanSlider.value),
+                'mute': TrackControls.mute_bool,
+                'solo': TrackControls.solo_bool,
+                'eq': track.PEQPopup.PEQLayout.get_filter_settings() if track.PEQPopup else None,
+                'clips': [{'path': relative_audio_path(clip.path, session_path),
+                           'start_sample': clip.start_sample,
+                           'length': clip.length_in_samples,
+                           'arrays': key,
+                           'regions': clip.ClipState.regions is not None,
+                           'silence_stripped': clip.silence_stripped}
+                          for clip, key in zip(track.SoundClips, clip_keys)]}
+
+    def get_clip_arrays(self, clip, key, peaks=True, regions=True, *args, **kwargs):
+        # WaveformPeaks and silence map of a SoundClip for a session file
+        arrays = {}
+        if peaks:
+            arrays[key+"_minimums"], arrays[key+"_maximums"] = clip.WaveformPeaks.get_peaks()
+        if regions and clip.ClipState.regions is not None:
+            arrays[key+"_regions"] = clip.ClipState.regions
+        return arrays
+
+    def save_session(self, path, *args, **kwargs):
+        # Write the Tracks, their settings and SoundClips to a session file. The audio stays in its files, only the clips' WaveformPeaks and
+        # silence maps are stored with the session, so loading doesn't have to read or scan any audio.
+        manifest = dict(self.get_master_manifest(), tracks=[])
+        arrays = {}
+
+        for track_ind, track in enumerate(self.TrackContainer.Tracks):
+            # Arrays of each clip are named by its Track and place in the Track
+            clip_keys = ["track{}_clip{}".format(track_ind, clip_ind) for clip_ind in range(len(track.SoundClips))]
+            manifest['tracks'].append(self.get_Track_manifest(track, path, clip_keys))
+            for clip, key in zip(track.SoundClips, clip_keys):
+                arrays.update(self.get_clip_arrays(clip, key))
+
+        write_session_file(path, manifest, arrays)
+        print("Session saved to "+path)
+
+    def autosave(self, *args, **kwargs):
+        # Hand the edits since the previous autosave to SessionJournal, which writes them in its own thread. Only the edited Tracks are
+        # written, and the WaveformPeaks of a SoundClip only once, so an autosave costs as much as the edits. Tracks are looked up in
+        # TrackContainer.Tracks to keep their order, which is only a loop over the Tracks.
+        edited_track_ids, master_edited = self.Session.take_edits()
+        if not edited_track_ids and not master_edited:
+            return
+
+        tracks = {}
+        arrays = {}
+        for track in self.TrackContainer.Tracks:
+            if track.TrackState.track_id not in edited_track_ids:
+                continue
+            edited_track_ids.discard(track.TrackState.track_id)
+
+            # New SoundClips get a key which their arrays keep for as long as they exist. A silence map is written again only if it has been
+            # replaced since the previous autosave, so changing a Track's settings doesn't write its clips' arrays.
+            clip_keys = []
+            for clip in track.SoundClips:
+                new_clip = clip.autosave_key is None
+                if new_clip:
+                    clip.autosave_key = "clip{}".format(self.autosaved_clip_counter)
+                    self.autosaved_clip_counter += 1
+                clip_keys.append(clip.autosave_key)
+                regions_changed = new_clip or clip.ClipState.regions is not clip.autosaved_regions
+                arrays.update(self.get_clip_arrays(clip, clip.autosave_key, peaks=new_clip, regions=regions_changed))
+                clip.autosaved_regions = clip.ClipState.regions
+            tracks[str(track.TrackState.track_id)] = self.get_Track_manifest(track, autosave_path, clip_keys)
+
+        # The rest of the edited Tracks have been removed
+        for track_id in edited_track_ids:
+            tracks[str(track_id)] = None
+
+        self.SessionJournal.record(self.get_master_manifest() if master_edited else None, tracks, arrays)
+
+    def load_session(self, path, *args, **kwargs):
+        # Replace the current session with the one in a session file, with the edits of its journal if it has one, like the autosave has.
+        # SoundClips are created from the stored peaks and their audio is
+        # registered to ClipCache without reading it. TrackRenderCache and ClipCache read the files in the background, the ones near the
+        # playhead first, so a large session opens at once and is playable as soon as the audio around the playhead is in.
+        if self.recording_active:
+            return
+        if not os.path.exists(path):
+            print("No session file "+path)
+            return
+
+        Window.set_system_cursor('wait')
+        manifest, arrays = read_journaled_session(path)
+
+        # Stop playback and remove the current Tracks
+        if self.playback_active:
+            self.init_playback()
+        for track in list(self.TrackContainer.Tracks):
+            self.TrackContainer.active_Track = track
+            self.TrackContainer.remove_Track()
+
+        # Positions of SoundClips are in samples at the session's sampling rate. An autosave whose master settings were never written, because
+        # they weren't edited, keeps the current ones.
+        sampling_rate = manifest.get('sampling_rate', audio_config.sampling_rate)
+        if sampling_rate != audio_config.sampling_rate:
+            self.change_audio_settings(sampling_rate=sampling_rate)
+
+        if 'master_volume_in_dB' in manifest:
+            self.TopBar.MasterVolume.VolumeSlider.value = manifest['master_volume_in_dB']
+        if 'output_eq' in manifest:
+            self.TopBar.PEQPopup.PEQLayout.set_filter_settings(manifest['output_eq'])
+
+        SoundClipField = self.TrackContainer.TrackSoundClipView.SoundClipField
+        for track_manifest in manifest['tracks']:
+            self.TrackContainer.add_Track()
+            track = self.TrackContainer.Tracks[-1]
+            TrackControls = track.TrackControls
+
+            # Settings of the Track. Mute and solo are toggled so their buttons change too.
+            TrackControls.TrackNameField.text = track_manifest['name']
+            TrackControls.color = track_manifest['color']
+            TrackControls.VolumeSliderBox.VolumeSlider.value = track_manifest['volume_in_dB']
+            TrackControls.TrackPanSlider.value = track_manifest['pan']
+            if TrackControls.mute_bool != track_manifest['mute']:
+                TrackControls.change_Track_mute_status()
+            if TrackControls.solo_bool != track_manifest['solo']:
+                TrackControls.change_Track_solo_status()
+            if track_manifest['eq'] is not None:
+                track.create_PEQPopup()
+                track.PEQPopup.PEQLayout.set_filter_settings(track_manifest['eq'])
+
+            for clip_manifest in track_manifest['clips']:
+                clip_path = absolute_audio_path(clip_manifest['path'], path)
+                if not os.path.exists(clip_path):
+                    print("Audio file "+clip_path+" of the session is missing, its SoundClip is left out")
+                    continue
+
+                key = clip_manifest['arrays']
+                peaks = WaveformPeaks.from_peaks(arrays[key+"_minimums"], arrays[key+"_maximums"], clip_manifest['length'])
+                regions = arrays[key+"_regions"] if clip_manifest['regions'] else None
+                samples = self.ClipCache.register(clip_path, clip_manifest['length'])
+
+                track.add_SoundClip(clip_path,                                              # recorded_audio_path
+                                    self.MiddleBar.TrackScaleController.TimeAxisSlider.max, # samples_in_time_axis
+                                    self.TrackContainer.Track_height,                       # Track_height
+                                    SoundClipField.width,                                   # SoundClipField_width
+                                    clip_manifest['start_sample'],                          # start_sample
+                                    samples,                                                # samples
+                                    peaks,                                                  # peaks
+                                    regions)                                                # regions
+
+                # Place the SoundClip in the layout if it is in view
+                self.TrackContainer.place_SoundClip(track, track.SoundClips[-1])
+
+                if clip_manifest['silence_stripped']:
+                    track.SoundClips[-1].draw_regions(regions)
+                    track.SoundClips[-1].silence_stripped = True
+
+        # Let ClipCache prefetch around the playhead of the new session
+        self.ClipCache.set_playhead(self.MiddleBar.TrackAxis.TimeSlider.value, self.Session.snapshot)
+        Window.set_system_cursor('arrow')
+        print("Session loaded from "+path)
+
+    def export_stems(self, *args, **kwargs):
+        # Render every Track which is heard to its own stereo file with its gain, pan and EQ, and the master with the output volume and EQ.
+        # The Tracks are rendered in worker processes by StemExport, while ExportPopup shows the progress.
+        if self.Export or self.recording_active:
+            return
+
+        # Tracks in the order of TrackContainer.Tracks, muted ones and ones which aren't soloed when others are left out like in playback
+        tracks = [track for track in self.TrackContainer.Tracks if track.TrackState.clips]
+        if any(track.TrackState.solo for track in tracks):
+            tracks = [track for track in tracks if track.TrackState.solo]
+        tracks = [track for track in tracks if not track.TrackState.mute]
+        if not tracks:
+            print("Nothing to export")
+            return
+
+        # Stems last until the end of the last clip and one buffer more for the tails of EQs
+        buffer_size = audio_config.samples_per_playback_buffer
+        length_in_samples = max(clip.start_sample+len(clip.samples) for track in tracks for clip in track.TrackState.clips) + buffer_size
+
+        directory = os.path.join(stem_export_directory, time.strftime("%Y%m%d_%H%M%S"))
+        os.makedirs(directory, exist_ok=True)
+
+        jobs = []
+        for ind, track in enumerate(tracks):
+            TrackState = track.TrackState
+            file_name = "".join(character for character in track.TrackControls.TrackNameField.text if character.isalnum() or character in " -_")
+            jobs.append(StemJob(ind,
+                                os.path.join(directory, str(ind+1)+"_"+file_name+".wav"),
+                                [(clip.start_sample, clip.path, clip.region_edges) for clip in TrackState.clips],
+                                TrackState.gain,
+                                TrackState.pan,
+                                TrackState.eq_response,
+                                length_in_samples,
+                                buffer_size,
+                                audio_config.sampling_rate,
+                                sum(len(clip.samples) for clip in TrackState.clips)))
+
+        self.start_Export(StemExport(jobs, os.path.join(directory, "master.wav"), self.Session.master_gain, self.get_output_eq_response(), stem_export_processes), "Exporting stems", directory)
+
+    def export_mixdown(self, *args, **kwargs):
+        # Render the mix once and write it to every format of mixdown_formats, for example a 24-bit WAV, a 16-bit WAV and a FLAC, resampled
+        # and dithered on the way. MixdownExport streams each buffer to all files, so memory use doesn't depend on the length of the session.
+        if self.Export or self.recording_active:
+            return
+
+        snapshot = self.Session.snapshot
+        clip_ends = [start_sample+len(samples) for clips in snapshot.track_clips for start_sample, samples, regions in clips]
+        if not clip_ends:
+            print("Nothing to export")
+            return
+
+        # The mix lasts until the end of the last clip and one buffer more for the tails of EQs
+        buffer_size = audio_config.samples_per_playback_buffer
+        length_in_samples = max(clip_ends) + buffer_size
+
+        os.makedirs(mixdown_directory, exist_ok=True)
+        file_start = os.path.join(mixdown_directory, time.strftime("%Y%m%d_%H%M%S"))
+        targets = []
+        for file_format, subtype, target_sampling_rate in mixdown_formats:
+            target_sampling_rate = target_sampling_rate or audio_config.sampling_rate
+            path = "{}_{}_{}.{}".format(file_start, subtype, target_sampling_rate, file_format.lower())
+            targets.append(MixdownTarget(path, file_format, subtype, target_sampling_rate))
+
+        self.start_Export(MixdownExport(snapshot, targets, length_in_samples, buffer_size, audio_config.sampling_rate, self.get_output_eq_response()), "Exporting mixdown", mixdown_directory)
+
+    def get_output_eq_response(self, *args, **kwargs):
+        # Complete response of the output EQ for exports, or None when it is flat
+        response = np.array(self.TopBar.PEQPopup.PEQLayout.OverlapAddFilter.complete_complex_response)
+        return None if np.allclose(response, 1) else response
+
+    def start_Export(self, Export, title, directory, *args, **kwargs):
+        # Show the progress of a StemExport or MixdownExport, which run in their own thread, until it has ended
+        self.Export = Export
+        self.export_directory = directory
+        self.ExportPopup = ExportPopup(title, Export.cancel)
+        self.ExportPopup.open()
+        Clock.schedule_interval(self.follow_Export, 1/10)
+
+    def follow_Export(self, *args, **kwargs):
+        self.ExportPopup.set_progress(self.Export.get_progress())
+        if self.Export.status == 'running':
+            return
+
+        if self.Export.status == 'done':
+            print("Exported to "+self.export_directory)
+            if isinstance(self.Export, MixdownExport):
+                print("Loudness of the mixdown: "+str(self.Export.loudness))
+        elif self.Export.status == 'failed':
+            print("Export failed: "+repr(self.Export.error))
+
+        Clock.unschedule(self.follow_Export)
+        self.ExportPopup.dismiss()
+        self.ExportPopup = None
+        self.Export = None
+
     def _keyboard_closed(self):
         print('Keyboard not available!')
         self._keyboard.unbind(on_key_down=self.change_SoundClip_editing_mode)
@@ -169,11 +524,30 @@ class MainView(BoxLayout):
     def change_SoundClip_editing_mode(self, keyboard, keycode, text, modifiers):
         # This method allows for changing cursor, which indicates for example that SoundClips are deleted/split/moved on press
 
+        # ctrl+s and ctrl+o save and load the session without changing the mode
+        if 'ctrl' in modifiers and keycode == (115, 's'):
+            self.save_session(default_session_path)
+            return
+        elif 'ctrl' in modifiers and keycode == (111, 'o'):
+            self.load_session(default_session_path)
+            return
+        elif 'ctrl' in modifiers and keycode == (114, 'r'):
+            self.load_session(recovered_autosave_path)
+            return
+        elif 'ctrl' in modifiers and keycode == (101, 'e'):
+            self.export_stems()
+            return
+        elif 'ctrl' in modifiers and keycode == (98, 'b'):
+            self.export_mixdown()
+            return
+
         # Reference for changing cursor: https://www.reddit.com/r/kivy/comments/bx4h8n/is_there_any_way_to_change_the_mouse_cursor/
         if keycode == (8, 'backspace'):
             self.cursor_mode = 'backspace' # 'backspace' stands for removal of SoundClips
         elif keycode == (120, 'x'):
             self.cursor_mode = 'x' # 'x' stands for cutting SoundClips to separate SoundClips
+        elif keycode == (115, 's'):
+            self.cursor_mode = 's' # 's' stands for stripping silence from SoundClips
         else:
             self.cursor_mode = '' # '' stands for normal mode where SoundClips can be moved around
             Window.set_system_cursor('arrow')
@@ -192,6 +566,8 @@ class MainView(BoxLayout):
                 Window.set_system_cursor('ibeam')
             elif self.cursor_mode == 'backspace':
                 Window.set_system_cursor('crosshair')
+            elif self.cursor_mode == 's':
+                Window.set_system_cursor('hand')
         else:
             Window.set_system_cursor('arrow')
 
@@ -209,6 +585,24 @@ class MainView(BoxLayout):
         self.TopBar.init_buttons()
         self.TrackContainer.TrackSoundClipView.SoundClipField.width = self.TrackContainer.TrackSoundClipView.width
 
+        # Update all LevelIndicators at display rate. MasterVolume's LevelIndicator exists only after 'TopBar.init_buttons'.
+        Clock.schedule_interval(self.update_LevelIndicators, fps_in_seconds)
+
+        # Draw the waveform tiles which have been rendered at display rate
+        Clock.schedule_interval(self.WaveformTileCache.upload_tiles, fps_in_seconds)
+
+        # Loudness values change every 100 ms, so the readout is updated at the same rate
+        Clock.schedule_interval(self.update_LoudnessReadout, 1/10)
+
+        # DSP load is averaged over the latest callbacks, so a few updates per second is enough
+        Clock.schedule_interval(self.update_DSPLoadReadout, 1/2)
+
+        # Check once per second if the playback buffer should grow or shrink
+        Clock.schedule_interval(self.adapt_playback_buffer, 1)
+
+        # Autosave the edits every few seconds
+        Clock.schedule_interval(self.autosave, autosave_interval)
+
     def bind_controls_to_methods(self, *args, **kwargs):
         # TopBar binds
         self.TopBar.ScrollForwardButton.bind(on_release=self.MiddleBar.TrackAxis.TimeSlider.scroll_forward)
@@ -216,6 +610,7 @@ class MainView(BoxLayout):
         self.TopBar.PauseToBeginningButton.bind(on_release=self.pause_to_beginning)
         self.TopBar.PlayButton.bind(on_release=self.init_playback)
         self.TopBar.RecordButton.bind(on_release=self.init_recording)
+        self.TopBar.DSPLoadReadout.bind(on_release=self.write_DSP_load_file)
 
         # MiddleBar binds
         self.MiddleBar.TrackScaleController.TimeAxisSlider.bind(value=lambda a, b : self.TrackContainer.change_Track_width(self.MiddleBar.TrackScaleController.TimeAxisSlider.value)) # Not sure if I fully understand how this lambda works. Why do the a,b have to be defined? My guess is that they are the self and new_time variables.
@@ -234,8 +629,18 @@ class MainView(BoxLayout):
         self.MiddleBar.TrackAxis.TimeSlider.width = self.TrackContainer.TrackSoundClipView.SoundClipField.width
         self.TrackContainer.TrackSoundClipView.bind(scroll_x=self.MiddleBar.TrackAxis.scroll_layout)
 
+        # Moving TimeSlider moves Transport
+        self.MiddleBar.TrackAxis.TimeSlider.bind(value=self.locate_Transport)
+
+        # Session converts SoundClip positions with the length of the time axis and mixes with the output volume
+        self.MiddleBar.TrackAxis.TimeSlider.bind(max=lambda TimeSlider, new_max : setattr(self.Session, 'length_in_samples', new_max))
+        self.TopBar.MasterVolume.VolumeSlider.bind(linear_gain_factor=lambda VolumeSlider, new_gain : self.Session.set_master_gain(new_gain))
+
+        # The output EQ is applied in the callback and not through Session, so its changes are marked for the autosave here
+        self.TopBar.PEQPopup.PEQLayout.response_callback = lambda complete_complex_response : self.Session.mark_edited()
+
         # Set TimeTable's maximum to match TimeSlider's maximum
-        self.TopBar.TimeTable.max = self.MiddleBar.TrackAxis.TimeSlider.max/sampling_rate
+        self.TopBar.TimeTable.max = self.MiddleBar.TrackAxis.TimeSlider.max/audio_config.sampling_rate
 
     def add_one_Track_on_init(self, *args, **kwargs):
         # Add one track
@@ -324,21 +729,24 @@ class MainView(BoxLayout):
                     # Stop recording audio
                     track.recording_process(False)
 
+                    # Add the recorded samples to ClipCache. They are used directly instead of reading the written file.
+                    recorded_samples = self.ClipCache.put(track.latest_recorded_audio_file, track.latest_recorded_samples)
+
                     # Add the recorded SoundClip to Track and to layout
                     track.add_SoundClip(track.latest_recorded_audio_file,                             # recorded_audio_path
                                         self.MiddleBar.TrackScaleController.TimeAxisSlider.max,       # samples_in_time_axis
                                         self.TrackContainer.Track_height,                             # Track_height
                                         self.TrackContainer.TrackSoundClipView.SoundClipField.width,  # SoundClipField_width
-                                        self.MiddleBar.TrackAxis.TimeSlider.start_sample)             # start_sample
-                    track.TrackSoundClipLayout.add_widget(track.SoundClips[-1])
+                                        self.MiddleBar.TrackAxis.TimeSlider.start_sample,             # start_sample
+                                        recorded_samples,                                             # samples
+                                        track.latest_recorded_peaks)                                  # peaks calculated during recording
 
-                    # Place the SoundClip in the layout
-                    track.SoundClips[-1].y = track.TrackSoundClipLayout.y
-                    track.SoundClips[-1].x = track.SoundClips[-1].relative_x * self.TrackContainer.TrackSoundClipView.SoundClipField.width
-                    track.SoundClips[-1].move_plot()
+                    # Place the SoundClip in the layout if it is in view
+                    self.TrackContainer.place_SoundClip(track, track.SoundClips[-1])
 
-                    # Add the new SoundClip's wav to the dictionary
-                    self.wav_dict[track.SoundClips[-1].path], _ = librosa.load(track.SoundClips[-1].path, sr=sampling_rate, dtype=np.float32)
+                    # The samples and peaks are now owned by the SoundClip and ClipCache
+                    track.latest_recorded_samples = None
+                    track.latest_recorded_peaks = None
 
                     # Reconnect the bind to the method controling wheather Track is recording or not
                     track.TrackControls.RecBoolBtn.bind(on_release=track.TrackControls.change_Track_recording_status)
@@ -358,7 +766,7 @@ class MainView(BoxLayout):
             if track.TrackControls.recording_bool:
 
                 # Increase TimeSlider's position. Done this way to prevent anything from happening if the user grabs TimeSlider when recording
-                self.MiddleBar.TrackAxis.TimeSlider.value = self.MiddleBar.TrackAxis.TimeSlider.start_sample + len(track.recorded_buffers)*samples_per_recording_buffer
+                self.MiddleBar.TrackAxis.TimeSlider.value = self.MiddleBar.TrackAxis.TimeSlider.start_sample + track.recorded_sample_count
 
                 # If TimeSlider has reached its end==maximum value, end_recording will be True and recording will end.
                 if self.MiddleBar.TrackAxis.TimeSlider.value >= self.MiddleBar.TrackAxis.TimeSlider.max:
@@ -368,7 +776,7 @@ class MainView(BoxLayout):
                 # Break after the looking how many samples the first recording Track has recorded. All Tracks should record roughly the same amount of samples
                 break
 
-        # Go through all tracks. If the track is recording, increase the recoring animation's width to match the TimeSlider's position.
+        # Go through all tracks. If the track is recording, increase the recoring animation's width to match the TimeSlider's position. Changing the width redraws the recorded waveform.
         for track in self.TrackContainer.Tracks:
             if track.TrackControls.recording_bool:
                 track.RecordingPlotLayout.width = self.MiddleBar.TrackAxis.TimeSlider.value_pos[0]-self.MiddleBar.TrackAxis.TimeSlider.start_x
@@ -395,205 +803,274 @@ class MainView(BoxLayout):
             # Forbid the user from recording while playback is on
             self.TopBar.RecordButton.unbind(on_release=self.init_recording)
 
-            # Open a .Stream object to write the WAV file to 'output = True' indicates that the sound will be played rather than recorded
-            self.audio_output_stream = self.PyAudio.open(
-                                format=pyaudio.paFloat32,
-                                channels = number_of_output_channels,
-                                rate = sampling_rate,
-                                output = True,
-                                stream_callback=self.playback_audio_callback,
-                                frames_per_buffer=samples_per_playback_buffer)
-
-            # Start streaming audio to output
-            self.audio_output_stream.start_stream()
+            # Integrated loudness and true peak are measured from the start of each playback, and so is the DSP load
+            self.LoudnessMeterTap.reset()
+            self.DSPLoadMonitor.reset()
 
-            # Check if TimeSlider has reached its maximum value and playback has to be stopped
-            Clock.schedule_interval(self.playback_end_check, 1/10)
+            # Start playing from where TimeSlider is
+            self.Transport.locate(self.MiddleBar.TrackAxis.TimeSlider.value)
 
-        else:
-            # Stop output audio stream
-            self.audio_output_stream.stop_stream()
+            # Start rendering audio at the next buffer of the already open output stream
+            self.Transport.start()
 
-            # Close audio output stream
-            self.audio_output_stream.close()
+            # Move TimeSlider with Transport and check if its maximum value has been reached and playback has to be stopped
+            Clock.schedule_interval(self.follow_Transport, fps_in_seconds)
 
-            # Stop checking if TimeSlider has reached its maximum value
-            Clock.unschedule(self.playback_end_check)
+        else:
+            # Stop rendering audio. The next buffer fades out and the stream keeps running with silence.
+            self.Transport.stop()
 
-            # If there are Tracks, send zeros to LevelIndicators to decay them to silence
-            if len(self.TrackContainer.Tracks) > 0:
-                Clock.schedule_interval(self.decay_LevelIndicators_to_silence,playback_buffer_time)
+            # Stop following Transport. LevelIndicators fall to silence by themselves since no more levels are written.
+            Clock.unschedule(self.follow_Transport)
 
             # Allow user to start recording
             self.TopBar.RecordButton.bind(on_release=self.init_recording)
 
 
-    def decay_LevelIndicators_to_silence(self, *args, **kwargs):
-        # If playback has started again, unschedule this method and return out
-        if self.playback_active:
-            Clock.unschedule(self.decay_LevelIndicators_to_silence)
-            return
+    def open_audio_output_stream(self, *args, **kwargs):
+        # Open an output stream which calls 'self.playback_audio_callback' whenever the device needs a new buffer
+        self.audio_output_stream = self.AudioBackend.open_output_stream(self.playback_audio_callback, audio_config.number_of_output_channels, audio_config.sampling_rate, audio_config.samples_per_playback_buffer)
 
-        # Initialize LevelIndicator average as 0
-        LevelIndicator_average = 0
+        # Start streaming audio to output
+        self.audio_output_stream.start_stream()
 
-        # Loop all Tracks and send zero to the LevelIndicator
-        for track in self.TrackContainer.Tracks:
-            # Send zeros to LevelIndicator
-            track.TrackControls.VolumeSliderBox.LevelIndicator.calculate_level(float(0))
+    def init_playback_buffers(self, *args, **kwargs):
+        # Output buffer returned while Transport is stopped
+        buffer_size = audio_config.samples_per_playback_buffer
+        self.silent_output_buffer = np.zeros( (buffer_size,audio_config.number_of_output_channels), dtype=np.float32)
 
-            # Add new level to averages
-            LevelIndicator_average += track.TrackControls.VolumeSliderBox.LevelIndicator.value
+        # Gains for fading in and out when playback starts and stops. The rest of a stopping buffer is silent.
+        self.fade_in_gains = np.ones( (buffer_size,1), dtype=np.float32)
+        self.fade_in_gains[0:samples_per_transport_fade,0] = np.linspace(0, 1, num=samples_per_transport_fade, endpoint=False)
+        self.fade_out_gains = np.zeros( (buffer_size,1), dtype=np.float32)
+        self.fade_out_gains[0:samples_per_transport_fade,0] = np.linspace(1, 0, num=samples_per_transport_fade, endpoint=False)
 
-        # Send zeros to MasterVolume LevelIndicator
-        self.TopBar.MasterVolume.LevelIndicator.calculate_level(float(0))
+    def change_audio_settings(self, **settings):
+        # Change audio settings at runtime, for example 'change_audio_settings(samples_per_playback_buffer=1024)'. SoundClips are stored in
+        # samples at the session's sampling rate, so the sampling rate can be changed only while nothing is recorded and there are no SoundClips.
+        if settings.get('sampling_rate', audio_config.sampling_rate) != audio_config.sampling_rate:
+            if self.recording_active or self.Session.has_clips():
+                raise ValueError("Sampling rate can be changed only when nothing is recording and there are no SoundClips.")
 
-        # Add the MasteVolume level to averages
-        LevelIndicator_average += self.TopBar.MasterVolume.LevelIndicator.value
+        return audio_config.set(**settings)
 
-        # Calculate average
-        LevelIndicator_average /= len(self.TrackContainer.Tracks)+1 # The amount of Tracks + 1 MasterVolume
+    def apply_audio_config(self, AudioConfig, changed_settings, *args, **kwargs):
+        # Listener of audio_config. Recording reads its settings when it starts, so only playback settings need work here.
+        if 'sampling_rate' not in changed_settings and 'samples_per_playback_buffer' not in changed_settings:
+            return
 
-        # If all LevelIndicators are below min (if they reach min they are set to below min, so the indicator can't be seen), unschedule this method
-        if LevelIndicator_average <= track.TrackControls.VolumeSliderBox.LevelIndicator.min:
-            # Force all of the LevelIndicators to their minimum to make sure all of them will be hidden
-            for track in self.TrackContainer.Tracks:
-                track.TrackControls.VolumeSliderBox.LevelIndicator.value = track.TrackControls.VolumeSliderBox.LevelIndicator.min
+        # Close the output stream so the audio thread doesn't use the buffers while they are replaced. Transport keeps its position.
+        stream_was_open = self.audio_output_stream is not None
+        if stream_was_open:
+            self.audio_output_stream.stop_stream()
+            self.audio_output_stream.close()
+            self.audio_output_stream = None
 
-            # Hide MasterVolume LevelIndicator
-            self.TopBar.MasterVolume.LevelIndicator.value = self.TopBar.MasterVolume.LevelIndicator.min
+        if 'sampling_rate' in changed_settings:
+            # Keep the same time in seconds in the time axis
+            self.scale_time_axis(AudioConfig.sampling_rate/self.session_sampling_rate)
+            self.session_sampling_rate = AudioConfig.sampling_rate
 
-            # Unschedule this method
-            Clock.unschedule(self.decay_LevelIndicators_to_silence)
+            # Prefetch distances are in samples
+            self.ClipCache.fs = AudioConfig.sampling_rate
 
-    def playback_audio_callback(self, in_data, frame_count, time_info, status):
-        ##########################
-        # Inspiration for lighter realtime playback to be implemented in the future. Currently all existing wavs are always open in 'wav_dict'
-        # https://stackoverflow.com/questions/28743400/pyaudio-play-multiple-sounds-at-once
-        # https://stackoverflow.com/questions/30071822/pyaudio-how-to-get-sound-on-only-one-speaker
-        # https://stackoverflow.com/questions/18721780/play-a-part-of-a-wav-file-in-python
-        ##########################
+            # The sampling rate is one of the master settings of the autosave
+            self.Session.mark_edited()
 
-        # Initialize output buffer where audio will be summed to
-        output_buffer = np.zeros( (samples_per_playback_buffer,2), dtype=np.float32)
+            # K-weighting and true peak filters depend on the sampling rate
+            self.LoudnessMeterTap.LoudnessMeter = LoudnessMeter(AudioConfig.sampling_rate, AudioConfig.number_of_output_channels)
+            self.LoudnessMeterTap.reset()
 
-        # TimeSlider's position in seconds
-        TimeSlider_sample = int(self.MiddleBar.TrackAxis.TimeSlider.value)
+        # Rebuild everything sized by the playback buffer or the sampling rate
+        self.init_playback_buffers()
+        self.TopBar.PEQPopup.PEQLayout.rebuild_audio_buffers()
+        self.ParallelMixer.reset_filter_state()
+        for track in self.TrackContainer.Tracks:
+            if track.PEQPopup:
+                track.PEQPopup.PEQLayout.rebuild_audio_buffers()
+        self.AdaptiveBufferSize.reset()
+
+        # Loads of the old settings were against other deadlines
+        self.DSPLoadMonitor.reset()
+
+        if stream_was_open:
+            self.open_audio_output_stream()
+
+    def scale_time_axis(self, ratio, *args, **kwargs):
+        # Scale values in samples of TimeAxisSlider and TimeSlider. Slider clamps its value when limits change, so the values are calculated first and set last.
+        TimeAxisSlider = self.MiddleBar.TrackScaleController.TimeAxisSlider
+        TimeSlider = self.MiddleBar.TrackAxis.TimeSlider
+        time_axis_value = TimeAxisSlider.value*ratio
+        time_slider_value = TimeSlider.value*ratio
+
+        # Limits are changed in an order where min <= max holds in between
+        if ratio > 1:
+            TimeAxisSlider.max *= ratio
+            TimeAxisSlider.min *= ratio
+        else:
+            TimeAxisSlider.min *= ratio
+            TimeAxisSlider.max *= ratio
+        TimeSlider.max *= ratio
 
-        # Move TimeSlider to the next buffer's position. Having this increment here, allows for multiple buffers to be processed simultaneously, since one thread doesn't have to be processed till the end while the next one has TimeSlider in the correct value.
-        self.MiddleBar.TrackAxis.TimeSlider.value += samples_per_playback_buffer
+        TimeAxisSlider.value = time_axis_value
+        TimeSlider.value = time_slider_value
 
-        # List of Tracks which will be played
-        tracks_to_be_played = []
+        # SoundClipField width depends on both TimeAxisSlider.value and TimeAxisSlider.max
+        self.TrackContainer.change_Track_width(TimeAxisSlider.value)
 
-        # List of Tracks which aren't played. These Tracks' level indicator will receive values below level indicator minimum
-        tracks_not_soloed = []
+    def adapt_playback_buffer(self, time_since_last_call, *args, **kwargs):
+        # Runs once per second on the GUI thread
+        if not audio_config.adaptive_buffer_size:
+            return
 
-        # Look if there are soloed tracks
-        for track in self.TrackContainer.Tracks:
-            if track.TrackControls.solo_bool:
-                tracks_to_be_played.append(track)
-            else:
-                tracks_not_soloed.append(track)
+        new_buffer_size = self.AdaptiveBufferSize.check(time_since_last_call)
+        if new_buffer_size:
+            audio_config.set(samples_per_playback_buffer=new_buffer_size)
 
-        # If there were no soloed Tracks, loop through all tracks
-        if len(tracks_to_be_played) == 0:
-            tracks_to_be_played = self.TrackContainer.Tracks
-            tracks_not_soloed = []
+    def update_LevelIndicators(self, time_since_last_call, *args, **kwargs):
+        # Runs at display rate on the GUI thread. MeterEngine applies ballistics to all levels at once and the results are set to the LevelIndicators.
+        self.MeterEngine.set_meter_count(len(self.TrackContainer.Tracks)+1) # All Tracks + 1 MasterVolume
+        levels_in_dB = self.MeterEngine.read_levels_in_dB(time_since_last_call)
 
+        # Row 0 is MasterVolume and the rest are Tracks in order
+        self.TopBar.MasterVolume.LevelIndicator.set_level(levels_in_dB[0])
+        for ind, track in enumerate(self.TrackContainer.Tracks[0:len(levels_in_dB)-1]):
+            track.TrackControls.VolumeSliderBox.LevelIndicator.set_level(levels_in_dB[ind+1])
 
-        # Go through tracks. If the track is not muted add (sum together) the audio buffer which corresponds to the TimeSlider's position.
-        for track in tracks_to_be_played:
+    def update_LoudnessReadout(self, *args, **kwargs):
+        # Show the latest measurements of LoudnessMeter in TopBar
+        self.TopBar.LoudnessReadout.show_results(self.LoudnessMeterTap.LoudnessMeter.get_results())
 
-            # If mute is on, move to the next Track and send zeros to LevelIndicator
-            if track.TrackControls.mute_bool:
-                track.TrackControls.VolumeSliderBox.LevelIndicator.calculate_level(float(0))
-                continue
+    def update_DSPLoadReadout(self, *args, **kwargs):
+        self.TopBar.DSPLoadReadout.show_summary(self.DSPLoadMonitor.get_summary())
 
-            for clip in track.SoundClips:
+    def write_DSP_load_file(self, *args, **kwargs):
+        # Dump DSP load measurements and ClipCache statistics next to the program, named by the current time
+        path = ".\\dsp_load_"+time.strftime("%Y%m%d_%H%M%S")+".json"
+        self.DSPLoadMonitor.write_json(path, {'clip_cache': self.ClipCache.get_statistics()})
+        print("DSP load written to "+path)
 
-                # Once the program crashed inside the first if due to: 'ValueError: operands could not be broadcast together with shapes (1024,) (517,) (1024,)'
-                # Couldn't replicate this bug but added try except to prevent crashing. While debugging this found out that the second and third elif were called 
-                # more than once which was unexpected. This might be explained by the prints used for debugging inside the if elif chain slowing donwn the program
-                # and multiple threads reaching this the same section before TimeSlider was incremented or something similar.
+    def mark_clip_gather(self, *args, **kwargs):
+        # Called by ParallelMixer from the audio thread when it has gathered the clips of a serially mixed buffer
+        self.DSPLoadMonitor.mark_stage(CLIP_GATHER)
 
-                # Level indicator has to use audio_buffer to get the individual Track levels. If not the latter Tracks get the levels of all Tracks combined.
-                audio_buffer = np.zeros( (samples_per_playback_buffer,1), dtype=np.float32)
+    def playback_audio_callback(self, frame_count, time_info, status):
+        # Time spent rendering is reported to AdaptiveBufferSize
+        callback_start_time = time.perf_counter()
 
-                try:
-                    # If TimeSlider is in between the SoundClip's start and end
-                    if TimeSlider_sample > clip.start_sample and TimeSlider_sample+samples_per_playback_buffer < clip.start_sample+clip.length_in_samples:
-                        # Read a buffer of audio from wav file which TimeSlider is on
-                        audio_buffer = self.wav_dict[clip.path][TimeSlider_sample-clip.start_sample : TimeSlider_sample+samples_per_playback_buffer-clip.start_sample]
+        # Status flags are counted for every buffer, also silent ones
+        self.DSPLoadMonitor.count_status(status)
 
-                    # If the wav starts in the middle of the buffer
-                    elif TimeSlider_sample < clip.start_sample and TimeSlider_sample+samples_per_playback_buffer >= clip.start_sample:
-                        # Read the start from wav
-                        audio_buffer = self.wav_dict[clip.path][0 : TimeSlider_sample+samples_per_playback_buffer-clip.start_sample]
-                        # Add zeros to the beginning
-                        audio_buffer = np.concatenate( (np.zeros(samples_per_playback_buffer-audio_buffer.size),audio_buffer), axis=0)
+        # Start or stop playback if the GUI has asked for it
+        transport_change = self.Transport.apply_command()
 
-                    # If the wav ends during this buffer 
-                    elif TimeSlider_sample < clip.start_sample+clip.length_in_samples and TimeSlider_sample+samples_per_playback_buffer > clip.start_sample+clip.length_in_samples:
-                        # Read the end of the buffer
-                        audio_buffer = self.wav_dict[clip.path][TimeSlider_sample-clip.start_sample : clip.length_in_samples]
-                        # Add zeros to the end
-                        audio_buffer = np.concatenate( (audio_buffer,np.zeros(samples_per_playback_buffer-audio_buffer.size)), axis=0)
+        # While stopped, the stream stays open and outputs silence. A stopping buffer is still rendered so it can be faded out.
+        if not self.Transport.playing and transport_change != 'stop':
+            self.AdaptiveBufferSize.report_buffer(frame_count, time.perf_counter()-callback_start_time, status)
+            return self.silent_output_buffer
 
-                except:
-                    print("Unmatching buffer sizes with, path: "+str(clip.path)+", TimeSlider_sample: "+str(TimeSlider_sample))
+        # Time the stages of rendering a buffer
+        self.DSPLoadMonitor.begin_callback()
 
-                # Apply Track's volume to output_buffer
-                audio_buffer *= track.TrackControls.VolumeSliderBox.VolumeSlider.linear_gain_factor
+        # A new playback shouldn't start with the filter tail of the previous one
+        if transport_change == 'start':
+            self.TopBar.PEQPopup.PEQLayout.reset_filter_state()
+            self.ParallelMixer.reset_filter_state()
 
-                # Change level indicator level. Levels are calculated from the current audio_buffer's highest absolute value.
-                track.TrackControls.VolumeSliderBox.LevelIndicator.calculate_level(float(np.amax(np.absolute(audio_buffer))))
+        # Initialize output buffer where audio will be summed to
+        output_buffer = np.zeros( (frame_count,2), dtype=np.float32)
 
-                # Calculate left and right channel gains according to the panning slider
-                right_channel_gain = track.TrackControls.TrackPanSlider.value # The more right the slider is the higher the Slider values are
-                left_channel_gain = float(1)-right_channel_gain
+        # Advance Transport by one buffer. buffer_start_sample is the first sample of this buffer. TimeSlider isn't touched here, it follows Transport on the GUI thread.
+        buffer_start_sample = self.Transport.advance(frame_count, time_info)
 
-                # Sum the read samples to the output buffer and apply channel gains. For some reason 'audio_buffer' has shape '(samples_per_playback_buffer,)' rather than '(samples_per_playback_buffer,1)' on at least the second iteration, which has to be fixed by using '.reshape(samples_per_playback_buffer,1)'.
-                output_buffer += np.concatenate((left_channel_gain*audio_buffer.reshape(samples_per_playback_buffer,1), right_channel_gain*audio_buffer.reshape(samples_per_playback_buffer,1)), axis=1)
+        # Read the session once. The GUI thread publishes a new snapshot on every change, so this one stays the same for the whole buffer.
+        snapshot = self.Session.snapshot
+
+        # ClipCache prefetches the clips ahead of the playhead in its own thread
+        self.ClipCache.set_playhead(buffer_start_sample, snapshot)
+
+        # Each Track's clips are summed to its own row. Rows of Tracks which aren't played stay silent, which lets their LevelIndicators fall to silence.
+        track_buffers = np.zeros( (len(snapshot.track_clips),frame_count), dtype=np.float32)
+
+        # Read each Track's render or sum the audio of its SoundClips which overlap this buffer, filter Tracks with an EQ, apply Track volumes and pan all Tracks to output_buffer. Buffers with
+        # enough work are mixed by several threads, each gathering and mixing a part of the Tracks, so their clip gathering is timed as a part of mixing.
+        self.ParallelMixer.mix(track_buffers, snapshot.track_clips, snapshot.track_gains, snapshot.track_pans, buffer_start_sample, output_buffer, snapshot.track_eqs, snapshot.track_renders,
+                               self.mark_clip_gather)
 
         # Apply output volume/gain to output_buffer
-        output_buffer *= self.TopBar.MasterVolume.VolumeSlider.linear_gain_factor
+        output_buffer *= snapshot.master_gain
+
+        self.DSPLoadMonitor.mark_stage(MIXING)
 
         # Apply Parametric Equalizer (PEQ) filters
         output_buffer[:,0] = self.TopBar.PEQPopup.PEQLayout.filter_audio(output_buffer[:,0], 0)
         output_buffer[:,1] = self.TopBar.PEQPopup.PEQLayout.filter_audio(output_buffer[:,1], 1)
+        self.DSPLoadMonitor.mark_stage(PEQ_FILTERING)
+
+        # Fade in when starting and fade out when stopping instead of a hard cut
+        if transport_change == 'start':
+            output_buffer *= self.fade_in_gains
+        elif transport_change == 'stop':
+            output_buffer *= self.fade_out_gains
+        self.DSPLoadMonitor.mark_stage(MIXING)
 
         # Plot mono output signal fft in PEQPopup
         self.TopBar.PEQPopup.PEQLayout.realtime_input_fft(np.add(output_buffer[:,0],output_buffer[:,1]))
+        self.DSPLoadMonitor.mark_stage(ANALYZER)
+
+        # Store Track and output levels. LevelIndicators are updated from these by self.update_LevelIndicators on the GUI thread.
+        self.MeterEngine.write_levels(track_buffers, output_buffer)
 
-        # Change output level indicator level. Levels are calculated from the current output_buffer's highest absolute value.
-        self.TopBar.MasterVolume.LevelIndicator.calculate_level(float(np.amax(np.absolute(output_buffer))))
+        # Hand the output to the loudness meter's thread. output_buffer isn't modified after this.
+        self.LoudnessMeterTap.push(output_buffer)
+        self.DSPLoadMonitor.mark_stage(METERING)
+        self.DSPLoadMonitor.end_callback(frame_count, audio_config.sampling_rate)
 
-        # Send value below level indicator minimum to the rest of Tracks which aren't soloed. HOX can't send float(0) to level indicator
-        # because it will result in -inf dB which will cause the level indicator to stay at -inf. 
-        level_indicator_minimum = self.TrackContainer.Tracks[0].TrackControls.VolumeSliderBox.LevelIndicator.min # All LevelIndicators have the same minimum
-        for non_soloed_track in tracks_not_soloed:
-            non_soloed_track.TrackControls.VolumeSliderBox.LevelIndicator.calculate_level(level_indicator_minimum-1)
+        self.AdaptiveBufferSize.report_buffer(frame_count, time.perf_counter()-callback_start_time, status)
 
-        # Return output_buffer as bytes and continue streaming. End check is done in self.playback_end_check.
-        return (output_buffer.tobytes(), pyaudio.paContinue)
+        # Return output_buffer to the backend, which keeps streaming. End check is done in self.follow_Transport.
+        return output_buffer
 
-    def playback_end_check(self, *args, **kwargs):
-        # Don't know if playback callback method 'playback_audio_callback' should be stopped by returning 'pyaudio.paComplete' rather than this function.
-        # There were no examples how to 'stop_stream()' or 'close()' after 'paComplete' would have been returned which is problematic since the callback 
-        # is called on a separate thread. This seems to work for now, but I don't know if this will scale for larger audio files.
+    def follow_Transport(self, *args, **kwargs):
+        # Move TimeSlider to the sample which is heard now
+        TimeSlider = self.MiddleBar.TrackAxis.TimeSlider
+        self.TimeSlider_value_from_Transport = min(self.Transport.audible_position(), TimeSlider.max)
+        TimeSlider.value = self.TimeSlider_value_from_Transport
 
-        # Check if TimeSlider has reached/surpassed its maximum value, playback is stopped
-        if self.MiddleBar.TrackAxis.TimeSlider.value >= self.MiddleBar.TrackAxis.TimeSlider.max:
-            self.MiddleBar.TrackAxis.TimeSlider.value = self.MiddleBar.TrackAxis.TimeSlider.max
+        # Check if TimeSlider has reached its maximum value, playback is stopped
+        if TimeSlider.value >= TimeSlider.max:
             self.init_playback()
 
+    def locate_Transport(self, TimeSlider, value, *args, **kwargs):
+        # Values set by follow_Transport are Transport's own position. Any other value comes from the user moving TimeSlider, scrolling or typing to TimeTable.
+        if value != self.TimeSlider_value_from_Transport:
+            self.Transport.locate(value)
+            self.ClipCache.set_playhead(value, self.Session.snapshot)
+
     def destructor(self, *args, **kwargs):
-        # Terminate the PyAudio instance
-        self.PyAudio.terminate()
+        # Stop and close the output stream which has been open since start up
+        if self.audio_output_stream:
+            self.audio_output_stream.stop_stream()
+            self.audio_output_stream.close()
+
+        # Release the audio device
+        self.AudioBackend.terminate()
+
+        # Stop the loudness meter's, the mixer's, the render cache's, the clip cache's and the waveform tile cache's threads. The render files are removed.
+        self.LoudnessMeterTap.stop()
+        self.ParallelMixer.stop()
+        self.TrackRenderCache.stop()
+        self.ClipCache.stop()
+        self.WaveformTileCache.stop()
+
+        # An unfinished export removes its files
+        if self.Export:
+            self.Export.cancel()
+            self.Export.thread.join()
 
-        # Delete and free memory from wav_dict
-        del self.wav_dict
+        # Write the latest edits and stop the autosave thread
+        self.autosave()
+        self.SessionJournal.stop()
         gc.collect()
 
 